@@ -91,7 +91,6 @@ pkgs.mkShell {
     nodejs
     python.pkgs.poetry
     python.pkgs.pypiserver
-    rsync
     spark
   ];
   shellHook = ''
@@ -0,0 +1,77 @@
+'''
+Find the Elm projects to document in one go, and give each of them
+a package name under which it's listed in the generated site.
+'''
+from typing import Dict, Iterable, List
+from pathlib import Path
+import json
+import os
+import re
+
+from elm_doc.elm_project import ElmPackage, STUFF_DIRECTORY
+
+
+# directories that never contain projects of their own
+SKIPPED_DIRECTORIES = {STUFF_DIRECTORY, 'node_modules'}
+# projects that configure a tool rather than being documentable, like the review/
+# directory that elm-review creates; they are only documented if listed explicitly
+TOOL_DIRECTORIES = {'review'}
+TOOL_PACKAGES = {'jfmengels/elm-review'}
+
+
+def discover_projects(root: Path, skip: Iterable[Path] = ()) -> List[Path]:
+    '''Directories under root that have an elm.json, except for those inside
+    `skip`, e.g. the output directory, which has the elm.json of every package,
+    and configurations of tools like elm-review.'''
+    skip = {os.path.normpath(str(path)) for path in skip}
+    projects = []
+    for dirpath, dirnames, filenames in os.walk(str(root)):
+        dirnames[:] = sorted(
+            name for name in dirnames
+            if name not in SKIPPED_DIRECTORIES and not name.startswith('.')
+            and os.path.normpath(os.path.join(dirpath, name)) not in skip)
+        if ElmPackage.DESCRIPTION_FILENAME in filenames and not _is_tool_project(Path(dirpath)):
+            projects.append(Path(dirpath))
+    return projects
+
+
+def _is_tool_project(path: Path) -> bool:
+    # e.g. review/ next to the elm.json of the project it reviews
+    if path.name in TOOL_DIRECTORIES and (path.parent / ElmPackage.DESCRIPTION_FILENAME).is_file():
+        return True
+    try:
+        with open(str(path / ElmPackage.DESCRIPTION_FILENAME)) as f:
+            dependencies = json.load(f).get('dependencies', {})
+    except (OSError, ValueError, AttributeError):
+        # let the build report what's wrong with it
+        return False
+    direct = dependencies.get('direct', dependencies) if isinstance(dependencies, dict) else {}
+    return bool(TOOL_PACKAGES.intersection(direct))
+
+
+def project_names(paths: List[Path]) -> Dict[Path, str]:
+    '''A valid, unique package project name for each project path: the name of its
+    directory, or its path relative to the common parent if that's ambiguous.'''
+    names = {path: _package_project_name(path.name) for path in paths}
+    if len(set(names.values())) < len(paths):
+        common = Path(os.path.commonpath([str(path) for path in paths]))
+        # the common parent itself can be a project too
+        common = common.parent if common in paths else common
+        names = {path: _package_project_name('-'.join(path.relative_to(common).parts))
+                 for path in paths}
+    # names can still clash after normalization, e.g. foo_bar and foo-bar
+    seen = set()
+    for path in paths:
+        name, suffix = names[path], 2
+        while names[path] in seen:
+            names[path] = '{}-{}'.format(name, suffix)
+            suffix += 1
+        seen.add(names[path])
+    return names
+
+
+def _package_project_name(name: str) -> str:
+    name = re.sub(r'[^a-z0-9]+', '-', name.lower()).strip('-')
+    if not name[:1].isalpha():
+        name = 'project-' + name if name else 'project'
+    return name
@@ -1,20 +1,25 @@
+from typing import Optional
 import sys
 import os
 import os.path
 import shutil
-import subprocess
 from pathlib import Path
 import functools
-import re
 
 import click
 from doit.doit_cmd import DoitMain
 from doit.cmd_base import ModuleTaskLoader
 from doit.runner import ERROR
 
-from elm_doc.run_config import Build, Validate
-from elm_doc.loader import make_task_loader
+from elm_doc.run_config import RunConfig, Build, Validate
+from elm_doc.loader import make_task_loader, make_batch_task_loader, make_elm_home_task_loader
+from elm_doc import batch as batch_module
 from elm_doc import elm_project
+from elm_doc import registry
+from elm_doc import registry_backends
+from elm_doc import source_mirror
+from elm_doc import watch as watch_module
+from elm_doc import serve as serve_module
 
 
 class DoitException(click.ClickException):
@@ -50,20 +55,76 @@ def validate_project_path(ctx, param, value):
     return value
 
 
-REQUIRED_RSYNC_VERSION = (2, 6, 7)
-
-
-def check_rsync_version() -> bool:
-    output = subprocess.check_output(['rsync', '--version'], universal_newlines=True)
-    first_line = output.splitlines()[0]
-    match = re.search(r'version (?P<major>\d)\.(?P<minor>\d)\.(?P<patch>\d)', first_line)
-    if not match:
-        raise click.Abort(
-            'could not extract the version of rsync from: {}'.format(first_line))
-    version = (int(match.group('major')),
-               int(match.group('minor')),
-               int(match.group('patch')))
-    return version >= REQUIRED_RSYNC_VERSION
+def registry_options(f):
+    '''Options for how to reach the package registry, shared by main and batch.'''
+    options = [
+        click.option('--http-concurrency',
+                     metavar='N',
+                     type=click.IntRange(min=1),
+                     default=registry.DEFAULT_CONCURRENCY,
+                     help=('number of requests to make to the package registry at the same time. '
+                           'default: {}'.format(registry.DEFAULT_CONCURRENCY))),
+        click.option('--registry-ttl',
+                     metavar='seconds',
+                     type=click.IntRange(min=0),
+                     default=registry.DEFAULT_TTL,
+                     help=('how long to trust cached package release lists before asking the '
+                           'package registry again. default: {}'.format(registry.DEFAULT_TTL))),
+        click.option('--offline/--no-offline',
+                     default=False,
+                     help=('never contact the package registry. popular packages are only added if '
+                           'the compiler has downloaded them, and releases without a cached '
+                           'timestamp get a fixed one')),
+        click.option('--registry', 'registry_url',
+                     metavar='URL or dir',
+                     help=('package registry to use instead of {}: an http(s) or file URL, or a '
+                           'directory laid out like the registry'.format(registry_backends.DEFAULT_REGISTRY_URL))),
+        click.option('--record-registry',
+                     metavar='path/to/cassette.json',
+                     type=click.Path(dir_okay=False),
+                     help='save the responses of the package registry to a file for --replay-registry'),
+        click.option('--replay-registry',
+                     metavar='path/to/cassette.json',
+                     type=click.Path(exists=True, dir_okay=False),
+                     help='answer package registry requests only from a file saved by --record-registry'),
+        click.option('--registry-timeout',
+                     metavar='seconds',
+                     type=click.FloatRange(min=0.1),
+                     default=registry_backends.DEFAULT_TIMEOUT,
+                     help=('how long to wait for each response of the package registry. '
+                           'default: {}'.format(registry_backends.DEFAULT_TIMEOUT))),
+        click.option('--registry-retries',
+                     metavar='N',
+                     type=click.IntRange(min=0),
+                     default=registry_backends.DEFAULT_RETRIES,
+                     help=('number of failed package registry requests to retry, in total for the whole '
+                           'build. default: {}'.format(registry_backends.DEFAULT_RETRIES))),
+        click.option('--registry-failures',
+                     metavar='N',
+                     type=click.IntRange(min=1),
+                     default=registry_backends.DEFAULT_FAILURE_THRESHOLD,
+                     help=('after this many failed package registry requests in a row, stop asking and '
+                           'use cached or fallback data instead. '
+                           'default: {}'.format(registry_backends.DEFAULT_FAILURE_THRESHOLD))),
+    ]
+    for option in reversed(options):
+        f = option(f)
+    return f
+
+
+def _registry_run_config_options(registry_url, record_registry, replay_registry,
+                                 registry_timeout, registry_retries, registry_failures):
+    if record_registry and replay_registry:
+        raise click.BadParameter('--record-registry and --replay-registry are mutually exclusive')
+    cassette = record_registry or replay_registry
+    return dict(
+        registry_url=registry_url,
+        registry_cassette=_resolve_path(cassette) if cassette else None,
+        cassette_mode='record' if record_registry else 'replay',
+        registry_timeout=registry_timeout,
+        registry_retries=registry_retries,
+        registry_failures=registry_failures,
+    )
 
 
 def _resolve_path(path: str) -> Path:
@@ -99,11 +160,46 @@ class LazyOutfile:
               metavar='dir',
               help=('temporary build directory. source files will be copied here. '
                     'default: <project_path>/.elm-doc/'))
+@click.option('--cache-dir',
+              metavar='dir',
+              help=('directory to cache generated docs.json files in, keyed by the content '
+                    'of the sources, the dependencies and the Elm version. '
+                    'useful for sharing results across CI runs. also holds the package registry '
+                    'cache. default: disabled, with the registry cache in $XDG_CACHE_HOME/elm-doc'))
+@click.option('--staging',
+              type=click.Choice(source_mirror.STAGING_MODES),
+              default=source_mirror.COPY,
+              help=('how to put source files in the build directory. symlink and hardlink '
+                    'avoid copying modules that are not port modules. default: copy'))
 @click.option('--elm-path',
               metavar='path/to/elm',
               default='elm',
               callback=validate_elm_path,
               help=('specify which elm binary to use'))
+@click.option('--shards',
+              metavar='N',
+              type=click.IntRange(min=1),
+              default=1,
+              help=('split the project into N groups of modules and run the Elm compiler '
+                    'on them in parallel. default: 1, which disables sharding'))
+@click.option('--jobs', '-j',
+              metavar='N',
+              type=click.IntRange(min=1),
+              default=1,
+              help='number of processes to use for rewriting port modules. default: 1')
+@registry_options
+@click.option('--only-imported-dependencies/--all-dependencies',
+              default=False,
+              help=('only generate docs for the dependencies that a module of the project imports, '
+                    'and skip the popular packages that are otherwise added. default: all dependencies'))
+@click.option('--batch-page-tasks/--task-per-page',
+              default=False,
+              help=('write all pages of a package in one task, which makes checking what to rebuild faster '
+                    'for dependencies with many modules. default: a task per page'))
+@click.option('--spa-fallback/--page-files',
+              default=False,
+              help=('only write the root page, with nginx, Apache and _redirects configs '
+                    'for serving it for every other page. default: a file per page'))
 @click.option('--mount-at',
               metavar='/path',
               default='',
@@ -143,6 +239,9 @@ class LazyOutfile:
 @click.option('--validate/--no-validate',
               default=False,
               help='validate all doc comments are in place without generating docs')
+@click.option('--watch/--no-watch',
+              default=False,
+              help='keep running and rebuild whenever a source file or elm.json changes')
 @click.option('--doit-args',
               help='options to pass to doit.doit_cmd.DoitMain.run')
 @click.argument('project_path',
@@ -153,7 +252,23 @@ class LazyOutfile:
 def main(
         output,
         build_dir,
+        cache_dir,
+        staging,
         elm_path,
+        shards,
+        jobs,
+        http_concurrency,
+        registry_ttl,
+        offline,
+        registry_url,
+        record_registry,
+        replay_registry,
+        registry_timeout,
+        registry_retries,
+        registry_failures,
+        only_imported_dependencies,
+        batch_page_tasks,
+        spa_fallback,
         mount_at,
         exclude_modules,
         exclude_source_directories,
@@ -164,18 +279,12 @@ def main(
         fake_summary,
         fake_license,
         validate,
+        watch,
         doit_args,
         project_path,
         include_paths):
     """Generate static documentation for your Elm project"""
 
-    if not shutil.which('rsync'):
-        raise click.UsageError('this program requires rsync')
-
-    if not check_rsync_version():
-        raise click.UsageError('this program requires rsync version {} or greater'
-                               .format('.'.join(REQUIRED_RSYNC_VERSION)))
-
     if not validate and output is None:
         raise click.BadParameter('please specify --output directory')
 
@@ -194,10 +303,22 @@ def main(
         fake_license=fake_license,
     )
 
+    cache_path = _resolve_path(cache_dir) if cache_dir is not None else None
+    backend_options = _registry_run_config_options(
+        registry_url, record_registry, replay_registry, registry_timeout, registry_retries, registry_failures)
     if validate:
         run_config = Validate(
             elm_path=elm_path,
             build_path=_resolve_path(build_dir) if build_dir is not None else None,
+            cache_path=cache_path,
+            shards=shards,
+            staging=staging,
+            only_imported_dependencies=only_imported_dependencies,
+            jobs=jobs,
+            http_concurrency=http_concurrency,
+            registry_ttl=registry_ttl,
+            offline=offline,
+            **backend_options,
         )
     else:
         run_config = Build(
@@ -205,17 +326,386 @@ def main(
             build_path=_resolve_path(build_dir) if build_dir is not None else None,
             output_path=_resolve_path(output) if output is not None else None,
             mount_point=mount_at,
+            cache_path=cache_path,
+            shards=shards,
+            staging=staging,
+            only_imported_dependencies=only_imported_dependencies,
+            batch_page_tasks=batch_page_tasks,
+            spa_fallback=spa_fallback,
+            jobs=jobs,
+            http_concurrency=http_concurrency,
+            registry_ttl=registry_ttl,
+            offline=offline,
+            **backend_options,
         )
 
+    if watch:
+        _watch_and_rebuild(Path(project_path), project_config, run_config, doit_args)
+        return
+
     task_loader = make_task_loader(
         elm_project.from_path(Path(project_path)), project_config, run_config)
+    result = _run_doit(task_loader, doit_args)
+    if result is not None and result > 0:
+        raise DoitException('see output above', result)
+
 
+def _run_doit(task_loader, doit_args: Optional[str]) -> Optional[int]:
     extra_config = {'GLOBAL': {'outfile': LazyOutfile()}}
-    result = DoitMain(ModuleTaskLoader(task_loader), extra_config=extra_config).run(
+    return DoitMain(ModuleTaskLoader(task_loader), extra_config=extra_config).run(
         doit_args.split(' ') if doit_args else [])
+
+
+def _watch_and_rebuild(
+        project_path: Path,
+        project_config: elm_project.ProjectConfig,
+        run_config: RunConfig,
+        doit_args: Optional[str]):
+    '''Build once, then rebuild on every change until interrupted. The task loader,
+    and with it the HTTP session and everything resolved while loading it, is
+    kept across rebuilds unless elm.json itself changes. If elm.json can't be
+    loaded, e.g. while it's half edited, that's reported and rebuilding resumes
+    once it can be.'''
+    project = elm_project.from_path(project_path)
+    task_loader = make_task_loader(project, project_config, run_config)
+    _run_doit(task_loader, doit_args)
+    watcher = watch_module.make_watcher(project)
+    click.echo('watching for changes, press Ctrl-C to stop')
+    try:
+        for changed in watch_module.iter_changes(watcher):
+            reload = task_loader is None or project.json_path in changed
+            if reload:
+                try:
+                    project = elm_project.from_path(project_path)
+                    task_loader = make_task_loader(project, project_config, run_config)
+                except Exception as e:
+                    click.echo('could not load {}, waiting for it to be fixed: {}'.format(
+                        project.json_path, e), err=True)
+                    task_loader = None
+                    continue
+                watcher.close()
+                watcher = watch_module.make_watcher(project)
+            click.echo('{} file(s) changed, rebuilding'.format(len(changed)))
+            if reload:
+                _run_doit(task_loader, doit_args)
+            else:
+                _run_doit(_affected_by_modules(task_loader, run_config, doit_args), doit_args)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
+def _affected_by_modules(task_loader, run_config: RunConfig, doit_args: Optional[str]):
+    '''The part of the task loader that a change to modules, not elm.json, can
+    make out of date: the tasks of the project itself. The dependencies and
+    assets only depend on elm.json, unless only the imported dependencies are
+    documented, or unless doit was asked for particular tasks.'''
+    if doit_args or (isinstance(run_config, Build) and run_config.only_imported_dependencies):
+        return task_loader
+    return {'task_main_project': task_loader['task_main_project']}
+
+
+@click.command(context_settings=dict(
+    help_option_names=['-h', '--help'],
+))
+@click.option('--mount-at',
+              metavar='/path',
+              default='',
+              callback=validate_mount_at,
+              help='url path at which the docs were built to be served. e.g. /docs')
+@click.option('--bind', '-b',
+              metavar='address',
+              default='127.0.0.1',
+              help='address to listen on. default: 127.0.0.1')
+@click.option('--port', '-p',
+              type=int,
+              default=8000,
+              help='port to listen on. default: 8000')
+@click.argument('output_path',
+                type=click.Path(exists=True, file_okay=False, resolve_path=True))
+@_translate_click_exception_exit_code
+def serve(mount_at, bind, port, output_path):
+    """Preview documentation generated by elm-doc"""
+    server = serve_module.make_server(Path(output_path), mount_point=mount_at, host=bind, port=port)
+    click.echo('serving {} at http://{}:{}{}/'.format(output_path, bind, server.server_port, mount_at))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+@click.command(context_settings=dict(
+    help_option_names=['-h', '--help'],
+))
+@click.option('--output', '-o',
+              metavar='dir')
+@click.option('--build-dir',
+              metavar='dir',
+              help=('temporary build directory. each project is built in a subdirectory of it '
+                    'named after the project. default: <project_path>/.elm-doc/'))
+@click.option('--cache-dir',
+              metavar='dir',
+              help='directory to cache generated docs.json files in. default: disabled')
+@click.option('--staging',
+              type=click.Choice(source_mirror.STAGING_MODES),
+              default=source_mirror.COPY,
+              help='how to put source files in the build directory. default: copy')
+@click.option('--elm-path',
+              metavar='path/to/elm',
+              default='elm',
+              callback=validate_elm_path,
+              help=('specify which elm binary to use'))
+@click.option('--parallel',
+              metavar='N',
+              type=click.IntRange(min=1),
+              default=os.cpu_count() or 1,
+              help='number of projects to build at the same time. default: number of CPUs')
+@click.option('--jobs', '-j',
+              metavar='N',
+              type=click.IntRange(min=1),
+              default=1,
+              help='number of processes to use for rewriting port modules. default: 1')
+@registry_options
+@click.option('--only-imported-dependencies/--all-dependencies',
+              default=False,
+              help=('only generate docs for the dependencies that a module of the project imports, '
+                    'and skip the popular packages that are otherwise added. default: all dependencies'))
+@click.option('--batch-page-tasks/--task-per-page',
+              default=False,
+              help=('write all pages of a package in one task, which makes checking what to rebuild faster '
+                    'for dependencies with many modules. default: a task per page'))
+@click.option('--spa-fallback/--page-files',
+              default=False,
+              help=('only write the root page, with nginx, Apache and _redirects configs '
+                    'for serving it for every other page. default: a file per page'))
+@click.option('--mount-at',
+              metavar='/path',
+              default='',
+              callback=validate_mount_at,
+              help='url path at which the docs will be served. e.g. /docs')
+@click.option('--discover',
+              metavar='dir',
+              type=click.Path(exists=True, file_okay=False, resolve_path=True),
+              help='document every project with an elm.json under this directory')
+@click.option('--fake-user',
+              metavar='GitHub user name',
+              default='user',
+              help='User name to use as part of the package names of the projects')
+@click.option('--fake-version',
+              metavar='Semver version string',
+              default='1.0.0',
+              help='Version of the projects as listed in the generated docs')
+@click.option('--fake-license',
+              metavar='OSI-approved SPDX liense',
+              required=True,
+              help='License of the projects to tell the Elm compiler when generating docs')
+@click.option('--validate/--no-validate',
+              default=False,
+              help='validate all doc comments are in place without generating docs')
+@click.option('--doit-args',
+              help='options to pass to doit.doit_cmd.DoitMain.run')
+@click.argument('project_paths',
+                nargs=-1,
+                type=click.Path(exists=True, file_okay=False, resolve_path=True))
+@_translate_click_exception_exit_code
+def batch(
+        output,
+        build_dir,
+        cache_dir,
+        staging,
+        elm_path,
+        parallel,
+        jobs,
+        http_concurrency,
+        registry_ttl,
+        offline,
+        registry_url,
+        record_registry,
+        replay_registry,
+        registry_timeout,
+        registry_retries,
+        registry_failures,
+        only_imported_dependencies,
+        batch_page_tasks,
+        spa_fallback,
+        mount_at,
+        discover,
+        fake_user,
+        fake_version,
+        fake_license,
+        validate,
+        doit_args,
+        project_paths):
+    """Generate static documentation for several Elm projects as one site
+
+    Each project is listed under a package named after its directory.
+    """
+    if not validate and output is None:
+        raise click.BadParameter('please specify --output directory')
+
+    output_path = _resolve_path(output) if output is not None else None
+    build_path = _resolve_path(build_dir) if build_dir is not None else None
+    paths = [Path(path) for path in project_paths]
+    if discover:
+        skip = [path for path in [output_path, build_path] if path is not None]
+        paths.extend(path for path in batch_module.discover_projects(Path(discover), skip=skip)
+                     if path not in paths)
+    if not paths:
+        raise click.BadParameter('please specify project paths or --discover')
+
+    backend_options = _registry_run_config_options(
+        registry_url, record_registry, replay_registry, registry_timeout, registry_retries, registry_failures)
+    projects = []
+    for path, name in batch_module.project_names(paths).items():
+        project_config = elm_project.ProjectConfig(
+            fake_user=fake_user,
+            fake_project=name,
+            fake_version=fake_version,
+            fake_license=fake_license,
+        )
+        run_config_options = dict(
+            elm_path=elm_path,
+            build_path=build_path / name if build_path is not None else None,
+            cache_path=_resolve_path(cache_dir) if cache_dir is not None else None,
+            staging=staging,
+            only_imported_dependencies=only_imported_dependencies,
+            batch_page_tasks=batch_page_tasks,
+            spa_fallback=spa_fallback,
+            jobs=jobs,
+            http_concurrency=http_concurrency,
+            registry_ttl=registry_ttl,
+            offline=offline,
+            **backend_options,
+        )
+        if validate:
+            run_config = Validate(**run_config_options)
+        else:
+            run_config = Build(output_path=output_path, mount_point=mount_at, **run_config_options)
+        projects.append((elm_project.from_path(path), project_config, run_config))
+
+    # the compiler runs in a process of its own, so a thread per project is enough
+    parallel_args = '-n {} -P thread'.format(parallel) if parallel > 1 else ''
+    result = _run_doit(make_batch_task_loader(projects),
+                       ' '.join(arg for arg in [parallel_args, doit_args] if arg))
+    if result is not None and result > 0:
+        raise DoitException('see output above', result)
+
+
+@click.command(context_settings=dict(
+    help_option_names=['-h', '--help'],
+))
+@click.option('--output', '-o',
+              metavar='dir',
+              required=True)
+@click.option('--elm-version',
+              metavar='0.19.1',
+              default='0.19.1',
+              help='which compiler version\'s packages to document. default: 0.19.1')
+@click.option('--cache-dir',
+              metavar='dir',
+              help=('directory to keep a shared copy of package files in, linked into the output. '
+                    'default: disabled, with the registry cache in $XDG_CACHE_HOME/elm-doc'))
+@click.option('--parallel',
+              metavar='N',
+              type=click.IntRange(min=1),
+              default=os.cpu_count() or 1,
+              help='number of package versions to write at the same time. default: number of CPUs')
+@registry_options
+@click.option('--spa-fallback/--page-files',
+              default=False,
+              help=('only write the root page, with nginx, Apache and _redirects configs '
+                    'for serving it for every other page. default: a file per page'))
+@click.option('--mount-at',
+              metavar='/path',
+              default='',
+              callback=validate_mount_at,
+              help='url path at which the docs will be served. e.g. /docs')
+@click.option('--doit-args',
+              help='options to pass to doit.doit_cmd.DoitMain.run')
+@_translate_click_exception_exit_code
+def elm_home(
+        output,
+        elm_version,
+        cache_dir,
+        parallel,
+        http_concurrency,
+        registry_ttl,
+        offline,
+        registry_url,
+        record_registry,
+        replay_registry,
+        registry_timeout,
+        registry_retries,
+        registry_failures,
+        spa_fallback,
+        mount_at,
+        doit_args):
+    """Generate a documentation site for every package in ELM_HOME
+
+    Only package versions that the compiler has generated docs.json for are
+    included. Running it again only writes the versions that are new since.
+    """
+    backend_options = _registry_run_config_options(
+        registry_url, record_registry, replay_registry, registry_timeout, registry_retries, registry_failures)
+    run_config = Build(
+        elm_path=None,
+        build_path=None,
+        output_path=_resolve_path(output),
+        mount_point=mount_at,
+        cache_path=_resolve_path(cache_dir) if cache_dir is not None else None,
+        http_concurrency=http_concurrency,
+        registry_ttl=registry_ttl,
+        offline=offline,
+        spa_fallback=spa_fallback,
+        **backend_options,
+    )
+    parallel_args = '-n {} -P thread'.format(parallel) if parallel > 1 else ''
+    result = _run_doit(make_elm_home_task_loader(elm_version, run_config),
+                       ' '.join(arg for arg in [parallel_args, doit_args] if arg))
     if result is not None and result > 0:
         raise DoitException('see output above', result)
 
 
+class DefaultCommandGroup(click.Group):
+    '''A group that runs its default command when the first argument isn't
+    the name of another command, so that `elm-doc path/to/project` keeps
+    working. A project directory that has the name of a command can be
+    given as `elm-doc build serve` or `elm-doc ./serve`.'''
+
+    def __init__(self, *args, default_command: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.default_command = default_command
+
+    def parse_args(self, ctx, args):
+        if not (args and (args[0] in self.commands or args[0] in ctx.help_option_names)):
+            args = [self.default_command] + list(args)
+        return super().parse_args(ctx, args)
+
+
+@click.group(cls=DefaultCommandGroup, default_command='build', context_settings=dict(
+    help_option_names=['-h', '--help'],
+))
+def cli():
+    """Generate static documentation for Elm projects
+
+    Without a command, runs `build`: see `elm-doc build --help`.
+    """
+    pass
+
+
+cli.add_command(main, 'build')
+cli.add_command(serve, 'serve')
+cli.add_command(batch, 'batch')
+cli.add_command(elm_home, 'elm-home')
+
+
+def run():
+    '''Entry point of the elm-doc script.'''
+    cli(prog_name='elm-doc')
+
+
 if __name__ == '__main__':
-    main()
+    run()
@@ -0,0 +1,96 @@
+'''
+A content-addressed cache of docs.json files generated by the Elm compiler.
+
+The key covers everything that can affect the output of `elm make --docs`
+for the fake package in the build directory: the port-stripped sources,
+the generated elm.json, the resolved dependency versions of the project
+and the version of the compiler. A cache hit lets us skip the compiler
+entirely, which matters on CI runners where doit's state DB is always cold.
+'''
+from typing import Dict, Optional
+from pathlib import Path
+import functools
+import hashlib
+import json
+import subprocess
+
+import attr
+
+from elm_doc.elm_project import ElmProject, ElmPackage
+from elm_doc.utils import copy_atomically, write_atomically
+
+
+# bump this when the way keys are computed changes
+KEY_VERSION = '1'
+
+
+@attr.s
+class DocsCache:
+    path = attr.ib()  # Path
+
+    def entry_path(self, key: str) -> Path:
+        return self.path / key[:2] / '{}.json'.format(key)
+
+    def restore(self, key: str, output_path: Path) -> bool:
+        entry = self.entry_path(key)
+        if not entry.is_file():
+            return False
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        # written rather than copied, so that the output gets the default file mode
+        # whatever mode the entry has, e.g. owner-only when an earlier version stored it
+        write_atomically(output_path, entry.read_bytes())
+        return True
+
+    def store(self, key: str, docs_path: Path) -> None:
+        entry = self.entry_path(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        copy_atomically(docs_path, entry)
+
+
+def compute_key(project: ElmProject, build_path: Path, elm_version: str) -> str:
+    digest = hashlib.sha256()
+    _update(digest, KEY_VERSION.encode('utf8'))
+    _update(digest, elm_version.encode('utf8'))
+    _update(digest, json.dumps(resolved_dependencies(project), sort_keys=True).encode('utf8'))
+    _update(digest, (build_path / ElmPackage.DESCRIPTION_FILENAME).read_bytes())
+    src_dir = build_path / 'src'
+    for elm_file in sorted(src_dir.glob('**/*.elm')):
+        _update(digest, str(elm_file.relative_to(src_dir)).encode('utf8'))
+        _update(digest, elm_file.read_bytes())
+    return digest.hexdigest()
+
+
+def dependencies_installed(build_path: Path, packages_dir: Path) -> bool:
+    '''Whether the compiler has generated docs.json in ELM_HOME for every dependency
+    of the fake package in build_path. Only `elm make` downloads them and generates
+    their docs, and the dependency docs are copied from there, so a docs.json from
+    the cache is no good on its own when ELM_HOME is empty, like on a fresh CI runner.'''
+    with open(str(build_path / ElmPackage.DESCRIPTION_FILENAME)) as f:
+        description = json.load(f)
+    for field in ['dependencies', 'test-dependencies']:
+        for name, version_range in description.get(field, {}).items():
+            # the ranges of the fake package start at the exact version of the project
+            version = version_range.split(' ')[0]
+            if not (packages_dir / name / version / ElmPackage.DOCS_FILENAME).is_file():
+                return False
+    return True
+
+
+def resolved_dependencies(project: ElmProject) -> Dict:
+    description = project.as_json()
+    return {
+        'dependencies': description.get('dependencies', {}),
+        'test-dependencies': description.get('test-dependencies', {}),
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def elm_compiler_version(elm_path: Optional[Path]) -> str:
+    output = subprocess.check_output([str(elm_path), '--version'], universal_newlines=True)
+    return output.strip()
+
+
+def _update(digest, data: bytes) -> None:
+    # length-prefix each field so that adjacent fields can't be confused
+    digest.update(str(len(data)).encode('ascii') + b':')
+    digest.update(data)
@@ -1,21 +1,182 @@
-from typing import List
+from typing import List, Optional, Tuple
 import logging
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
 import itertools
+import json
+import multiprocessing
+import sys
 
+import attr
 import parsy
 
 from elm_doc import elm_parser
 from elm_doc.elm_parser import Chunk
+from elm_doc.utils import write_atomically
 
 
 logger = logging.getLogger(__name__)
 
 
+class PortParseError(Exception):
+    '''A port declaration that could not be parsed.'''
+
+
+class CodeshiftError(Exception):
+    '''Failure to rewrite one or more files. Failures are sorted by path.'''
+
+    def __init__(self, failures: List[Tuple[Path, str]]):
+        self.failures = failures
+        super().__init__('failed to strip ports from: {}'.format(
+            ', '.join(str(path) for path, _ in failures)))
+
+
+@attr.s
+class StripResult:
+    path = attr.ib()  # Path
+    digest = attr.ib()  # str
+    stripped = attr.ib()  # Optional[bytes], None if not a port module
+    error = attr.ib(default=None)  # Optional[str]
+
+
 def strip_ports_from_file(elm_file: Path) -> None:
     source = elm_file.read_text()
     stripped = strip_ports_from_string(source, str(elm_file))
-    elm_file.write_text(stripped)
+    # replace rather than overwrite the file, in case it's a link to the original source
+    write_atomically(elm_file, stripped.encode('utf8'))
+
+
+def strip_ports_from_files(
+        elm_files: List[Path],
+        manifest: Optional['CodeshiftManifest'] = None,
+        jobs: int = 1,
+        batch_size: int = 32) -> None:
+    '''Rewrite the port modules among elm_files in place. With more than one job,
+    files are classified and rewritten by a process pool in batches.
+
+    Errors are logged, sorted by file, once all files have been processed,
+    and then raised as a CodeshiftError.
+    '''
+    pending = [elm_file for elm_file in elm_files
+               if not (manifest and manifest.apply(elm_file))]
+    if jobs > 1 and len(pending) > batch_size:
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        with _process_pool(jobs) as executor:
+            results = [result for batch_results in executor.map(_strip_ports_in_batch, batches)
+                       for result in batch_results]
+    else:
+        results = _strip_ports_in_batch(pending)
+
+    failures = []
+    for result in results:
+        if result.error is not None:
+            failures.append((result.path, result.error))
+            continue
+        if result.stripped is not None:
+            write_atomically(result.path, result.stripped)
+        if manifest:
+            manifest.record(result.digest, result.stripped)
+
+    if failures:
+        failures.sort()
+        for _, message in failures:
+            logger.error(message)
+        raise CodeshiftError(failures)
+
+
+def _process_pool(jobs: int) -> ProcessPoolExecutor:
+    # registry lookups run in threads of this process by now, and a child forked
+    # while one of them holds a lock would wait for it forever
+    if sys.version_info >= (3, 7):
+        return ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('spawn'))
+    return ProcessPoolExecutor(max_workers=jobs)
+
+
+def _strip_ports_in_batch(elm_files: List[Path]) -> List[StripResult]:
+    results = []
+    for elm_file in elm_files:
+        content = elm_file.read_bytes()
+        result = StripResult(elm_file, hashlib.sha256(content).hexdigest(), None)
+        try:
+            source = content.decode('utf8')
+            if elm_parser.is_port_module_source(source):
+                result.stripped = strip_ports_from_string(source, str(elm_file)).encode('utf8')
+        except PortParseError as e:
+            result.error = str(e)
+        except Exception as e:
+            result.error = '{}: {}'.format(elm_file, e)
+        results.append(result)
+    return results
+
+
+@attr.s
+class CodeshiftManifest:
+    '''Remembers, by content hash, which sources are port modules and what they
+    look like with ports stripped, so that a source that has been seen before
+    is neither classified nor parsed again.
+    '''
+    MANIFEST_FILENAME = 'manifest.json'
+    MAX_ENTRIES = 10000
+
+    path = attr.ib()  # Path, a directory
+    # content hash -> whether it's a port module
+    port_modules = attr.ib(factory=dict)  # Dict[str, bool]
+    dirty = attr.ib(default=False)  # bool
+
+    @classmethod
+    def load(cls, path: Path) -> 'CodeshiftManifest':
+        manifest = cls(path)
+        try:
+            with open(str(path / cls.MANIFEST_FILENAME)) as f:
+                manifest.port_modules = json.load(f)
+        except (OSError, ValueError):
+            pass
+        return manifest
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        # forget the oldest entries first; dicts keep insertion order
+        while len(self.port_modules) > self.MAX_ENTRIES:
+            digest = next(iter(self.port_modules))
+            if self.port_modules.pop(digest) and self._stripped_path(digest).is_file():
+                self._stripped_path(digest).unlink()
+        self.path.mkdir(parents=True, exist_ok=True)
+        write_atomically(self.path / self.MANIFEST_FILENAME,
+                         json.dumps(self.port_modules).encode('utf8'))
+        self.dirty = False
+
+    def apply(self, elm_file: Path) -> bool:
+        '''Rewrite the file from what we know about its content, if anything.
+        Returns whether the content was known.'''
+        content = elm_file.read_bytes()
+        digest = hashlib.sha256(content).hexdigest()
+        is_port_module = self.port_modules.get(digest)
+        if is_port_module is False:
+            return True
+        if is_port_module and self._stripped_path(digest).is_file():
+            write_atomically(elm_file, self._stripped_path(digest).read_bytes())
+            return True
+        return False
+
+    def record(self, digest: str, stripped: Optional[bytes]) -> None:
+        if stripped is None:
+            self._record(digest, False)
+            return
+        self.path.mkdir(parents=True, exist_ok=True)
+        write_atomically(self._stripped_path(digest), stripped)
+        self._record(digest, True)
+        # the rewritten file may be looked at again, e.g. after the build dir is restored
+        self._record(hashlib.sha256(stripped).hexdigest(), False)
+
+    def _record(self, digest: str, is_port_module: bool) -> None:
+        self.port_modules.pop(digest, None)
+        self.port_modules[digest] = is_port_module
+        self.dirty = True
+
+    def _stripped_path(self, digest: str) -> Path:
+        return self.path / '{}.elm'.format(digest)
 
 
 def strip_ports_from_string(source: str, source_path: str = '<unknown>') -> str:
@@ -65,15 +226,14 @@ def _rewrite_port_function(chunk: Chunk, source_path: str) -> List[str]:
         one_liner = ''.join([raw.strip() for raw in chunk.non_comment_raw_lines()])
         port_info = elm_parser.parse_port_declaration(one_liner)
         output.append(_make_dummy_port_implementation(port_info) + '\n')
-    except parsy.ParseError:
+    except parsy.ParseError as e:
         line_num = chunk.lines[0].number
-        logger.error('''{}:{}: failed to parse a port declaration. We parsed it as:
+        raise PortParseError('''{}:{}: failed to parse a port declaration. We parsed it as:
 
   {}
 
 If this is a valid port declaration, please submit a bug report'''.format(
-            source_path, line_num, one_liner))
-        raise
+            source_path, line_num, one_liner)) from e
 
     for trailing_line in trailing_non_sources:
         output.append(trailing_line.raw)
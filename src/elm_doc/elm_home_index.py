@@ -0,0 +1,168 @@
+'''
+An index of the packages the compiler has downloaded into ELM_HOME.
+
+Every lookup of a dependency used to parse its elm.json again. The index
+keeps the parsed elm.json and whether docs.json exists for each package
+version, and is kept across runs in the cache directory. An entry is only
+trusted while the mtime of its version directory is unchanged, which is
+what happens when the compiler adds files to it, so a lookup costs one
+stat instead of reading and parsing a file.
+'''
+from typing import Dict, List, Optional
+from pathlib import Path
+import hashlib
+import json
+import logging
+import threading
+
+from elm_doc.elm_project import ElmPackage, ExactVersion, version_key
+from elm_doc.utils import default_cache_dir, write_atomically
+
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIRNAME = 'elm-home'
+# bump this when the layout of the index changes; older ones are discarded
+SCHEMA_VERSION = 1
+
+
+class ElmHomeIndex:
+    def __init__(self, packages_dir: Path, index_path: Optional[Path] = None):
+        self.packages_dir = packages_dir
+        self.index_path = index_path
+        self._projects = {}  # Dict[str, Dict], versions of a package by the mtime of its directory
+        self._versions = {}  # Dict[str, Dict], elm.json and docs.json of name@version by directory mtime
+        self._changed = False
+        self._lock = threading.Lock()
+        if index_path is not None:
+            self._load()
+
+    def package(self, name: str, version: ExactVersion) -> Optional[ElmPackage]:
+        entry = self._version_entry(name, version)
+        if entry is None or entry['description'] is None:
+            return None
+        return ElmPackage.from_description(self.packages_dir / name / version, entry['description'])
+
+    def docs_path(self, name: str, version: ExactVersion) -> Optional[Path]:
+        '''Path of the docs.json that the compiler generated for the package, if it did.'''
+        entry = self._version_entry(name, version)
+        if entry is None or not entry['docs']:
+            return None
+        return self.packages_dir / name / version / ElmPackage.DOCS_FILENAME
+
+    def versions(self, name: str) -> List[ExactVersion]:
+        '''Downloaded versions of the package, oldest first.'''
+        project_dir = self.packages_dir / name
+        mtime = _mtime(project_dir)
+        with self._lock:
+            entry = self._projects.get(name)
+        if entry is None or entry['mtime'] != mtime:
+            versions = []
+            if mtime is not None:
+                versions = sorted((path.name for path in project_dir.iterdir() if _is_version(path.name)),
+                                  key=version_key)
+            entry = {'mtime': mtime, 'versions': versions}
+            with self._lock:
+                self._projects[name] = entry
+                self._changed = True
+        return [version for version in entry['versions'] if self.package(name, version) is not None]
+
+    def package_names(self) -> List[str]:
+        '''Names of all packages that have a directory, whether or not any version was downloaded.'''
+        names = []
+        for user_dir in _subdirectories(self.packages_dir):
+            names.extend('{}/{}'.format(user_dir.name, project_dir.name)
+                         for project_dir in _subdirectories(user_dir))
+        return sorted(names)
+
+    def save(self) -> None:
+        '''Keep what was looked up for the next run, if anything changed.'''
+        with self._lock:
+            if not self._changed or self.index_path is None:
+                return
+            content = json.dumps({
+                'schema': SCHEMA_VERSION,
+                'packages_dir': str(self.packages_dir),
+                'projects': self._projects,
+                'versions': self._versions,
+            }, sort_keys=True).encode('utf8')
+            self._changed = False
+        try:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            write_atomically(self.index_path, content)
+        except OSError as e:
+            logger.warning('could not save the index of %s to %s: %s', self.packages_dir, self.index_path, e)
+
+    def _version_entry(self, name: str, version: ExactVersion) -> Optional[Dict]:
+        key = '{}@{}'.format(name, version)
+        version_dir = self.packages_dir / name / version
+        mtime = _mtime(version_dir)
+        if mtime is None:
+            return None
+        with self._lock:
+            entry = self._versions.get(key)
+        if entry is not None and entry['mtime'] == mtime:
+            return entry
+
+        try:
+            with open(str(version_dir / ElmPackage.DESCRIPTION_FILENAME)) as f:
+                description = json.load(f)
+            if description.get('type') != 'package':
+                description = None
+        except (OSError, ValueError):
+            description = None
+        entry = {
+            'mtime': mtime,
+            'description': description,
+            'docs': (version_dir / ElmPackage.DOCS_FILENAME).is_file(),
+        }
+        with self._lock:
+            self._versions[key] = entry
+            self._changed = True
+        return entry
+
+    def _load(self) -> None:
+        try:
+            with open(str(self.index_path)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('schema') != SCHEMA_VERSION or data.get('packages_dir') != str(self.packages_dir):
+            return
+        self._projects = data['projects']
+        self._versions = data['versions']
+
+
+_indexes = {}  # Dict[Path, ElmHomeIndex], by index path
+_indexes_lock = threading.Lock()
+
+
+def open_index(packages_dir: Path, cache_path: Optional[Path] = None) -> ElmHomeIndex:
+    '''The index of a package directory in ELM_HOME, shared by everything in this
+    process. It's kept in `cache_path` if given, else in the default cache directory.'''
+    digest = hashlib.sha1(str(packages_dir).encode('utf8')).hexdigest()[:16]
+    index_path = (cache_path or default_cache_dir()) / INDEX_DIRNAME / '{}.json'.format(digest)
+    with _indexes_lock:
+        index = _indexes.get(index_path)
+        if index is None:
+            index = _indexes[index_path] = ElmHomeIndex(packages_dir, index_path)
+        return index
+
+
+def _mtime(path: Path) -> Optional[int]:
+    try:
+        return path.stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+def _subdirectories(path: Path) -> List[Path]:
+    try:
+        return [child for child in path.iterdir() if child.is_dir()]
+    except OSError:
+        return []
+
+
+def _is_version(name: str) -> bool:
+    parts = name.split('.')
+    return len(parts) == 3 and all(part.isdigit() for part in parts)
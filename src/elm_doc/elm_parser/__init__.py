@@ -3,16 +3,20 @@ note: this is by no means a complete Elm syntax parser. In fact,
 it can only do little more than splitting a port declaration
 at meaningful boundaries.
 '''
+from typing import Iterable
 from pathlib import Path
 
 from elm_doc.elm_parser.lines import ChunkType, Chunk, iter_line_chunks
 from elm_doc.elm_parser.ports import PortInfo, parse_port_declaration
+from elm_doc.elm_parser.imports import iter_imports
 
 __all__ = [
     'ChunkType',
     'Chunk',
     'PortInfo',
     'is_port_module',
+    'is_port_module_source',
+    'iter_imports',
     'iter_line_chunks',
     'parse_port_declaration',
 ]
@@ -20,9 +24,17 @@ __all__ = [
 
 def is_port_module(path: Path) -> bool:
     with open(str(path)) as f:
-        for line in f:
-            if line.startswith('module '):
-                return False
-            elif line.startswith('port module '):
-                return True
+        return _is_port_module(f)
+
+
+def is_port_module_source(source: str) -> bool:
+    return _is_port_module(source.splitlines())
+
+
+def _is_port_module(lines: Iterable[str]) -> bool:
+    for line in lines:
+        if line.startswith('module '):
+            return False
+        elif line.startswith('port module '):
+            return True
     return False
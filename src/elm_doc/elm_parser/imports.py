@@ -0,0 +1,17 @@
+'''
+Functions for finding the modules a module imports.
+'''
+from typing import Iterator
+import re
+
+
+# Imports can only appear at the top level, so we don't need to
+# understand the rest of the file to find them. An import line inside a
+# multiline comment gets picked up too, which errs on the side of
+# including more modules than necessary.
+import_re = re.compile(r'^import\s+([A-Z][A-Za-z0-9_]*(?:\.[A-Z][A-Za-z0-9_]*)*)', re.MULTILINE)
+
+
+def iter_imports(source: str) -> Iterator[str]:
+    for match in import_re.finditer(source):
+        yield match.group(1)
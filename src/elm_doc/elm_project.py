@@ -8,8 +8,6 @@ import json
 
 import attr
 from click import BadParameter
-from requests import Session, RequestException
-from retrying import retry
 
 from elm_doc import elm_platform
 
@@ -31,7 +29,7 @@ class ElmProject:
     def json_path(self) -> Path:
         return self.path / self.DESCRIPTION_FILENAME
 
-    def iter_direct_dependencies(self) -> Iterator['ElmPackage']:
+    def iter_direct_dependencies(self, cache_path: Optional[Path] = None) -> Iterator['ElmPackage']:
         raise NotImplementedError
 
 
@@ -55,7 +53,10 @@ class ElmPackage(ElmProject):
         if not json_path.exists():
             return
 
-        description = _load_json(json_path)
+        return cls.from_description(path, _load_json(json_path))
+
+    @classmethod
+    def from_description(cls, path: Path, description: Dict) -> Optional['ElmPackage']:
         if description['type'] != 'package':
             return
 
@@ -183,7 +184,8 @@ class ElmApplication(ElmProject):
             self.direct_test_dependencies.keys(),
         )
 
-    def iter_direct_dependencies(self) -> Iterator[ElmPackage]:
+    def iter_direct_dependencies(self, cache_path: Optional[Path] = None) -> Iterator[ElmPackage]:
+        '''`cache_path` is where the index of ELM_HOME is kept, see elm_home_index.'''
         deps = itertools.chain(
             self.direct_dependencies.items(),
             self.direct_test_dependencies.items(),
@@ -191,10 +193,16 @@ class ElmApplication(ElmProject):
         # Elm 0.19.0 uses "package" in the path, 0.19.1 uses "packages".
         # Here we use a glob to be agnostic and somewhat defensive against
         # future change. e.g. ~/.elm/0.19.0/package*/elm/core/1.0.0
+        # imported here because the index builds on this module
+        from elm_doc import elm_home_index
+
         elm_version_dir = elm_platform.ELM_HOME / self.elm_version
         for elm_package_dir in elm_version_dir.glob("package*"):
+            index = elm_home_index.open_index(elm_package_dir, cache_path)
             for name, version in deps:
-                yield from_path(elm_package_dir / name / version)
+                # from_path explains what's wrong if the index has no such package
+                yield index.package(name, version) or from_path(elm_package_dir / name / version)
+            index.save()
             break
         else:
             raise RuntimeError(
@@ -212,6 +220,10 @@ def _as_package_dependencies(*app_dependencies: Dict[str, ExactVersion]) -> Dict
     return package_deps
 
 
+def version_key(version: ExactVersion) -> Tuple[int, ...]:
+    return tuple(int(part) for part in version.split('.'))
+
+
 def _as_version_range(exact_version: ExactVersion) -> VersionRange:
     major, minor, patch = exact_version.split('.')
     next_version = '{}.{}.{}'.format(major, minor, int(patch, 10) + 1)
@@ -300,13 +312,3 @@ def _matches_include_path(source_path: Path, include_path: Path):
         return False
     else:
         return True
-
-
-@retry(
-    retry_on_exception=lambda e: isinstance(e, RequestException),
-    wait_exponential_multiplier=1000,  # Wait 2^x * 1000 milliseconds between each retry,
-    wait_exponential_max=30 * 1000,  # up to 30 seconds, then 30 seconds afterwards
-    stop_max_attempt_number=10)
-def fetch_releases(session: Session, package_name: str) -> Dict[ExactVersion, int]:
-    releases_url = 'https://package.elm-lang.org/packages/{}/releases.json'.format(package_name)
-    return session.get(releases_url).json()
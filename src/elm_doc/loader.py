@@ -1,22 +1,38 @@
 '''
 '''
+from typing import List, Tuple
+
 from doit import create_after
-import requests
-from cachecontrol import CacheControl
 
+from elm_doc import elm_home_index
 from elm_doc import elm_project
+from elm_doc import module_graph
+from elm_doc import registry as registry_module
+from elm_doc import registry_backends
 from elm_doc import tasks
+from elm_doc.local_registry import LocalRegistry
+from elm_doc.registry import Registry
 from elm_doc.run_config import RunConfig, Build
 
 
+DEPENDENCY_TASK_BASENAMES = [
+    # package tasks
+    'dep_copy_docs_json', 'dep_top_page', 'dep_versions_page', 'dep_elm_json', 'dep_readme',
+    'dep_releases', 'dep_latest_link', 'dep_about', 'dep_module_page',
+    # or, with batch_page_tasks, all of them at once
+    'dep_package',
+    # catalog tasks
+    'index', 'search_json', 'help',
+    # or, with spa_fallback, instead of help
+    'server_config',
+]
+
+
 def make_task_loader(
         project: elm_project.ElmProject,
         project_config: elm_project.ProjectConfig,
         run_config: RunConfig):
-    session = CacheControl(requests.Session())
-    if isinstance(run_config, Build):
-        project.add_direct_dependencies(
-            tasks.catalog.missing_popular_packages(session, list(project.direct_dependency_names())))
+    registry = _make_registry(run_config, project.elm_version)
 
     if run_config.build_path is None:
         run_config.build_path = project.path / '.elm-doc'
@@ -24,52 +40,146 @@ def make_task_loader(
     task_loader = {}
 
     task_loader['task_main_project'] = make_main_project_task_loader(
-        session, project, project_config, run_config)
+        registry, project, project_config, run_config)
 
     if isinstance(run_config, Build):
         task_loader['task_dependencies'] = make_dependencies_task_loader(
-            session, project, project_config, run_config)
+            registry, project, project_config, run_config)
         task_loader['task_assets'] = make_assets_task_loader(run_config)
 
     return task_loader
 
 
 def make_main_project_task_loader(
-        session: requests.Session,
+        registry: Registry,
         project: elm_project.ElmProject,
         project_config: elm_project.ProjectConfig,
         run_config: RunConfig):
     def task_main_project():
         yield from tasks.project.create_main_project_tasks(
-            session, project, project_config, run_config)
+            registry, project, project_config, run_config)
     return task_main_project
 
 
 def make_dependencies_task_loader(
-        session: requests.Session,
+        registry: Registry,
         project: elm_project.ElmProject,
         project_config: elm_project.ProjectConfig,
         run_config: Build):
-    @create_after(executed='build_docs_json', creates=[
-        # package tasks
-        'dep_copy_docs_json', 'dep_top_page', 'dep_versions_page', 'dep_elm_json', 'dep_readme',
-        'dep_releases', 'dep_latest_link', 'dep_about', 'dep_module_page',
-        # catalog tasks
-        'index', 'search_json', 'help',
-    ])
+    @create_after(executed='build_docs_json', creates=DEPENDENCY_TASK_BASENAMES)
     def task_dependencies():
-        deps = list(project.iter_direct_dependencies())
-        deps.sort(key=lambda dep: dep.name)
-        all_packages = [project.as_package(project_config).without_license()] + deps
+        yield from _create_dependency_and_catalog_tasks(
+            registry, [(project, project_config, run_config)], run_config)
 
-        for package in deps:
-            yield from tasks.package.create_dependency_tasks(
-                session, package, run_config)
+    return task_dependencies
 
-        yield from tasks.catalog.create_catalog_tasks(
-            all_packages, run_config)
 
-    return task_dependencies
+def make_batch_task_loader(
+        projects: List[Tuple[elm_project.ElmProject, elm_project.ProjectConfig, RunConfig]]):
+    '''Tasks for documenting several projects as one site. Each project is built
+    in its own build directory, while dependency pages, the catalog and the assets
+    are shared, so that a package version several projects depend on is only
+    documented once. All run configs are expected to share the output path.'''
+    registry = _make_registry(projects[0][2], projects[0][0].elm_version)
+    for project, _, run_config in projects:
+        if run_config.build_path is None:
+            run_config.build_path = project.path / '.elm-doc'
+
+    def task_main_project():
+        for project, project_config, run_config in projects:
+            yield from tasks.project.create_main_project_tasks(
+                registry, project, project_config, run_config)
+
+    task_loader = {'task_main_project': task_main_project}
+
+    builds = [(project, project_config, run_config) for project, project_config, run_config in projects
+              if isinstance(run_config, Build)]
+    if builds:
+        site_config = projects[0][2]
+
+        @create_after(executed='build_docs_json', creates=DEPENDENCY_TASK_BASENAMES)
+        def task_dependencies():
+            yield from _create_dependency_and_catalog_tasks(registry, builds, site_config)
+
+        task_loader['task_dependencies'] = task_dependencies
+        task_loader['task_assets'] = make_assets_task_loader(site_config)
+
+    return task_loader
+
+
+def _create_dependency_and_catalog_tasks(
+        registry: Registry,
+        projects: List[Tuple[elm_project.ElmProject, elm_project.ProjectConfig, Build]],
+        run_config: Build):
+    # each (package, version) once, however many projects depend on it
+    deps = {}  # Dict[Tuple[str, ExactVersion], ElmPackage]
+    for project, _, project_run_config in projects:
+        if project_run_config.only_imported_dependencies:
+            graph = module_graph.load_project_graph(project, project_run_config.build_path)
+            dependencies = module_graph.imported_packages(
+                graph, project.iter_direct_dependencies(project_run_config.cache_path))
+        else:
+            # popular packages are there to be browsed, not because anything imports them,
+            # and those resolved by an earlier build mustn't leak into this mode
+            project = tasks.catalog.with_popular_packages(project, project_run_config.build_path)
+            dependencies = project.iter_direct_dependencies(project_run_config.cache_path)
+        for dep in dependencies:
+            deps.setdefault((dep.name, dep.version), dep)
+    versions = {}  # Dict[str, List[ExactVersion]]
+    for name, version in deps:
+        versions.setdefault(name, []).append(version)
+
+    for key in sorted(deps, key=lambda key: (key[0], elm_project.version_key(key[1]))):
+        yield from tasks.package.create_dependency_tasks(
+            registry, deps[key], run_config, versions=versions[key[0]], all_versions=versions)
+
+    latest_deps = [deps[name, max(package_versions, key=elm_project.version_key)]
+                   for name, package_versions in sorted(versions.items())]
+    all_packages = [project.as_package(project_config).without_license()
+                    for project, project_config, _ in projects] + latest_deps
+    yield from tasks.catalog.create_catalog_tasks(all_packages, run_config)
+
+
+def make_elm_home_task_loader(elm_version: str, run_config: Build):
+    '''Tasks for documenting every package in ELM_HOME that the compiler has generated docs for.'''
+    registry = _make_registry(run_config, elm_version)
+    index = elm_home_index.open_index(registry.local.packages_dir, run_config.cache_path)
+
+    def task_packages():
+        yield from tasks.elm_home.create_elm_home_tasks(registry, index, run_config)
+
+    return {
+        'task_packages': task_packages,
+        'task_assets': make_assets_task_loader(run_config),
+    }
+
+
+def _make_registry(run_config: RunConfig, elm_version: str) -> Registry:
+    backend = registry_backends.make_backend(
+        registry_module.make_session(run_config.http_concurrency),
+        run_config.registry_url,
+        cassette_path=run_config.registry_cassette,
+        cassette_mode=run_config.cassette_mode,
+        timeout=run_config.registry_timeout,
+        retries=run_config.registry_retries,
+        failure_threshold=run_config.registry_failures,
+    )
+    cache = None
+    # mirrors and cassettes are local already, and replaying one should
+    # give the same result wherever it happens
+    if isinstance(backend, registry_backends.HttpBackend):
+        if run_config.cache_path is not None:
+            cache_path = run_config.cache_path / registry_module.CACHE_FILENAME
+        else:
+            cache_path = registry_module.default_cache_path()
+        cache = registry_module.ReleasesCache(cache_path, ttl=run_config.registry_ttl, registry_url=backend.url)
+    return Registry(
+        backend,
+        run_config.http_concurrency,
+        cache=cache,
+        local=LocalRegistry.for_elm_version(elm_version, run_config.cache_path),
+        offline=run_config.offline,
+    )
 
 
 def make_assets_task_loader(run_config: Build):
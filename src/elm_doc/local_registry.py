@@ -0,0 +1,133 @@
+'''
+What the Elm compiler knows about packages, read from ELM_HOME, for
+resolving package versions without network access.
+
+The compiler keeps the list of all published versions of all packages in
+registry.dat, serialized with Haskell's Data.Binary. Elm 0.19.1 lays it out as
+
+    Registry      = count:Int64 versions:(Map Name KnownVersions)
+    Map k v       = size:Int64 (k v)*          -- in ascending key order
+    Name          = author:String project:String
+    String        = length:Word8 utf8-bytes
+    KnownVersions = newest:Version previous:(List Version)
+    List a        = length:Int64 a*
+    Version       = major:Word8 minor:Word8 patch:Word8
+                  | 255:Word8 major:Word16 minor:Word16 patch:Word16
+
+with all integers big-endian. See builder/src/Deps/Registry.hs in the compiler.
+If the file is missing or can't be read, the package directories are all we go by.
+'''
+from typing import Dict, List, Optional
+from pathlib import Path
+import logging
+import re
+import struct
+
+from elm_doc import elm_home_index
+from elm_doc import elm_platform
+from elm_doc.elm_project import ExactVersion, version_key
+
+
+logger = logging.getLogger(__name__)
+
+REGISTRY_FILENAME = 'registry.dat'
+version_re = re.compile(r'^\d+\.\d+\.\d+$')
+
+
+class RegistryFormatError(Exception):
+    pass
+
+
+class LocalRegistry:
+    def __init__(self, packages_dir: Path, cache_path: Optional[Path] = None):
+        self.packages_dir = packages_dir
+        self.cache_path = cache_path  # where the index of packages_dir is kept, see elm_home_index
+        self._known_versions = None  # Optional[Dict[str, List[ExactVersion]]]
+
+    @classmethod
+    def for_elm_version(cls, elm_version: str, cache_path: Optional[Path] = None) -> 'LocalRegistry':
+        '''The registry of the given compiler version, or of the newest one in ELM_HOME
+        if that's not an exact version, as is the case for packages.'''
+        elm_version_dir = elm_platform.ELM_HOME / elm_version
+        if not elm_version_dir.is_dir():
+            candidates = [path for path in elm_platform.ELM_HOME.glob('0.19.*') if version_re.match(path.name)]
+            if candidates:
+                elm_version_dir = max(candidates, key=lambda path: version_key(path.name))
+        # Elm 0.19.0 uses "package", 0.19.1 uses "packages"
+        for packages_dir in sorted(elm_version_dir.glob('package*')):
+            if packages_dir.is_dir():
+                return cls(packages_dir, cache_path)
+        return cls(elm_version_dir / 'packages', cache_path)
+
+    def known_versions(self) -> Dict[str, List[ExactVersion]]:
+        '''All published versions of all packages as of the last time the compiler
+        updated its registry, or an empty dict if there's no readable registry.'''
+        if self._known_versions is None:
+            registry_path = self.packages_dir / REGISTRY_FILENAME
+            try:
+                self._known_versions = parse_registry(registry_path.read_bytes())
+            except OSError:
+                self._known_versions = {}
+            except RegistryFormatError as e:
+                logger.warning('could not read %s: %s', registry_path, e)
+                self._known_versions = {}
+        return self._known_versions
+
+    def installed_versions(self, package_name: str) -> List[ExactVersion]:
+        return elm_home_index.open_index(self.packages_dir, self.cache_path).versions(package_name)
+
+    def latest_version(self, package_name: str) -> Optional[ExactVersion]:
+        '''Newest version of the package that can be documented offline, that is,
+        one the compiler has downloaded and, if the registry is readable, knows of.'''
+        installed = self.installed_versions(package_name)
+        known = self.known_versions()
+        if known:
+            installed = [version for version in installed if version in known.get(package_name, [])]
+        return installed[-1] if installed else None
+
+
+def parse_registry(data: bytes) -> Dict[str, List[ExactVersion]]:
+    reader = _Reader(data)
+    try:
+        reader.int64()  # count of all versions
+        packages = {}
+        for _ in range(reader.int64()):
+            name = '{}/{}'.format(reader.string(), reader.string())
+            newest = reader.version()
+            previous = [reader.version() for _ in range(reader.int64())]
+            packages[name] = sorted([newest] + previous, key=version_key)
+    except (struct.error, UnicodeDecodeError) as e:
+        raise RegistryFormatError(str(e))
+    if reader.offset != len(data):
+        raise RegistryFormatError('{} bytes of trailing data'.format(len(data) - reader.offset))
+    return packages
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.offset = 0
+
+    def unpack(self, fmt: str):
+        values = struct.unpack_from(fmt, self.data, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values
+
+    def int64(self) -> int:
+        value, = self.unpack('>q')
+        if value < 0:
+            raise RegistryFormatError('negative length at offset {}'.format(self.offset - 8))
+        return value
+
+    def string(self) -> str:
+        length, = self.unpack('>B')
+        value, = self.unpack('>{}s'.format(length))
+        return value.decode('utf8')
+
+    def version(self) -> ExactVersion:
+        major, = self.unpack('>B')
+        if major == 255:
+            major, minor, patch = self.unpack('>HHH')
+        else:
+            minor, patch = self.unpack('>BB')
+        return '{}.{}.{}'.format(major, minor, patch)
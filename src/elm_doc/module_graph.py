@@ -0,0 +1,204 @@
+'''
+The import graph of the modules in a project, and ways of slicing it.
+'''
+from typing import Dict, Iterable, List, Optional, Set
+from pathlib import Path
+import hashlib
+import json
+
+import attr
+
+from elm_doc import elm_parser
+from elm_doc import source_mirror
+from elm_doc.elm_project import ElmPackage, ElmProject, ModuleName
+from elm_doc.utils import write_atomically
+
+
+INDEX_FILENAME = 'module-index.json'
+INDEX_VERSION = 1
+
+
+@attr.s
+class ModuleGraph:
+    paths = attr.ib(factory=dict)  # Dict[ModuleName, Path]
+    imports = attr.ib(factory=dict)  # Dict[ModuleName, List[ModuleName]]
+
+    @classmethod
+    def from_source_dir(cls, src_dir: Path) -> 'ModuleGraph':
+        return ModuleIndex(None).scan([src_dir])
+
+    def local_imports(self, module_name: ModuleName) -> List[ModuleName]:
+        '''Imports of the given module that are modules of this project,
+        as opposed to modules of dependencies.'''
+        return [name for name in self.imports.get(module_name, []) if name in self.paths]
+
+    def import_closure(self, module_names: Iterable[ModuleName]) -> Set[ModuleName]:
+        seen = set()
+        stack = [name for name in module_names if name in self.paths]
+        while stack:
+            name = stack.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            stack.extend(self.local_imports(name))
+        return seen
+
+    def external_imports(self) -> Set[ModuleName]:
+        '''Modules imported from dependencies by any module of this project.'''
+        return {name for imports in self.imports.values() for name in imports if name not in self.paths}
+
+
+@attr.s
+class ModuleIndex:
+    '''Imports of every module under a set of source directories, persisted
+    as JSON so that only files whose size or mtime changed since the last
+    scan are read again, and only files whose content changed are rescanned.
+    '''
+    path = attr.ib()  # Optional[Path]
+    # str(path) -> {'size', 'mtime', 'digest', 'imports'}
+    files = attr.ib(factory=dict)  # Dict[str, Dict]
+
+    @classmethod
+    def load(cls, path: Optional[Path]) -> 'ModuleIndex':
+        index = cls(path)
+        if path is None or not path.is_file():
+            return index
+        try:
+            with open(str(path)) as f:
+                data = json.load(f)
+        except ValueError:
+            return index
+        if data.get('version') == INDEX_VERSION:
+            index.files = data['files']
+        return index
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {'version': INDEX_VERSION, 'files': self.files}
+        write_atomically(self.path, json.dumps(data, sort_keys=True).encode('utf8'))
+
+    def scan(self, source_dirs: List[Path]) -> ModuleGraph:
+        '''Bring the index up to date with the files in `source_dirs` and return
+        the resulting graph.'''
+        graph = ModuleGraph()
+        files = {}
+        # like the source mirror, skip elm-stuff, node_modules, the build directory and so on
+        for rel_path, elm_file in source_mirror.iter_elm_files(source_dirs):
+            module_name = '.'.join(rel_path.parent.parts + (rel_path.stem,))
+            if module_name in graph.paths:
+                # the compiler rejects this; keep the first one like it would
+                continue
+            key = str(elm_file)
+            entry = self._refresh(elm_file, self.files.get(key))
+            files[key] = entry
+            graph.paths[module_name] = elm_file
+            graph.imports[module_name] = entry['imports']
+        dirty = files != self.files
+        self.files = files
+        if dirty:
+            self.save()
+        return graph
+
+    def _refresh(self, elm_file: Path, entry: Optional[Dict]) -> Dict:
+        stat = elm_file.stat()
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+            return entry
+        content = elm_file.read_bytes()
+        digest = hashlib.sha256(content).hexdigest()
+        if entry and entry['digest'] == digest:
+            imports = entry['imports']
+        else:
+            # the compiler reports invalid UTF-8; the imports can still be found
+            imports = list(elm_parser.iter_imports(content.decode('utf8', errors='replace')))
+        return {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'digest': digest, 'imports': imports}
+
+
+def load_project_graph(project: ElmProject, build_path: Path) -> ModuleGraph:
+    '''Import graph of all modules in the source directories of the project,
+    backed by an index in the build directory.'''
+    index = ModuleIndex.load(build_path / INDEX_FILENAME)
+    return index.scan([project.path / source_dir for source_dir in project.source_directories])
+
+
+def imported_packages(graph: ModuleGraph, packages: Iterable[ElmPackage]) -> List[ElmPackage]:
+    '''The packages that expose at least one module the project imports.'''
+    imported = graph.external_imports()
+    return [package for package in packages if imported.intersection(package.sorted_exposed_modules())]
+
+
+@attr.s
+class Shard:
+    exposed_modules = attr.ib(factory=list)  # List[ModuleName]
+    staged_modules = attr.ib(factory=set)  # Set[ModuleName]
+
+
+def partition_into_shards(
+        graph: ModuleGraph, exposed_modules: List[ModuleName], count: int) -> List[Shard]:
+    '''Split exposed modules into at most `count` groups, each of which is staged
+    along with the transitive imports of its modules so that it compiles on its own.
+
+    Modules are assigned greedily, largest import closure first, to whichever shard
+    would end up staging the fewest modules; the result only depends on the inputs.
+    Import closures are computed once for the whole graph, as bitsets, so that
+    comparing shards costs a few integer operations per module.
+    '''
+    names = sorted(set(graph.paths).union(exposed_modules))
+    closures = _closure_bitsets(graph, names)
+    sizes = {name: _popcount(closures[name]) for name in exposed_modules}
+
+    shard_count = max(1, min(count, len(exposed_modules)))
+    shard_modules = [[] for _ in range(shard_count)]  # List[List[ModuleName]]
+    shard_staged = [0] * shard_count  # List[int], bitsets of staged modules
+    for name in sorted(exposed_modules, key=lambda name: (-sizes[name], name)):
+        closure = closures[name]
+        i = min(range(shard_count), key=lambda i: _popcount(shard_staged[i] | closure))
+        shard_modules[i].append(name)
+        shard_staged[i] |= closure
+
+    return [Shard(sorted(modules), {name for i, name in enumerate(names) if staged >> i & 1})
+            for modules, staged in zip(shard_modules, shard_staged) if modules]
+
+
+def _closure_bitsets(graph: ModuleGraph, names: List[ModuleName]) -> Dict[ModuleName, int]:
+    '''Import closure of every module, itself included, with bit i standing for names[i].
+    Each module is visited once, as the closure of an import is reused by all importers.'''
+    bit_of = {name: 1 << i for i, name in enumerate(names)}
+    closures = {}  # Dict[ModuleName, int]
+    for root in names:
+        # iterative post-order, as import chains can be longer than the recursion limit
+        stack = [(root, False)]
+        while stack:
+            name, expanded = stack.pop()
+            if name in closures:
+                continue
+            imports = graph.local_imports(name)
+            if expanded:
+                closure = bit_of[name]
+                for imported in imports:
+                    # an import cycle, which the compiler rejects, leaves a module unfinished
+                    closure |= closures.get(imported, bit_of[imported])
+                closures[name] = closure
+            else:
+                stack.append((name, True))
+                stack.extend((imported, False) for imported in imports if imported not in closures)
+    return closures
+
+
+def _popcount(bits: int) -> int:
+    return bin(bits).count('1')
+
+
+# much faster, where available (Python 3.10+)
+if hasattr(int, 'bit_count'):
+    _popcount = int.bit_count  # noqa: F811
+
+
+def stage_shard(graph: ModuleGraph, shard: Shard, src_dir: Path, shard_src_dir: Path) -> None:
+    '''Symlink the modules staged by the shard into its own source directory.'''
+    for name in sorted(shard.staged_modules):
+        source = graph.paths[name]
+        target = shard_src_dir / source.relative_to(src_dir)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.symlink_to(source)
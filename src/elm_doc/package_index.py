@@ -0,0 +1,70 @@
+'''
+The list of all versions of all packages in the registry.
+
+It's fetched in bulk from /all-packages once, and after that kept up to date
+with /all-packages/since/N, which lists only the versions published after
+the first N, the way the Elm compiler does it. With it, the latest version
+of a package, and whether a cached release list is missing any version, are
+known without asking the registry about each package.
+'''
+from typing import Dict, List, Optional
+import time
+
+import attr
+
+from elm_doc.elm_project import ExactVersion, version_key
+from elm_doc.registry_backends import RegistryError
+
+
+ALL_PACKAGES_PATH = 'all-packages'
+
+
+def since_path(count: int) -> str:
+    return 'all-packages/since/{:d}'.format(count)
+
+
+@attr.s
+class PackageIndex:
+    packages = attr.ib()  # Dict[str, List[ExactVersion]], oldest version first
+    synced_at = attr.ib()  # float
+
+    def age(self) -> float:
+        return time.time() - self.synced_at
+
+    def count(self) -> int:
+        return sum(len(versions) for versions in self.packages.values())
+
+    def versions(self, package_name: str) -> List[ExactVersion]:
+        return self.packages.get(package_name, [])
+
+    def latest_version(self, package_name: str) -> Optional[ExactVersion]:
+        versions = self.versions(package_name)
+        return versions[-1] if versions else None
+
+    def with_new_versions(self, new_versions: List[str]) -> 'PackageIndex':
+        '''A copy with the "author/project@version" entries that /all-packages/since lists.'''
+        packages = {name: list(versions) for name, versions in self.packages.items()}
+        for entry in new_versions:
+            name, _, version = entry.partition('@')
+            versions = packages.setdefault(name, [])
+            if version not in versions:
+                versions.append(version)
+                versions.sort(key=version_key)
+        return PackageIndex(packages, time.time())
+
+
+def from_all_packages(data: Dict[str, List[ExactVersion]]) -> PackageIndex:
+    return PackageIndex({name: sorted(versions, key=version_key) for name, versions in data.items()},
+                        time.time())
+
+
+def sync(backend, index: Optional[PackageIndex]) -> PackageIndex:
+    '''Bring the index up to date with one request: the whole list if
+    there's no index yet, and only what's new otherwise.'''
+    data = backend.fetch(ALL_PACKAGES_PATH if index is None else since_path(index.count()))
+    try:
+        if index is None:
+            return from_all_packages(data)
+        return index.with_new_versions(data)
+    except (AttributeError, TypeError, ValueError) as e:
+        raise RegistryError('unexpected package list from the registry: {}'.format(e))
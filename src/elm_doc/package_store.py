@@ -0,0 +1,129 @@
+'''
+A content-addressed store of the files that are published along with the
+docs of each dependency: docs.json, elm.json and README.md.
+
+Files are ingested once per package version and content hash, and output
+directories get hardlinks or reflinks to them instead of copies, so that
+building docs into many output directories on one host, e.g. previews of
+many branches, costs about one copy per package version.
+
+Outputs are always replaced rather than written to, so that writing to
+one of them never modifies the store or any other output through a link.
+Stored files keep ordinary permissions, which hardlinked outputs share, so
+that outputs can be deployed over and deleted like any other file.
+'''
+from typing import Dict, Optional
+from pathlib import Path
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+
+import attr
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows, where reflinks aren't attempted
+    fcntl = None
+
+from elm_doc.elm_project import ElmPackage
+from elm_doc.utils import copy_atomically, write_atomically
+
+
+INDEX_FILENAME = 'index.json'
+# from linux/fs.h
+FICLONE = 0x40049409
+
+
+@attr.s
+class PackageStore:
+    path = attr.ib()  # Path
+
+    def materialize(self, package: ElmPackage, source: Path, target: Path) -> None:
+        '''Make target have the content of source, a file of the package.'''
+        entry = self.ingest(package, source)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        link_or_copy(entry, target)
+
+    def ingest(self, package: ElmPackage, source: Path) -> Path:
+        '''Add source to the store unless it's already there, and return its path in the store.
+        Published package versions don't change, so the content hash of a file is only
+        computed again if its size or mtime did.'''
+        package_dir = self.path / package.user / package.project / package.version
+        index = _load_index(package_dir / INDEX_FILENAME)
+        source_stat = source.stat()
+        fresh = {'source': str(source), 'size': source_stat.st_size, 'mtime': source_stat.st_mtime_ns}
+        cached = index.get(source.name)
+        if cached and all(cached.get(field) == value for field, value in fresh.items()):
+            entry = package_dir / '{}-{}'.format(cached['digest'], source.name)
+            if entry.is_file():
+                _make_writable(entry)
+                return entry
+
+        digest = hashlib.sha256(source.read_bytes()).hexdigest()
+        entry = package_dir / '{}-{}'.format(digest, source.name)
+        if not entry.is_file():
+            package_dir.mkdir(parents=True, exist_ok=True)
+            copy_atomically(source, entry)
+        index[source.name] = dict(fresh, digest=digest)
+        write_atomically(package_dir / INDEX_FILENAME, json.dumps(index, sort_keys=True).encode('utf8'))
+        return entry
+
+
+def open_store(cache_path: Optional[Path]) -> Optional[PackageStore]:
+    return PackageStore(cache_path / 'packages') if cache_path is not None else None
+
+
+def _load_index(path: Path) -> Dict[str, Dict]:
+    try:
+        with open(str(path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _make_writable(entry: Path) -> None:
+    # stores of earlier versions had read-only files, and so had outputs linked to them
+    mode = entry.stat().st_mode
+    if not mode & stat.S_IWUSR:
+        os.chmod(str(entry), mode | stat.S_IWUSR)
+
+
+def link_or_copy(entry: Path, target: Path) -> None:
+    '''Hardlink, reflink or, failing both, copy entry to a temporary path next to
+    target and move it in place, so that target is never written through.'''
+    tmp_path = _temporary_path(target)
+    try:
+        try:
+            os.link(str(entry), tmp_path)
+        except OSError:
+            # e.g. the store is on a different filesystem, or the entry has too many links
+            if not _reflink(entry, tmp_path):
+                shutil.copyfile(str(entry), tmp_path)
+        os.replace(tmp_path, str(target))
+    except BaseException:
+        if os.path.lexists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _reflink(source: Path, target: str) -> bool:
+    if fcntl is None:
+        return False
+    try:
+        with open(str(source), 'rb') as src, open(target, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except OSError:
+        # not supported by the filesystem, or across filesystems
+        return False
+
+
+def _temporary_path(target: Path) -> str:
+    fd, tmp_path = tempfile.mkstemp(dir=str(target.parent), prefix='.' + target.name)
+    os.close(fd)
+    os.unlink(tmp_path)
+    return tmp_path
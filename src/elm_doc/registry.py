@@ -0,0 +1,311 @@
+'''
+Lookups against the Elm package registry, or one of the stand-ins in
+registry_backends.
+
+Release lists are fetched concurrently over a shared, pooled HTTP session,
+and memoized for the lifetime of the registry object, so that a package is
+requested at most once per run however many projects or tasks ask for it.
+
+Across runs, release lists are kept in an SQLite database that any number
+of elm-doc processes can share. An entry is used as is until its TTL runs
+out, and after that still for looking up versions it already has: once a
+version is published, its release timestamp never changes.
+
+The list of all package versions is synced in bulk once per run (see
+package_index) and kept in the same database. Both are kept per registry
+URL, so that a mirror and package.elm-lang.org can share the database. Latest versions are looked up
+in it, and a cached release list that has every version it lists is used
+however old it is, so usually one small request replaces one per package.
+
+If the registry can't be reached, cached release lists are used however old
+they are, and versions without one get a fixed timestamp, as offline.
+
+Offline, the registry is never contacted: release lists come from the cache
+only, and latest versions from what the compiler has in ELM_HOME.
+'''
+from typing import Dict, Iterable, List, Optional
+from pathlib import Path
+from concurrent.futures import Future, ThreadPoolExecutor
+import contextlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+import attr
+import requests
+from cachecontrol.adapter import CacheControlAdapter
+
+from elm_doc import package_index
+from elm_doc.elm_project import ExactVersion, version_key
+from elm_doc.local_registry import LocalRegistry
+from elm_doc.package_index import PackageIndex
+from elm_doc.registry_backends import DEFAULT_REGISTRY_URL, CircuitOpenError, RegistryError, releases_path
+from elm_doc.utils import default_cache_dir
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 8
+DEFAULT_TTL = 60 * 60  # seconds
+DEFAULT_MAX_ENTRIES = 10000
+CACHE_FILENAME = 'registry.sqlite3'
+# bump this when the schema changes; older databases are discarded
+CACHE_SCHEMA_VERSION = 3
+# don't write to the database on every read just to bump an entry in the LRU order
+ACCESS_TIME_RESOLUTION = 60  # seconds
+
+
+def make_session(concurrency: int = DEFAULT_CONCURRENCY) -> requests.Session:
+    '''A caching session whose connection pool can serve `concurrency` requests at once.'''
+    session = requests.Session()
+    adapter = CacheControlAdapter(pool_connections=concurrency, pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def default_cache_path() -> Path:
+    return default_cache_dir() / CACHE_FILENAME
+
+
+@attr.s
+class CacheEntry:
+    releases = attr.ib()  # Dict[ExactVersion, int]
+    fetched_at = attr.ib()  # float
+
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+
+@attr.s
+class ReleasesCache:
+    path = attr.ib()  # Path
+    ttl = attr.ib(default=DEFAULT_TTL)  # float, seconds
+    max_entries = attr.ib(default=DEFAULT_MAX_ENTRIES)  # int
+    registry_url = attr.ib(default=DEFAULT_REGISTRY_URL)  # str
+
+    def get(self, package_name: str) -> Optional[CacheEntry]:
+        try:
+            with self._connect() as db:
+                row = db.execute(
+                    'SELECT releases, fetched_at, accessed_at FROM releases WHERE registry = ? AND package = ?',
+                    (self.registry_url, package_name)).fetchone()
+                if row is None:
+                    return None
+                releases, fetched_at, accessed_at = row
+                now = time.time()
+                if now - accessed_at > ACCESS_TIME_RESOLUTION:
+                    db.execute('UPDATE releases SET accessed_at = ? WHERE registry = ? AND package = ?',
+                               (now, self.registry_url, package_name))
+            return CacheEntry(json.loads(releases), fetched_at)
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning('could not read from the registry cache at %s: %s', self.path, e)
+            return None
+
+    def put(self, package_name: str, releases: Dict[ExactVersion, int]) -> None:
+        now = time.time()
+        try:
+            with self._connect() as db:
+                db.execute(
+                    'INSERT OR REPLACE INTO releases (registry, package, releases, fetched_at, accessed_at) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (self.registry_url, package_name, json.dumps(releases, sort_keys=True), now, now))
+                db.execute(
+                    'DELETE FROM releases WHERE rowid NOT IN '
+                    '(SELECT rowid FROM releases ORDER BY accessed_at DESC LIMIT ?)',
+                    (self.max_entries,))
+        except sqlite3.Error as e:
+            logger.warning('could not write to the registry cache at %s: %s', self.path, e)
+
+    def get_index(self) -> Optional[PackageIndex]:
+        try:
+            with self._connect() as db:
+                row = db.execute('SELECT packages, synced_at FROM package_index WHERE registry = ?',
+                                 (self.registry_url,)).fetchone()
+            if row is None:
+                return None
+            packages, synced_at = row
+            return PackageIndex(json.loads(packages), synced_at)
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning('could not read from the registry cache at %s: %s', self.path, e)
+            return None
+
+    def put_index(self, index: PackageIndex) -> None:
+        try:
+            with self._connect() as db:
+                db.execute('INSERT OR REPLACE INTO package_index (registry, packages, synced_at) VALUES (?, ?, ?)',
+                           (self.registry_url, json.dumps(index.packages, sort_keys=True), index.synced_at))
+        except sqlite3.Error as e:
+            logger.warning('could not write to the registry cache at %s: %s', self.path, e)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # the timeout is how long to wait for another process holding a write lock
+        db = sqlite3.connect(str(self.path), timeout=30)
+        try:
+            with db:
+                schema_version = db.execute('PRAGMA user_version').fetchone()[0]
+                if schema_version != CACHE_SCHEMA_VERSION:
+                    if schema_version != 0:
+                        db.execute('DROP TABLE IF EXISTS releases')
+                        db.execute('DROP TABLE IF EXISTS package_index')
+                    # another process may be creating them at the same time
+                    db.execute(
+                        'CREATE TABLE IF NOT EXISTS releases ('
+                        'registry TEXT NOT NULL, package TEXT NOT NULL, releases TEXT NOT NULL, '
+                        'fetched_at REAL NOT NULL, accessed_at REAL NOT NULL, '
+                        'PRIMARY KEY (registry, package))')
+                    db.execute(
+                        'CREATE TABLE IF NOT EXISTS package_index ('
+                        'registry TEXT PRIMARY KEY, packages TEXT NOT NULL, synced_at REAL NOT NULL)')
+                    db.execute('PRAGMA user_version = {:d}'.format(CACHE_SCHEMA_VERSION))
+                yield db
+        finally:
+            db.close()
+
+
+class Registry:
+    def __init__(self, backend, concurrency: int = DEFAULT_CONCURRENCY,
+                 cache: Optional[ReleasesCache] = None,
+                 local: Optional[LocalRegistry] = None, offline: bool = False):
+        '''`backend` is one of those in registry_backends.'''
+        self.backend = backend
+        self.concurrency = concurrency
+        self.cache = cache
+        self.local = local
+        self.offline = offline
+        self._releases = {}  # Dict[str, Future]
+        self._entries = {}  # Dict[str, Optional[CacheEntry]], read from the cache once per run
+        self._lock = threading.Lock()
+        self._executor = None  # Optional[ThreadPoolExecutor]
+        self._index = None  # Optional[PackageIndex]
+        self._index_synced = False
+        self._index_lock = threading.Lock()
+
+    def prefetch(self, package_names: Iterable[str],
+                 versions: Optional[Dict[str, List[ExactVersion]]] = None) -> None:
+        '''Start fetching the releases of all the given packages in the background,
+        except for those whose `versions` are all known already.'''
+        versions = versions or {}
+        for package_name in package_names:
+            if self._known_releases(package_name, versions.get(package_name)) is None:
+                self._fetch(package_name)
+
+    def releases(self, package_name: str,
+                 versions: Optional[List[ExactVersion]] = None) -> Dict[ExactVersion, int]:
+        '''Releases of the package. If the caller only needs some `versions`
+        and they're all known already, the registry isn't consulted.'''
+        known = self._known_releases(package_name, versions)
+        if known is not None:
+            return known
+        return self._fetch(package_name).result()
+
+    def latest_version(self, package_name: str) -> Optional[ExactVersion]:
+        if self.offline:
+            return self.local.latest_version(package_name) if self.local is not None else None
+        index = self.package_index()
+        if index is not None and index.versions(package_name):
+            return index.latest_version(package_name)
+        releases = self.releases(package_name)
+        return max(releases, key=version_key) if releases else None
+
+    def package_index(self) -> Optional[PackageIndex]:
+        '''All versions of all packages, synced with the registry at most once per
+        run and TTL. None if the registry can't list them and none were stored.'''
+        with self._index_lock:
+            if not self._index_synced:
+                self._index = self._sync_index()
+                self._index_synced = True
+            return self._index
+
+    def close(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _sync_index(self) -> Optional[PackageIndex]:
+        stored = self.cache.get_index() if self.cache is not None else None
+        if self.offline or (stored is not None and stored.age() < self.cache.ttl):
+            return stored
+        try:
+            index = package_index.sync(self.backend, stored)
+        except RegistryError as e:
+            # e.g. a mirror of only some packages; releases are then looked up one by one
+            logger.info('could not sync the list of all packages: %s', e)
+            return stored
+        if self.cache is not None:
+            self.cache.put_index(index)
+        return index
+
+    def _is_complete(self, package_name: str, releases: Dict[ExactVersion, int]) -> bool:
+        '''Whether releases has every version of the package that the registry lists.'''
+        index = self.package_index()
+        versions = index.versions(package_name) if index is not None else []
+        return bool(versions) and all(version in releases for version in versions)
+
+    def _known_releases(self, package_name: str,
+                        versions: Optional[List[ExactVersion]]) -> Optional[Dict[ExactVersion, int]]:
+        if self.cache is None:
+            return None
+        if versions is None:
+            index = self.package_index()
+            versions = index.versions(package_name) if index is not None else []
+            if not versions:
+                return None
+        with self._lock:
+            future = self._releases.get(package_name)
+        if future is not None and future.done() and future.exception() is None:
+            releases = future.result()
+        else:
+            entry = self._cached_entry(package_name)
+            if entry is None:
+                return None
+            releases = entry.releases
+        return releases if all(version in releases for version in versions) else None
+
+    def _cached_entry(self, package_name: str) -> Optional[CacheEntry]:
+        with self._lock:
+            if package_name in self._entries:
+                return self._entries[package_name]
+        entry = self.cache.get(package_name)
+        with self._lock:
+            return self._entries.setdefault(package_name, entry)
+
+    def _fetch(self, package_name: str) -> Future:
+        with self._lock:
+            future = self._releases.get(package_name)
+            if future is None:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.concurrency)
+                future = self._executor.submit(self._lookup, package_name)
+                self._releases[package_name] = future
+            return future
+
+    def _lookup(self, package_name: str) -> Dict[ExactVersion, int]:
+        entry = self._cached_entry(package_name) if self.cache is not None else None
+        if entry is not None and (self.offline or entry.age() < self.cache.ttl
+                                  or self._is_complete(package_name, entry.releases)):
+            return entry.releases
+        if self.offline:
+            # callers fall back to a fixed timestamp for versions without one
+            return {}
+        try:
+            releases = self.backend.fetch(releases_path(package_name))
+        except CircuitOpenError:
+            # already warned about when the circuit opened
+            return entry.releases if entry is not None else {}
+        except RegistryError as e:
+            if entry is None:
+                # as offline, callers fall back to a fixed timestamp
+                logger.warning('could not fetch releases of %s: %s', package_name, e)
+                return {}
+            logger.warning('could not fetch releases of %s; using ones from %d seconds ago',
+                           package_name, entry.age())
+            return entry.releases
+        if self.cache is not None:
+            self.cache.put(package_name, releases)
+        return releases
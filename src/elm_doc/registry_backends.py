@@ -0,0 +1,226 @@
+'''
+Where package registry responses come from.
+
+A backend answers requests for paths of the package registry, like
+packages/elm/core/releases.json, with their decoded JSON content:
+
+- HttpBackend asks a registry over HTTP, package.elm-lang.org by default.
+  Every request has a timeout, retries come out of one budget for the
+  whole build, and a circuit breaker stops asking after repeated failures,
+  so that a slow or unreachable registry delays a build by a bounded time.
+- MirrorBackend reads files laid out like the registry from a directory.
+  The output directory of elm-doc is one, for the packages it documents.
+- CassetteBackend records the responses of another backend to a file, or
+  replays them from it without contacting anything, for hermetic builds
+  and benchmarks with predictable latency.
+'''
+from typing import Any, Dict, Optional
+from pathlib import Path
+from urllib.parse import urlsplit
+from urllib.request import url2pathname
+import json
+import logging
+import threading
+import time
+
+import requests
+from retrying import Retrying
+
+from elm_doc.utils import write_atomically
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REGISTRY_URL = 'https://package.elm-lang.org'
+DEFAULT_TIMEOUT = 10  # seconds, per request
+DEFAULT_RETRIES = 10  # for the whole build
+DEFAULT_FAILURE_THRESHOLD = 5  # consecutive failures
+DEFAULT_RETRY_WAIT = 0.5  # seconds, doubled on every attempt
+MAX_RETRY_WAIT = 8  # seconds
+CASSETTE_MODES = ('record', 'replay')
+BULK_PATH_PREFIX = 'all-packages'
+
+
+class RegistryError(Exception):
+    '''The backend could not answer: the registry is unreachable, or doesn't have the path.'''
+    pass
+
+
+class CircuitOpenError(RegistryError):
+    pass
+
+
+class RetryBudget:
+    '''Retries that all requests of a build draw from, so that a failing
+    registry costs at most this many retries, not this many per package.'''
+
+    def __init__(self, retries: int):
+        self.remaining = retries
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self._lock:
+            if self.remaining <= 0:
+                return False
+            self.remaining -= 1
+            return True
+
+
+class CircuitBreaker:
+    '''Opens after `threshold` failures in a row. While open, requests fail
+    right away; after `cooldown` seconds one is let through to try again.'''
+
+    def __init__(self, threshold: int, cooldown: float = 30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None  # Optional[float]
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self.opened_at is not None and time.monotonic() - self.opened_at < self.cooldown
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    logger.warning('the package registry failed %d times in a row; '
+                                   'using cached or fallback data for now', self.failures)
+                self.opened_at = time.monotonic()
+
+
+def releases_path(package_name: str) -> str:
+    return 'packages/{}/releases.json'.format(package_name)
+
+
+def _is_transient(e: Exception) -> bool:
+    # there's no point in asking again for a package that doesn't exist
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        return e.response.status_code >= 500
+    return isinstance(e, requests.RequestException)
+
+
+class HttpBackend:
+    def __init__(self, session: requests.Session, url: str = DEFAULT_REGISTRY_URL,
+                 timeout: float = DEFAULT_TIMEOUT,
+                 retry_budget: Optional[RetryBudget] = None,
+                 breaker: Optional[CircuitBreaker] = None,
+                 retry_wait: float = DEFAULT_RETRY_WAIT):
+        self.session = session
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+        self.retry_budget = retry_budget or RetryBudget(DEFAULT_RETRIES)
+        self.breaker = breaker or CircuitBreaker(DEFAULT_FAILURE_THRESHOLD)
+        self.retrying = Retrying(
+            retry_on_exception=self._should_retry,
+            wait_exponential_multiplier=retry_wait * 1000,  # Wait 2^x * retry_wait seconds between each retry,
+            wait_exponential_max=MAX_RETRY_WAIT * 1000)  # up to MAX_RETRY_WAIT seconds
+
+    def fetch(self, path: str) -> Any:
+        try:
+            # the bulk package lists only answer POST requests, as the compiler makes them
+            return self.retrying.call(self._get, '{}/{}'.format(self.url, path), post=path.startswith(BULK_PATH_PREFIX))
+        except (requests.RequestException, ValueError) as e:
+            raise RegistryError('could not fetch {} from {}: {}'.format(path, self.url, e))
+
+    def _should_retry(self, e: Exception) -> bool:
+        return _is_transient(e) and not self.breaker.is_open and self.retry_budget.take()
+
+    def _get(self, url: str, post: bool = False) -> Any:
+        if self.breaker.is_open:
+            raise CircuitOpenError('not asking {} after {} failures in a row'.format(url, self.breaker.failures))
+        try:
+            if post:
+                response = self.session.post(url, timeout=self.timeout)
+            else:
+                response = self.session.get(url, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+        except Exception as e:
+            if _is_transient(e):
+                self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return data
+
+
+class MirrorBackend:
+    def __init__(self, path: Path):
+        self.path = path
+
+    def fetch(self, path: str) -> Any:
+        file_path = self.path / path
+        try:
+            with open(str(file_path)) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise RegistryError('could not read {}: {}'.format(file_path, e))
+
+
+class CassetteBackend:
+    '''In record mode, responses of `backend` are saved to the cassette as they
+    come in. In replay mode, only the cassette is consulted.'''
+
+    def __init__(self, path: Path, backend=None):
+        self.path = path
+        self.backend = backend
+        self._lock = threading.Lock()
+        if backend is None:
+            self._responses = _load_cassette(path)
+        else:
+            # start from what was recorded before, so that a run can add to a cassette
+            self._responses = _load_cassette(path) if path.is_file() else {}
+
+    @property
+    def recording(self) -> bool:
+        return self.backend is not None
+
+    def fetch(self, path: str) -> Any:
+        if not self.recording:
+            if path not in self._responses:
+                raise RegistryError('{} was not recorded in {}'.format(path, self.path))
+            return self._responses[path]
+        data = self.backend.fetch(path)
+        with self._lock:
+            self._responses[path] = data
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            write_atomically(self.path, json.dumps(self._responses, indent=1, sort_keys=True).encode('utf8'))
+        return data
+
+
+def make_backend(session: requests.Session, url: Optional[str] = None,
+                 cassette_path: Optional[Path] = None, cassette_mode: str = 'replay',
+                 timeout: float = DEFAULT_TIMEOUT, retries: int = DEFAULT_RETRIES,
+                 failure_threshold: int = DEFAULT_FAILURE_THRESHOLD):
+    '''`url` may be an http(s) URL, a file URL or a directory.'''
+    url = url or DEFAULT_REGISTRY_URL
+    scheme = urlsplit(url).scheme
+    if scheme in ('http', 'https'):
+        backend = HttpBackend(session, url, timeout=timeout, retry_budget=RetryBudget(retries),
+                              breaker=CircuitBreaker(failure_threshold))
+    elif scheme == 'file':
+        backend = MirrorBackend(Path(url2pathname(urlsplit(url).path)))
+    else:
+        backend = MirrorBackend(Path(url))
+
+    if cassette_path is None:
+        return backend
+    if cassette_mode == 'record':
+        return CassetteBackend(cassette_path, backend)
+    return CassetteBackend(cassette_path)
+
+
+def _load_cassette(path: Path) -> Dict[str, Any]:
+    try:
+        with open(str(path)) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        raise RegistryError('could not read the registry cassette at {}: {}'.format(path, e))
@@ -5,6 +5,22 @@ import attr
 class RunConfig:
     elm_path = attr.ib()  # Path
     build_path = attr.ib()  # Path
+    cache_path = attr.ib(default=None, kw_only=True)  # Optional[Path]
+    shards = attr.ib(default=1, kw_only=True)  # int
+    staging = attr.ib(default='copy', kw_only=True)  # str, one of source_mirror.STAGING_MODES
+    jobs = attr.ib(default=1, kw_only=True)  # int
+    http_concurrency = attr.ib(default=8, kw_only=True)  # int
+    registry_ttl = attr.ib(default=60 * 60, kw_only=True)  # int, seconds
+    offline = attr.ib(default=False, kw_only=True)  # bool
+    registry_url = attr.ib(default=None, kw_only=True)  # Optional[str], package.elm-lang.org if None
+    registry_cassette = attr.ib(default=None, kw_only=True)  # Optional[Path]
+    cassette_mode = attr.ib(default='replay', kw_only=True)  # str, one of registry_backends.CASSETTE_MODES
+    registry_timeout = attr.ib(default=10, kw_only=True)  # float, seconds per request
+    registry_retries = attr.ib(default=10, kw_only=True)  # int, for the whole build
+    registry_failures = attr.ib(default=5, kw_only=True)  # int, in a row before giving up on the registry
+    only_imported_dependencies = attr.ib(default=False, kw_only=True)  # bool
+    batch_page_tasks = attr.ib(default=False, kw_only=True)  # bool, one task per package instead of per page
+    spa_fallback = attr.ib(default=False, kw_only=True)  # bool, only the root page; servers fall back to it
 
 
 @attr.s
@@ -0,0 +1,254 @@
+'''
+A local HTTP server for previewing generated docs.
+
+Every page of the package site is the same HTML shell; the Elm app does the
+routing. So instead of reading one of thousands of page files from disk,
+page routes are answered with the shell rendered once in memory. Everything
+else is served from the output directory with ETags, and compressed with
+gzip when the client accepts it.
+'''
+from typing import Dict, Optional, Tuple
+from pathlib import Path
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import unquote, urlsplit
+import gzip
+import hashlib
+import io
+import mimetypes
+import posixpath
+import threading
+
+from elm_doc.tasks import html as html_tasks
+
+
+# assets and artifacts only change when elm-doc itself is upgraded
+LONG_LIVED_PREFIXES = ('assets/', 'artifacts/')
+LONG_LIVED_CACHE_CONTROL = 'public, max-age=31536000'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+# files under packages/ that are not pages: docs.json, elm.json, releases.json, README.md
+DATA_FILE_SUFFIXES = ('.json', '.md')
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'image/svg+xml')
+MIN_COMPRESS_SIZE = 1024
+# docs.json files are several megabytes each, so the caches are bounded by size
+FILE_CACHE_BYTES = 64 * 1024 * 1024
+GZIP_CACHE_BYTES = 16 * 1024 * 1024
+
+mimetypes.add_type('application/javascript', '.js')
+mimetypes.add_type('font/woff2', '.woff2')
+mimetypes.add_type('text/markdown', '.md')
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: Tuple[str, int], output_path: Path, mount_point: str):
+        super().__init__(address, Handler)
+        self.output_path = output_path
+        self.mount_point = mount_point.rstrip('/')
+        shell = html_tasks._render(mount_point=mount_point).encode('utf8')
+        self.shell = Resource(shell, 'text/html; charset=utf-8', _etag_for_bytes(shell))
+        self.file_cache = LruCache(FILE_CACHE_BYTES)
+        self.gzip_cache = GzipCache(GZIP_CACHE_BYTES)
+
+
+class Resource:
+    def __init__(self, body: bytes, content_type: str, etag: str):
+        self.body = body
+        self.content_type = content_type
+        self.etag = etag
+
+
+class LruCache:
+    '''The most recently used values, up to a total size in bytes. A value
+    bigger than a quarter of that isn't kept at all.'''
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries = {}  # Dict[Hashable, Tuple[Any, int]], least recently used first
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return None
+            self.entries[key] = entry
+            return entry[0]
+
+    def put(self, key, value, size: int) -> None:
+        if size > self.max_bytes // 4:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self.entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = _pop_oldest(self.entries)
+                self.size -= evicted_size
+
+
+def _pop_oldest(entries: Dict):
+    key = next(iter(entries))
+    return key, entries.pop(key)
+
+
+class GzipCache:
+    '''Compressed bodies by ETag, so that each file is compressed once.'''
+
+    def __init__(self, max_bytes: int):
+        self.cache = LruCache(max_bytes)
+
+    def get(self, resource: Resource) -> bytes:
+        compressed = self.cache.get(resource.etag)
+        if compressed is None:
+            compressed = _gzip(resource.body)
+            self.cache.put(resource.etag, compressed, len(compressed))
+        return compressed
+
+
+class Handler(BaseHTTPRequestHandler):
+    # keep connections open across requests, as browsers expect
+    protocol_version = 'HTTP/1.1'
+    server_version = 'elm-doc'
+
+    def do_GET(self):
+        self._respond(include_body=True)
+
+    def do_HEAD(self):
+        self._respond(include_body=False)
+
+    def _respond(self, include_body: bool):
+        route = self._route()
+        if route is None:
+            self._send_error(HTTPStatus.NOT_FOUND, include_body)
+            return
+
+        resource, cache_control = self._resolve(route)
+        if resource is None:
+            self._send_error(HTTPStatus.NOT_FOUND, include_body)
+            return
+
+        headers = {
+            'ETag': resource.etag,
+            'Cache-Control': cache_control,
+            'Vary': 'Accept-Encoding',
+        }
+        if resource.etag in _parse_etags(self.headers.get('If-None-Match', '')):
+            self._send(HTTPStatus.NOT_MODIFIED, headers, b'', include_body)
+            return
+
+        body = resource.body
+        headers['Content-Type'] = resource.content_type
+        if self._accepts_gzip() and _compressible(resource):
+            body = self.server.gzip_cache.get(resource)
+            headers['Content-Encoding'] = 'gzip'
+        self._send(HTTPStatus.OK, headers, body, include_body)
+
+    def _route(self) -> Optional[str]:
+        '''Path relative to the mount point, or None if outside of it.'''
+        path = posixpath.normpath(unquote(urlsplit(self.path).path))
+        mount_point = self.server.mount_point
+        if mount_point:
+            if path == mount_point:
+                return ''
+            if not path.startswith(mount_point + '/'):
+                return None
+            path = path[len(mount_point):]
+        return path.lstrip('/')
+
+    def _resolve(self, route: str) -> Tuple[Optional[Resource], str]:
+        if _is_page(route):
+            return self.server.shell, REVALIDATE_CACHE_CONTROL
+        file_path = self.server.output_path / route
+        resource = _load_file(file_path, self.server.file_cache)
+        if resource is None:
+            return None, REVALIDATE_CACHE_CONTROL
+        if route.startswith(LONG_LIVED_PREFIXES):
+            return resource, LONG_LIVED_CACHE_CONTROL
+        return resource, REVALIDATE_CACHE_CONTROL
+
+    def _accepts_gzip(self) -> bool:
+        encodings = self.headers.get('Accept-Encoding', '')
+        return any(encoding.split(';')[0].strip() == 'gzip' for encoding in encodings.split(','))
+
+    def _send(self, status: HTTPStatus, headers: Dict[str, str], body: bytes, include_body: bool):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if status != HTTPStatus.NOT_MODIFIED:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if include_body and status != HTTPStatus.NOT_MODIFIED:
+            self.wfile.write(body)
+
+    def _send_error(self, status: HTTPStatus, include_body: bool):
+        body = '{} {}\n'.format(status.value, status.phrase).encode('utf8')
+        self._send(status, {'Content-Type': 'text/plain; charset=utf-8'}, body, include_body)
+
+
+def _is_page(route: str) -> bool:
+    '''Pages are the site root, help pages and everything under packages
+    that isn't a data file: package, version, module and about pages.'''
+    if route in ('', 'index.html'):
+        return True
+    first, _, _ = route.partition('/')
+    if first not in ('packages', 'help'):
+        return False
+    return posixpath.splitext(route)[1] not in DATA_FILE_SUFFIXES
+
+
+def _load_file(file_path: Path, cache: LruCache) -> Optional[Resource]:
+    try:
+        stat = file_path.stat()
+    except OSError:
+        return None
+    if not file_path.is_file():
+        return None
+    etag = '"{:x}-{:x}"'.format(stat.st_size, stat.st_mtime_ns)
+    # keyed by etag too, so that a file that changed on disk is read again
+    key = (str(file_path), etag)
+    resource = cache.get(key)
+    if resource is None:
+        resource = _read_file(str(file_path), etag)
+        cache.put(key, resource, len(resource.body))
+    return resource
+
+
+def _read_file(path: str, etag: str) -> Resource:
+    with open(path, 'rb') as f:
+        body = f.read()
+    content_type, _ = mimetypes.guess_type(path)
+    if content_type is None:
+        content_type = 'application/octet-stream'
+    elif content_type.startswith('text/'):
+        content_type += '; charset=utf-8'
+    return Resource(body, content_type, etag)
+
+
+def _compressible(resource: Resource) -> bool:
+    return len(resource.body) >= MIN_COMPRESS_SIZE and resource.content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def _gzip(body: bytes) -> bytes:
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0) as f:
+        f.write(body)
+    return buffer.getvalue()
+
+
+def _etag_for_bytes(body: bytes) -> str:
+    return '"{}"'.format(hashlib.sha1(body).hexdigest())
+
+
+def _parse_etags(header: str):
+    return {etag.strip() for etag in header.split(',') if etag.strip()}
+
+
+def make_server(output_path: Path, mount_point: str = '', host: str = '127.0.0.1', port: int = 8000) -> Server:
+    return Server((host, port), output_path, mount_point)
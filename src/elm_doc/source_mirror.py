@@ -0,0 +1,148 @@
+'''
+Mirror the Elm source files of a project into a single directory.
+
+Only files that could be an Elm module are mirrored: files ending in .elm
+whose path relative to the source directory is a valid module name. This
+skips elm-stuff, node_modules, the build directory itself and so on.
+
+A manifest of (size, mtime, hash) of every mirrored source file is kept in
+the target directory so that subsequent runs only copy what changed.
+
+Files can be staged as copies, or, to save I/O and disk space, as symlinks
+or hardlinks to the source. Port modules are always copied, because they
+get rewritten in place afterwards.
+'''
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from pathlib import Path
+import hashlib
+import json
+import os
+import shutil
+
+import attr
+
+from elm_doc import elm_parser
+from elm_doc.elm_project import module_name_re
+from elm_doc.utils import write_atomically
+
+
+MANIFEST_FILENAME = '.elm-doc-manifest.json'
+MANIFEST_VERSION = 2
+
+COPY = 'copy'
+SYMLINK = 'symlink'
+HARDLINK = 'hardlink'
+STAGING_MODES = [COPY, SYMLINK, HARDLINK]
+
+
+@attr.s
+class SyncResult:
+    changed = attr.ib(factory=set)  # Set[Path], paths in the target directory
+    removed = attr.ib(factory=set)  # Set[Path], paths in the target directory
+
+
+def sync(source_dirs: List[Path], target_dir: Path, mode: str = COPY,
+         only: Optional[Set[Path]] = None) -> SyncResult:
+    '''Make target_dir contain the Elm files of all source_dirs. If the same
+    module exists in more than one source directory, the first one wins.
+    If `only` is given, source files not in it are left out.'''
+    manifest_path = target_dir / MANIFEST_FILENAME
+    manifest = _load_manifest(manifest_path)
+    new_manifest = {}
+    result = SyncResult()
+
+    for rel_path, source in iter_elm_files(source_dirs):
+        key = str(rel_path)
+        if key in new_manifest or (only is not None and source not in only):
+            continue
+        target = target_dir / rel_path
+        entry, changed = _sync_file(source, target, manifest.get(key), mode)
+        new_manifest[key] = entry
+        if changed:
+            result.changed.add(target)
+
+    for existing in list(target_dir.glob('**/*.elm')):
+        if str(existing.relative_to(target_dir)) not in new_manifest:
+            existing.unlink()
+            result.removed.add(existing)
+    for directory in {path.parent for path in result.removed}:
+        _remove_empty_dirs(directory, target_dir)
+
+    if new_manifest != manifest:
+        target_dir.mkdir(parents=True, exist_ok=True)
+        data = {'version': MANIFEST_VERSION, 'files': new_manifest}
+        write_atomically(manifest_path, json.dumps(data, sort_keys=True).encode('utf8'))
+    return result
+
+
+def iter_elm_files(source_dirs: List[Path]) -> Iterator[Tuple[Path, Path]]:
+    '''Yield (path relative to its source directory, path) of candidate Elm modules.'''
+    for source_dir in source_dirs:
+        for dirpath, dirnames, filenames in os.walk(str(source_dir)):
+            # prune directories that can't be part of a module name
+            dirnames[:] = sorted(name for name in dirnames if module_name_re.match(name))
+            rel_dir = Path(dirpath).relative_to(source_dir)
+            for filename in sorted(filenames):
+                stem, ext = os.path.splitext(filename)
+                if ext == '.elm' and module_name_re.match(stem):
+                    yield rel_dir / filename, Path(dirpath) / filename
+
+
+def _sync_file(source: Path, target: Path, entry: Optional[Dict], mode: str) -> Tuple[Dict, bool]:
+    stat = source.stat()
+    fresh = {'source': str(source), 'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'mode': mode}
+    target_exists = os.path.lexists(str(target))
+    if entry and target_exists and _same_stat(entry, fresh):
+        return entry, False
+
+    digest = _file_digest(source)
+    fresh['digest'] = digest
+    if entry and target_exists and _same_stat(entry, fresh, fields=('source', 'mode', 'digest')):
+        return fresh, False
+
+    # never write through an existing link: that would modify the source
+    if target_exists:
+        target.unlink()
+    else:
+        target.parent.mkdir(parents=True, exist_ok=True)
+    _stage(source, target, mode)
+    return fresh, True
+
+
+def _stage(source: Path, target: Path, mode: str) -> None:
+    if mode != COPY and not elm_parser.is_port_module(source):
+        if mode == SYMLINK:
+            target.symlink_to(source)
+            return
+        try:
+            os.link(str(source), str(target))
+            return
+        except OSError:
+            # e.g. the build directory is on a different filesystem
+            pass
+    shutil.copy2(str(source), str(target))
+
+
+def _same_stat(entry: Dict, fresh: Dict, fields=('source', 'mode', 'size', 'mtime')) -> bool:
+    return all(entry.get(field) == fresh[field] for field in fields)
+
+
+def _file_digest(path: Path) -> str:
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+
+def _load_manifest(path: Path) -> Dict[str, Dict]:
+    try:
+        with open(str(path)) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get('version') != MANIFEST_VERSION:
+        return {}
+    return data['files']
+
+
+def _remove_empty_dirs(directory: Path, stop_at: Path) -> None:
+    while directory != stop_at and directory.is_dir() and not any(directory.iterdir()):
+        directory.rmdir()
+        directory = directory.parent
@@ -1,8 +1,10 @@
 from . import assets
 from . import catalog
+from . import elm_home
 from . import html
 from . import package
 from . import project
+from . import spa_fallback
 
 
-__all__ = ['assets', 'catalog', 'html', 'package', 'project']
+__all__ = ['assets', 'catalog', 'elm_home', 'html', 'package', 'project', 'spa_fallback']
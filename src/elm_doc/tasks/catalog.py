@@ -3,14 +3,15 @@ from pathlib import Path
 import json
 
 import attr
-from requests import Session
 from doit.tools import config_changed
 
-from elm_doc.elm_project import ElmPackage, ExactVersion, fetch_releases
+from elm_doc.elm_project import ElmPackage, ElmProject, ExactVersion
+from elm_doc.registry import Registry
 from elm_doc.run_config import Build
 from elm_doc.tasks import assets as assets_tasks
 from elm_doc.tasks import html as html_tasks
-from elm_doc.utils import Namespace
+from elm_doc.tasks import spa_fallback as spa_fallback_tasks
+from elm_doc.utils import Namespace, write_atomically
 
 
 popular_packages = [
@@ -21,18 +22,42 @@ popular_packages = [
     'elm/url',
     'elm/http',
 ]
+# the popular packages resolved by the last build, in the build directory
+POPULAR_PACKAGES_FILENAME = 'popular-packages.json'
 
 
 def missing_popular_packages(
-        session: Session,
+        registry: Registry,
         package_names: List[str]) -> Iterator[Tuple[str, ExactVersion]]:
-    missing_names = set(popular_packages) - set(package_names)
+    missing_names = sorted(set(popular_packages) - set(package_names))
+    if not registry.offline and registry.package_index() is None:
+        # latest versions have to come from the release list of each package
+        registry.prefetch(missing_names)
     for missing_name in missing_names:
-        releases = fetch_releases(session, missing_name)
-        latest_version = sorted(releases.keys())[-1]
+        latest_version = registry.latest_version(missing_name)
+        if latest_version is None:
+            # offline and not downloaded by the compiler
+            continue
         yield (missing_name, latest_version)
 
 
+def load_popular_packages(build_path: Path) -> List[Tuple[str, ExactVersion]]:
+    try:
+        with open(str(build_path / POPULAR_PACKAGES_FILENAME)) as f:
+            return [tuple(entry) for entry in json.load(f)]
+    except (OSError, ValueError):
+        return []
+
+
+def with_popular_packages(project: ElmProject, build_path: Path) -> ElmProject:
+    '''A copy of the project that also depends on the popular packages that the
+    last build resolved. Resolving them means asking the registry, so it's left
+    to the build action instead of being done every time tasks are created.'''
+    project = attr.evolve(project, direct_dependencies=dict(project.direct_dependencies))
+    project.add_direct_dependencies(load_popular_packages(build_path))
+    return project
+
+
 @attr.s
 class SearchEntry:
     name = attr.ib()  # str
@@ -51,6 +76,14 @@ class SearchEntry:
 
 
 class actions(Namespace):
+    def resolve_popular_packages(registry: Registry, project: ElmProject, build_path: Path):
+        popular = sorted(missing_popular_packages(registry, list(project.direct_dependency_names())))
+        content = json.dumps(popular).encode('utf8')
+        path = build_path / POPULAR_PACKAGES_FILENAME
+        # leave the file alone when nothing changed, for whatever depends on it
+        if not path.is_file() or path.read_bytes() != content:
+            write_atomically(path, content)
+
     def write_search_json(entries: List[SearchEntry], output_path: Path):
         with open(str(output_path), 'w') as f:
             json.dump([attr.asdict(entry) for entry in entries], f)
@@ -58,12 +91,13 @@ class actions(Namespace):
 
 def create_catalog_tasks(packages: List[ElmPackage], run_config: Build):
     page_flags = {'mount_point': run_config.mount_point}
+    page_args = dict(page_flags, cache_path=run_config.cache_path)
 
     # index
     index_path = run_config.output_path / 'index.html'
     yield {
         'basename': 'index',
-        'actions': [(html_tasks.actions.write, (index_path,), page_flags)],
+        'actions': [(html_tasks.actions.write, (index_path,), page_args)],
         'targets': [index_path],
         'uptodate': [config_changed(page_flags)],
     }
@@ -78,6 +112,11 @@ def create_catalog_tasks(packages: List[ElmPackage], run_config: Build):
         'uptodate': [config_changed({'entries': [attr.asdict(entry) for entry in search_entries]})],
     }
 
+    if run_config.spa_fallback:
+        # the root page is the only one; servers fall back to it for the others
+        yield from spa_fallback_tasks.create_fallback_tasks(run_config)
+        return
+
     # help pages
     for help_file in assets_tasks.bundled_helps:
         url_path = Path(help_file).relative_to('assets').with_suffix('')
@@ -85,7 +124,7 @@ def create_catalog_tasks(packages: List[ElmPackage], run_config: Build):
         yield {
             'basename': 'help',
             'name': url_path,
-            'actions': [(html_tasks.actions.write, (help_output_path,), page_flags)],
+            'actions': [(html_tasks.actions.write, (help_output_path,), page_args)],
             'targets': [help_output_path],
             'file_dep': [run_config.output_path / help_file],
             'uptodate': [config_changed(page_flags)],
@@ -0,0 +1,104 @@
+'''
+Tasks for documenting every package that the compiler has downloaded into
+ELM_HOME, as a mirror of the package site.
+
+A project has tens of dependencies, but ELM_HOME can have thousands of
+package versions. So instead of a task per page, each version gets one
+task that writes all of its files, and each package one for the files its
+versions share. A version stays up to date as long as its files in ELM_HOME
+do, so a run after more packages were downloaded only does work for those.
+'''
+from typing import Dict, Iterator, List
+import logging
+
+from doit.tools import config_changed
+
+from elm_doc.elm_home_index import ElmHomeIndex
+from elm_doc.elm_project import ElmPackage, ExactVersion
+from elm_doc.registry import Registry
+from elm_doc.run_config import Build
+from elm_doc.tasks import catalog as catalog_tasks
+from elm_doc.tasks import html as html_tasks
+from elm_doc.tasks import package as package_tasks
+
+
+logger = logging.getLogger(__name__)
+
+
+def documentable_versions(index: ElmHomeIndex) -> Dict[str, List[ExactVersion]]:
+    '''Versions of each package in ELM_HOME that the compiler generated docs for.'''
+    all_versions = {}
+    skipped = 0
+    for name in index.package_names():
+        versions = index.versions(name)
+        documented = [version for version in versions if index.docs_path(name, version) is not None]
+        skipped += len(versions) - len(documented)
+        if documented:
+            all_versions[name] = documented
+    if skipped:
+        logger.info('skipping %d package versions without docs.json; '
+                    'the compiler generates it when it builds a package', skipped)
+    return all_versions
+
+
+def create_elm_home_tasks(registry: Registry, index: ElmHomeIndex, run_config: Build) -> Iterator[Dict]:
+    all_versions = documentable_versions(index)
+    page_flags = {'mount_point': run_config.mount_point}
+    latest_packages = []  # List[ElmPackage]
+
+    for name, versions in sorted(all_versions.items()):
+        for version in versions:
+            package = index.package(name, version)
+            yield _create_version_task(package, run_config, page_flags)
+        latest_packages.append(package)
+        yield _create_package_task(registry, package, versions, all_versions, run_config, page_flags)
+    index.save()
+
+    yield from catalog_tasks.create_catalog_tasks(latest_packages, run_config)
+
+
+def _create_version_task(package: ElmPackage, run_config: Build, page_flags: Dict) -> Dict:
+    package_output_path = package_tasks.package_docs_root(run_config.output_path, package)
+    with_pages = not run_config.spa_fallback
+    file_dep = [package.path / filename for filename in [package.DOCS_FILENAME, package.DESCRIPTION_FILENAME]]
+    readme = package.path / 'README.md'
+    if readme.is_file():
+        file_dep.append(readme)
+    return {
+        'basename': 'package_version',
+        'name': '{}/{}'.format(package.name, package.version),
+        'actions': [(package_tasks.actions.write_package_version,
+                     (package, run_config.output_path, run_config.mount_point, run_config.cache_path, with_pages))],
+        # the pages aren't listed, so that thousands of versions don't make for a huge task graph
+        'targets': [package_output_path / package.DOCS_FILENAME],
+        'file_dep': file_dep,
+        'uptodate': [config_changed(dict(page_flags, with_pages=with_pages))],
+    }
+
+
+def _create_package_task(registry: Registry, latest: ElmPackage, versions: List[ExactVersion],
+                         all_versions: Dict[str, List[ExactVersion]], run_config: Build, page_flags: Dict) -> Dict:
+    latest_output_path = package_tasks.package_docs_root(run_config.output_path, latest)
+    package_output_path = latest_output_path.parent
+    releases_path = package_output_path / 'releases.json'
+    versions_page_path = package_output_path / 'index.html'
+    with_pages = not run_config.spa_fallback
+    page_args = dict(page_flags, cache_path=run_config.cache_path)
+    task_actions = [
+        (package_tasks.actions.write_dependency_releases,
+         (registry, latest.name, releases_path, versions, all_versions)),
+        (package_tasks.actions.link_latest_package_dir, (package_output_path / 'latest', latest_output_path)),
+    ]
+    targets = [releases_path]
+    if with_pages:
+        task_actions.insert(0, (html_tasks.actions.write, (versions_page_path,), page_args))
+        targets.insert(0, versions_page_path)
+    return {
+        'basename': 'package',
+        'name': latest.name,
+        'actions': task_actions,
+        'targets': targets,
+        # a new version changes the releases and where latest points to
+        'uptodate': [config_changed(dict(page_flags, versions=versions, with_pages=with_pages)),
+                     (package_tasks.releases_complete, (releases_path,))],
+    }
@@ -1,8 +1,29 @@
+'''
+Every page of the site is the same shell that boots the Elm app, which then
+renders what the URL points to; the shell only depends on the mount point.
+
+With a cache directory, it's rendered once per mount point into a
+content-addressed file there, and pages are hardlinks to it, or copies where
+a link can't be made, e.g. across filesystems, as with the package store.
+Without one, each page is written on its own. Either way, pages are replaced
+rather than written to, so writing one page never changes the others.
+'''
+from typing import List, Optional
+import hashlib
 import json
 import html
+import logging
+import stat
+import threading
 from pathlib import Path
 
-from elm_doc.utils import Namespace
+from elm_doc.package_store import link_or_copy
+from elm_doc.utils import Namespace, write_atomically
+
+
+logger = logging.getLogger(__name__)
+
+SHELLS_DIRNAME = 'pages'
 
 
 # Note: title tag is omitted, as the Elm app sets the title after
@@ -50,8 +71,51 @@ def _render(mount_point: str = ''):
         init=json.dumps(init))
 
 
+_shells = {}  # Dict[Tuple[Path, str], Path], by cache directory and mount point
+_shells_lock = threading.Lock()
+
+
+def _shell(cache_path: Path, mount_point: str = '') -> Optional[Path]:
+    '''Path of the rendered page for the mount point in the cache directory,
+    written on first use. None if it can't be written, in which case each page
+    is written on its own.'''
+    shells_dir = cache_path / SHELLS_DIRNAME
+    key = (shells_dir, mount_point)
+    with _shells_lock:
+        if key in _shells:
+            return _shells[key]
+        content = _render(mount_point=mount_point).encode('utf8')
+        shell = shells_dir / '{}.html'.format(hashlib.sha256(content).hexdigest())
+        try:
+            # earlier versions made it read-only, and so the pages linked to it
+            if not _is_writable_file(shell):
+                shells_dir.mkdir(parents=True, exist_ok=True)
+                write_atomically(shell, content)
+        except OSError as e:
+            logger.warning('could not write the page shell to %s: %s', shell, e)
+            shell = None
+        _shells[key] = shell
+        return shell
+
+
+def _is_writable_file(path: Path) -> bool:
+    try:
+        return bool(path.stat().st_mode & stat.S_IWUSR)
+    except OSError:
+        return False
+
+
 class actions(Namespace):
-    def write(output_path: Path, mount_point: str = ''):
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(str(output_path), 'w') as f:
-            f.write(_render(mount_point=mount_point))
+    def write(output_path: Path, mount_point: str = '', cache_path: Optional[Path] = None):
+        actions.write_pages([output_path], mount_point=mount_point, cache_path=cache_path)
+
+    def write_pages(output_paths: List[Path], mount_point: str = '', cache_path: Optional[Path] = None):
+        '''Write the page to each of the paths, as links to one copy in `cache_path` if given.'''
+        shell = _shell(cache_path, mount_point) if cache_path is not None else None
+        content = _render(mount_point=mount_point).encode('utf8') if shell is None else None
+        for output_path in output_paths:
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            if shell is not None:
+                link_or_copy(shell, output_path)
+            else:
+                write_atomically(output_path, content)
@@ -1,25 +1,60 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 import time
 import enum
 from pathlib import Path
 import json
-import shutil
 
 from doit.tools import create_folder, config_changed
-from requests import Session
 
-from elm_doc.elm_project import ElmPackage, ModuleName, fetch_releases
+from elm_doc.elm_project import ElmPackage, ExactVersion, ModuleName, version_key
+from elm_doc.package_store import PackageStore, open_store
+from elm_doc.registry import Registry
 from elm_doc.run_config import Build
 from elm_doc.tasks import html as html_tasks
-from elm_doc.utils import Namespace
+from elm_doc.utils import Namespace, copy_atomically
+
+
+# release time written for versions the registry couldn't tell about
+UNKNOWN_RELEASE_TIME = 1
 
 
 class actions(Namespace):
-    def write_package_releases(output_path: Path, version: str, timestamp: int):
-        releases = {version: timestamp}
+    def write_package_releases(output_path: Path, releases: Dict[ExactVersion, int]):
         with open(str(output_path), 'w') as f:
             json.dump(releases, f)
 
+    def write_project_releases(output_path: Path, version: ExactVersion):
+        actions.write_package_releases(output_path, {version: int(time.time())})
+
+    def write_dependency_releases(
+            registry: Registry,
+            package_name: str,
+            output_path: Path,
+            versions: List[ExactVersion],
+            all_versions: Optional[Dict[str, List[ExactVersion]]] = None):
+        # the first of these actions to run looks up everything that's
+        # needed at once; the rest find their releases already fetched
+        if all_versions:
+            registry.prefetch(sorted(all_versions), all_versions)
+        releases = registry.releases(package_name, versions=versions)
+        actions.write_package_releases(
+            output_path, {version: releases.get(version, UNKNOWN_RELEASE_TIME) for version in versions})
+
+    def write_package_version(package: ElmPackage, output_path: Path, mount_point: str,
+                              cache_path: Optional[Path] = None, with_pages: bool = True):
+        '''All the files of one version of a dependency at once: its docs.json,
+        elm.json and README, and its pages unless `with_pages` is false.'''
+        store = open_store(cache_path)
+        package_output_path = package_docs_root(output_path, package)
+        package_output_path.mkdir(parents=True, exist_ok=True)
+        actions.copy_package_docs_json(package, package_output_path / package.DOCS_FILENAME, store)
+        for filename in [package.DESCRIPTION_FILENAME, 'README.md']:
+            actions.copy_package_file(package.path / filename, package_output_path / filename, package, store)
+        if with_pages:
+            html_tasks.actions.write_pages(
+                package_page_paths(package_output_path, package.sorted_exposed_modules()),
+                mount_point=mount_point, cache_path=cache_path)
+
     def link_latest_package_dir(output_path: Path, package_dir: Path):
         package_dir.mkdir(parents=True, exist_ok=True)
         # prefer relative path to make the built documentation directory relocatable
@@ -27,13 +62,22 @@ class actions(Namespace):
             output_path.unlink()
         output_path.symlink_to(package_dir.relative_to(output_path.parent), target_is_directory=True)
 
-    def copy_package_file(package_file: Path, output_path: Path):
-        if package_file.is_file():
-            shutil.copy(str(package_file), str(output_path))
+    def copy_package_file(package_file: Path, output_path: Path,
+                          package: Optional[ElmPackage] = None, store: Optional[PackageStore] = None):
+        if not package_file.is_file():
+            return
+        if store is not None:
+            store.materialize(package, package_file, output_path)
+        else:
+            # a previous run with a store may have left a link to it there
+            copy_atomically(package_file, output_path)
 
-    def copy_package_docs_json(package: ElmPackage, output_path: Path):
+    def copy_package_docs_json(package: ElmPackage, output_path: Path, store: Optional[PackageStore] = None):
         source = package.path / package.DOCS_FILENAME
-        shutil.copy(str(source), str(output_path))
+        if store is not None:
+            store.materialize(package, source, output_path)
+        else:
+            copy_atomically(source, output_path)
 
 
 class Context(enum.Enum):
@@ -55,55 +99,89 @@ def _package_task_name(package):
     return '{}/{}'.format(package.name, package.version)
 
 
-def create_dependency_tasks(session: Session, package: ElmPackage, run_config: Build):
+def create_dependency_tasks(
+        registry: Registry,
+        package: ElmPackage,
+        run_config: Build,
+        versions: Optional[List[ExactVersion]] = None,
+        all_versions: Optional[Dict[str, List[ExactVersion]]] = None):
+    '''`versions` are all the versions of this package that are being
+    documented, if there are more than this one, and `all_versions` those
+    of all dependencies, whose releases are looked up together.'''
     task_name = _package_task_name(package)
     package_modules = package.sorted_exposed_modules()
     package_output_path = package_docs_root(run_config.output_path, package)
 
+    if run_config.batch_page_tasks:
+        yield _create_batched_package_task(
+            Context.Dependency, registry, package, package_modules, run_config,
+            versions=versions, all_versions=all_versions)
+        return
+
     # package docs.json
     docs_json_path = package_output_path / package.DOCS_FILENAME
+    store = open_store(run_config.cache_path)
     yield {
         'basename': Context.Dependency.basename('copy_docs_json'),
         'name': task_name,
         'actions': [(create_folder, (str(package_output_path),)),
-                    (actions.copy_package_docs_json, (package, docs_json_path))],
+                    (actions.copy_package_docs_json, (package, docs_json_path, store))],
         'targets': [docs_json_path],
         'file_dep': [package.path / package.DOCS_FILENAME]
     }
 
     yield from create_package_page_tasks(
-        Context.Dependency, session, package, package_modules, run_config)
+        Context.Dependency, registry, package, package_modules, run_config,
+        versions=versions, all_versions=all_versions)
 
 
 def create_package_page_tasks(
         context: Context,
-        session: Session,
+        registry: Registry,
         package: ElmPackage,
         package_modules: List[ModuleName],
-        run_config: Build):
+        run_config: Build,
+        versions: Optional[List[ExactVersion]] = None,
+        all_versions: Optional[Dict[str, List[ExactVersion]]] = None):
+    if run_config.batch_page_tasks:
+        yield _create_batched_package_task(
+            context, registry, package, package_modules, run_config,
+            versions=versions, all_versions=all_versions)
+        return
+
     task_name = _package_task_name(package)
+    versions = sorted(versions or [package.version], key=version_key)
+    # pages shared by all versions are created along with the latest one
+    is_latest = package.version == versions[-1]
     package_output_path = package_docs_root(run_config.output_path, package)
     page_flags = {'mount_point': run_config.mount_point}
+    page_args = dict(page_flags, cache_path=run_config.cache_path)
+    # the files of a project change without its (fake) version changing
+    store = open_store(run_config.cache_path) if context == Context.Dependency else None
+    # with a fallback to the root page, the server answers for pages that aren't there
+    with_pages = not run_config.spa_fallback
 
     # package index page
     package_index_output = package_output_path / 'index.html'
-    yield {
-        'basename': context.basename('top_page'),
-        'name': task_name,
-        'actions': [(html_tasks.actions.write, (package_index_output,), page_flags)],
-        'targets': [package_index_output],
-        'uptodate': [config_changed(page_flags)],
-    }
+    if with_pages:
+        yield {
+            'basename': context.basename('top_page'),
+            'name': task_name,
+            'actions': [(html_tasks.actions.write, (package_index_output,), page_args)],
+            'targets': [package_index_output],
+            'uptodate': [config_changed(page_flags)],
+        }
 
     # package versions page
     package_versions_output = package_output_path.parent / 'index.html'
-    yield {
-        'basename': context.basename('versions_page'),
-        'name': task_name,
-        'actions': [(html_tasks.actions.write, (package_versions_output,), page_flags)],
-        'targets': [package_versions_output],
-        'uptodate': [config_changed(page_flags)],
-    }
+    if is_latest and with_pages:
+        yield {
+            'basename': context.basename('versions_page'),
+            'name': task_name,
+            'actions': [(html_tasks.actions.write, (package_versions_output,), page_args)],
+            'targets': [package_versions_output],
+            'uptodate': [config_changed(page_flags)],
+        }
 
     # package elm.json
     elm_json_filename = 'elm.json'
@@ -113,7 +191,7 @@ def create_package_page_tasks(
         yield {
             'basename': context.basename('elm_json'),
             'name': task_name,
-            'actions': [(actions.copy_package_file, (package_elm_json, output_elm_json_path))],
+            'actions': [(actions.copy_package_file, (package_elm_json, output_elm_json_path, package, store))],
             'targets': [output_elm_json_path],
             'file_dep': [package_elm_json],
         }
@@ -126,44 +204,54 @@ def create_package_page_tasks(
         yield {
             'basename': context.basename('readme'),
             'name': task_name,
-            'actions': [(actions.copy_package_file, (package_readme, output_readme_path))],
+            'actions': [(actions.copy_package_file, (package_readme, output_readme_path, package, store))],
             'targets': [output_readme_path],
             'file_dep': [package_readme],
         }
 
     # package releases
     package_releases_output = package_output_path.parent / 'releases.json'
-    if context == Context.Dependency:
-        releases = fetch_releases(session, package.name)
-        timestamp = releases.get(package.version, 1)
-    else:
-        timestamp = int(time.time())
-    content = {'version': package.version, 'timestamp': timestamp}
-    yield {
-        'basename': context.basename('releases'),
-        'name': task_name,
-        'actions': [(actions.write_package_releases, (package_releases_output,), content)],
-        'targets': [package_releases_output],
-        'uptodate': [config_changed(content)]
-    }
+    if is_latest:
+        # releases are looked up when the file is written, not when the task is created,
+        # so that a build where nothing changed doesn't talk to the registry at all
+        content = {'versions': versions}
+        if context == Context.Dependency:
+            releases_action = (actions.write_dependency_releases,
+                               (registry, package.name, package_releases_output, versions, all_versions))
+        else:
+            releases_action = (actions.write_project_releases, (package_releases_output, package.version))
+        uptodate = [config_changed(content)]
+        if context == Context.Dependency:
+            uptodate.append((releases_complete, (package_releases_output,)))
+        yield {
+            'basename': context.basename('releases'),
+            'name': task_name,
+            'actions': [releases_action],
+            'targets': [package_releases_output],
+            'uptodate': uptodate,
+        }
 
     # link from /latest
     latest_path = package_output_path.parent / 'latest'
     uptodate_config = {'link_target': str(package_output_path.relative_to(run_config.output_path))}
-    yield {
-        'basename': context.basename('latest_link'),
-        'name': task_name,
-        'actions': [(actions.link_latest_package_dir, (latest_path, package_output_path))],
-        'targets': [latest_path],
-        'uptodate': [config_changed(uptodate_config)]
-    }
+    if is_latest:
+        yield {
+            'basename': context.basename('latest_link'),
+            'name': task_name,
+            'actions': [(actions.link_latest_package_dir, (latest_path, package_output_path))],
+            'targets': [latest_path],
+            'uptodate': [config_changed(uptodate_config)]
+        }
+
+    if not with_pages:
+        return
 
     # package about
     output_about_path = package_output_path / 'about'
     yield {
         'basename': context.basename('about'),
         'name': task_name,
-        'actions': [(html_tasks.actions.write, (output_about_path,), page_flags)],
+        'actions': [(html_tasks.actions.write, (output_about_path,), page_args)],
         'targets': [output_about_path],
         'uptodate': [config_changed(page_flags)],
     }
@@ -174,11 +262,101 @@ def create_package_page_tasks(
         yield {
             'basename': context.basename('module_page'),
             'name': '{}:{}'.format(task_name, module_name),
-            'actions': [(html_tasks.actions.write, (module_output,), page_flags)],
+            'actions': [(html_tasks.actions.write, (module_output,), page_args)],
             'targets': [module_output],
             'uptodate': [config_changed(page_flags)],
         }
 
 
+def _create_batched_package_task(
+        context: Context,
+        registry: Registry,
+        package: ElmPackage,
+        package_modules: List[ModuleName],
+        run_config: Build,
+        versions: Optional[List[ExactVersion]] = None,
+        all_versions: Optional[Dict[str, List[ExactVersion]]] = None) -> Dict:
+    '''The same files as the tasks above, written by one task. doit spends
+    more time loading and checking a task than it takes to write a page,
+    so a package with hundreds of modules is better off with one task whose
+    up-to-date check covers all of its pages.'''
+    versions = sorted(versions or [package.version], key=version_key)
+    is_latest = package.version == versions[-1]
+    package_output_path = package_docs_root(run_config.output_path, package)
+    page_flags = {'mount_point': run_config.mount_point}
+    page_args = dict(page_flags, cache_path=run_config.cache_path)
+    with_pages = not run_config.spa_fallback
+    file_dep = [package.path / filename for filename in [package.DESCRIPTION_FILENAME, 'README.md']
+                if (package.path / filename).is_file()]
+
+    if context == Context.Dependency:
+        docs_json_path = package_output_path / package.DOCS_FILENAME
+        task_actions = [(actions.write_package_version,
+                         (package, run_config.output_path, run_config.mount_point,
+                          run_config.cache_path, with_pages))]
+        targets = [docs_json_path]
+        file_dep.append(package.path / package.DOCS_FILENAME)
+    else:
+        # the files of a project change without its (fake) version changing
+        task_actions = [(create_folder, (str(package_output_path),))]
+        task_actions.extend(
+            (actions.copy_package_file, (package_file, package_output_path / package_file.name))
+            for package_file in file_dep)
+        targets = []
+        if with_pages:
+            task_actions.append((html_tasks.actions.write_pages,
+                                 (package_page_paths(package_output_path, package_modules),), page_args))
+            targets.append(package_output_path / 'index.html')
+
+    uptodate_config = dict(page_flags, modules=package_modules, with_pages=with_pages)
+    uptodate = []
+    if is_latest:
+        package_versions_output = package_output_path.parent / 'index.html'
+        package_releases_output = package_output_path.parent / 'releases.json'
+        if context == Context.Dependency:
+            releases_action = (actions.write_dependency_releases,
+                               (registry, package.name, package_releases_output, versions, all_versions))
+        else:
+            releases_action = (actions.write_project_releases, (package_releases_output, package.version))
+        if with_pages:
+            task_actions.append((html_tasks.actions.write, (package_versions_output,), page_args))
+            targets.append(package_versions_output)
+        task_actions.extend([
+            releases_action,
+            (actions.link_latest_package_dir, (package_output_path.parent / 'latest', package_output_path)),
+        ])
+        targets.append(package_releases_output)
+        uptodate_config['versions'] = versions
+        if context == Context.Dependency:
+            uptodate.append((releases_complete, (package_releases_output,)))
+
+    return {
+        'basename': context.basename('package'),
+        'name': _package_task_name(package),
+        'actions': task_actions,
+        'targets': targets,
+        'file_dep': file_dep,
+        'uptodate': [config_changed(uptodate_config)] + uptodate,
+    }
+
+
+def releases_complete(releases_path: Path) -> bool:
+    '''Whether the releases file has a time for every version. A file written
+    while the registry couldn't be reached (offline, or after too many
+    failures) is rewritten on the next build, when it may be reachable again.'''
+    try:
+        with open(str(releases_path)) as f:
+            releases = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return UNKNOWN_RELEASE_TIME not in releases.values()
+
+
+def package_page_paths(package_output_path: Path, package_modules: List[ModuleName]) -> List[Path]:
+    '''The top, about and module pages of a version of a package.'''
+    return [package_output_path / 'index.html', package_output_path / 'about'] + [
+        package_output_path / module_name.replace('.', '-') for module_name in package_modules]
+
+
 def package_docs_root(output_path: Optional[Path], package: ElmPackage) -> Path:
     return output_path / 'packages' / package.user / package.project / package.version
@@ -1,19 +1,26 @@
-from typing import List, Optional
-import os.path
+from typing import List, Optional, Set
 from pathlib import Path
 from collections import ChainMap
+from concurrent.futures import ThreadPoolExecutor
 import json
+import shutil
+import subprocess
 
 from click import BadParameter
-from requests import Session
-from doit.action import CmdAction
+from doit.action import CmdAction, PythonAction
+from doit.exceptions import TaskFailed
 from doit.tools import create_folder, config_changed
 
 from elm_doc import elm_project
 from elm_doc import elm_codeshift
-from elm_doc import elm_parser
+from elm_doc import docs_cache
+from elm_doc import module_graph
+from elm_doc import source_mirror
 from elm_doc.elm_project import ElmPackage, ElmProject, ProjectConfig, ModuleName
-from elm_doc.run_config import RunConfig, Validate
+from elm_doc.local_registry import LocalRegistry
+from elm_doc.registry import Registry
+from elm_doc.run_config import Build, RunConfig, Validate
+from elm_doc.tasks import catalog as catalog_tasks
 from elm_doc.tasks import package as package_tasks
 from elm_doc.utils import Namespace
 
@@ -23,7 +30,10 @@ class actions(Namespace):
             project: ElmProject,
             project_config: ProjectConfig,
             project_modules: List[ModuleName],
-            build_path: Path):
+            build_path: Path,
+            with_popular_packages: bool = False):
+        if with_popular_packages:
+            project = catalog_tasks.with_popular_packages(project, build_path)
         elm_project_with_exposed_modules = dict(ChainMap(
             {'exposed-modules': [module for module in project_modules]},
             project.as_package(project_config).as_json(),
@@ -32,36 +42,170 @@ class actions(Namespace):
         with open(str(elm_json_path), 'w') as f:
             json.dump(elm_project_with_exposed_modules, f)
 
-    def run_elm_codeshift(src_dir: Path):
-        for elm_file_path in src_dir.glob('**/*.elm'):
-            if elm_parser.is_port_module(elm_file_path):
-                elm_codeshift.strip_ports_from_file(elm_file_path)
+    def run_elm_codeshift(src_dir: Path,
+                          manifest_path: Optional[Path] = None,
+                          jobs: int = 1):
+        '''Strip ports from port modules in src_dir. All files are looked at, not
+        just those the last sync copied: if a previous run was interrupted, the
+        sync doesn't copy its unstripped files again. If a manifest path is given,
+        sources seen in a previous run are not classified or parsed again, and
+        files that were stripped already are left alone.'''
+        elm_file_paths = sorted(src_dir.glob('**/*.elm'))
+        manifest = elm_codeshift.CodeshiftManifest.load(manifest_path) if manifest_path else None
+        try:
+            elm_codeshift.strip_ports_from_files(elm_file_paths, manifest=manifest, jobs=jobs)
+        except elm_codeshift.CodeshiftError as e:
+            # make the next sync copy these files again instead of
+            # treating the unstripped copies as up to date
+            for elm_file_path, _ in e.failures:
+                elm_file_path.unlink()
+            raise
+        finally:
+            if manifest:
+                manifest.save()
 
     def validate_elm_path(elm_path: Optional[Path]):
         if not elm_path:
             raise BadParameter('please specify the elm executable to use with --elm-path')
 
     class ElmMake(CmdAction):
-        def __init__(self, elm_path: Path, build_path: Path, output_path: Path):
-            command = [str(elm_path), 'make', '--docs', str(output_path), '--output', '/dev/null']
+        '''Run `elm make --docs` on the fake package in the build directory.
+
+        With more than one shard, the exposed modules are split into groups that
+        are staged and compiled concurrently, each in its own directory under
+        build_path/shards, and the resulting docs.json files are merged.
+        '''
+
+        def __init__(self, elm_path: Path, build_path: Path, output_path: Path, shards: int = 1):
+            command = _elm_make_docs_command(elm_path, output_path)
             super().__init__(command, cwd=str(build_path), shell=False)
+            self.elm_path = elm_path
+            self.build_path = build_path
+            self.output_path = output_path
+            self.shards = shards
+
+        def execute(self, out=None, err=None):
+            if self.shards > 1:
+                return self._execute_in_shards(out, err)
+            return super().execute(out=out, err=err)
+
+        def _execute_in_shards(self, out, err):
+            src_dir = self.build_path / 'src'
+            with open(str(self.build_path / ElmPackage.DESCRIPTION_FILENAME)) as f:
+                elm_json = json.load(f)
+            index = module_graph.ModuleIndex.load(
+                self.build_path / 'shards' / module_graph.INDEX_FILENAME)
+            graph = index.scan([src_dir])
+            shards = module_graph.partition_into_shards(graph, elm_json['exposed-modules'], self.shards)
+            if len(shards) <= 1:
+                return super().execute(out=out, err=err)
+
+            shard_paths = []
+            for i, shard in enumerate(shards):
+                shard_path = self.build_path / 'shards' / str(i)
+                shard_src_dir = shard_path / 'src'
+                shutil.rmtree(str(shard_src_dir), ignore_errors=True)
+                shard_src_dir.mkdir(parents=True)
+                module_graph.stage_shard(graph, shard, src_dir, shard_src_dir)
+                with open(str(shard_path / ElmPackage.DESCRIPTION_FILENAME), 'w') as f:
+                    json.dump(dict(elm_json, **{'exposed-modules': shard.exposed_modules}), f)
+                shard_paths.append(shard_path)
+
+            def compile_shard(shard_path):
+                command = _elm_make_docs_command(self.elm_path, shard_path / ElmProject.DOCS_FILENAME)
+                return subprocess.run(
+                    command, cwd=str(shard_path), universal_newlines=True,
+                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+            with ThreadPoolExecutor(max_workers=len(shard_paths)) as executor:
+                results = list(executor.map(compile_shard, shard_paths))
+
+            # report output in shard order regardless of which shard finished first
+            self.out = ''.join(result.stdout for result in results)
+            self.err = ''.join(result.stderr for result in results)
+            self.result = self.out + self.err
+            if out:
+                out.write(self.out)
+            if err:
+                err.write(self.err)
+
+            failed = [str(shard_path) for shard_path, result in zip(shard_paths, results)
+                      if result.returncode != 0]
+            if failed:
+                return TaskFailed('elm make failed in shards: {}'.format(', '.join(failed)))
+
+            merge_docs_json(
+                [shard_path / ElmProject.DOCS_FILENAME for shard_path in shard_paths],
+                self.output_path)
+
+    class CachedElmMake(ElmMake):
+        '''Restore docs.json from a content-addressed cache if the compiler has seen
+        the exact same inputs before and the dependencies it would download are
+        in ELM_HOME already, and store its output otherwise.
+        '''
 
-    class SyncSources(CmdAction):
+        def __init__(self, elm_path: Path, build_path: Path, output_path: Path,
+                     project: ElmProject, cache: docs_cache.DocsCache, shards: int = 1):
+            super().__init__(elm_path, build_path, output_path, shards=shards)
+            self.project = project
+            self.cache = cache
+
+        def execute(self, out=None, err=None):
+            key = docs_cache.compute_key(
+                self.project, self.build_path, docs_cache.elm_compiler_version(self.elm_path))
+            packages_dir = LocalRegistry.for_elm_version(self.project.elm_version).packages_dir
+            if docs_cache.dependencies_installed(self.build_path, packages_dir) \
+               and self.cache.restore(key, self.output_path):
+                self.out = self.err = self.result = ''
+                return None
+
+            failure = super().execute(out=out, err=err)
+            if failure is None:
+                self.cache.store(key, self.output_path)
+            return failure
+
+    class SyncSources(PythonAction):
         '''Copy source files to a single directory. This meets the requirement of Elm
         that a package project can only have a single source directory and gives
         us an isolated environment so that Elm can run in parallel with any invocation
         of Elm within the actual project.
+
+        Only files that changed since the previous sync are copied. If `only` is
+        given, source files not in it are not copied.
         '''
 
-        def __init__(self, project: ElmProject, target_directory: Path):
-            sources = ['{}/./'.format(os.path.normpath(source_dir))
-                       for source_dir in project.source_directories]
-            command = ['rsync', '-a', '--delete', '--recursive', '--ignore-errors'] + sources + [str(target_directory)]
-            super().__init__(command, cwd=str(project.path), shell=False)
+        def __init__(self, project: ElmProject, target_directory: Path,
+                     mode: str = source_mirror.COPY, only: Optional[Set[Path]] = None):
+            self.project = project
+            self.target_directory = target_directory
+            self.mode = mode
+            self.only = only
+            super().__init__(self.sync)
+
+        def sync(self):
+            source_dirs = [self.project.path / source_dir
+                           for source_dir in self.project.source_directories]
+            source_mirror.sync(source_dirs, self.target_directory, mode=self.mode, only=self.only)
+
+
+def _elm_make_docs_command(elm_path: Path, output_path: Path) -> List[str]:
+    return [str(elm_path), 'make', '--docs', str(output_path), '--output', '/dev/null']
+
+
+def merge_docs_json(docs_paths: List[Path], output_path: Path) -> None:
+    '''Concatenate the module docs in each docs.json, ordered by module name
+    like the compiler orders them, and write them out in the compiler's format.'''
+    modules = []
+    for docs_path in docs_paths:
+        with open(str(docs_path)) as f:
+            modules.extend(json.load(f))
+    modules.sort(key=lambda module: module['name'].encode('utf8'))
+    with open(str(output_path), 'w') as f:
+        json.dump(modules, f, ensure_ascii=False, separators=(',', ':'))
 
 
 def create_main_project_tasks(
-        session: Session,
+        registry: Registry,
         project: ElmProject,
         project_config: ProjectConfig,
         run_config: RunConfig):
@@ -71,27 +215,56 @@ def create_main_project_tasks(
     project_as_package = project.as_package(project_config)
     file_dep = [run_config.elm_path] if run_config.elm_path else []
     file_dep.extend([module.path for module in project_modules])
+
+    # when only some of the modules are documented, stage just them and what they
+    # import, so that the rest of a large code base doesn't cost anything
+    staged_paths = None
+    if project_config.include_paths or project_config.exclude_modules \
+       or project_config.exclude_source_directories:
+        graph = module_graph.load_project_graph(project, run_config.build_path)
+        staged_modules = graph.import_closure([module.name for module in project_modules])
+        staged_paths = {graph.paths[name] for name in staged_modules}
+        staged_paths.update(module.path for module in project_modules)
+        file_dep.extend(sorted(staged_paths - set(file_dep)))
     uptodate_config = {'elm_json': project_as_package.as_json()}
 
     build_src_dir = run_config.build_path / 'src'
+    # popular packages are there to be browsed, not because anything imports them
+    with_popular_packages = isinstance(run_config, Build) and not run_config.only_imported_dependencies
     docs_actions = [
         (create_folder, (str(run_config.build_path),)),
+    ]
+    if with_popular_packages:
+        # so that the compiler downloads them for the dependency docs
+        docs_actions.append((catalog_tasks.actions.resolve_popular_packages, (
+            registry, project, run_config.build_path)))
+    docs_actions += [
         (actions.write_project_elm_json, (
             project,
             project_config,
             [module.name for module in project_modules],
             run_config.build_path,
+            with_popular_packages,
         )),
         (create_folder, (str(build_src_dir),)),
-        actions.SyncSources(project, build_src_dir),
-        (actions.run_elm_codeshift, (build_src_dir,)),
+        actions.SyncSources(project, build_src_dir, mode=run_config.staging, only=staged_paths),
+        (actions.run_elm_codeshift, (
+            build_src_dir, run_config.build_path / 'codeshift', run_config.jobs)),
         (actions.validate_elm_path, (run_config.elm_path,)),
     ]
 
+    def elm_make(docs_path: Path):
+        if run_config.cache_path is None:
+            return actions.ElmMake(
+                run_config.elm_path, run_config.build_path, docs_path, shards=run_config.shards)
+        return actions.CachedElmMake(
+            run_config.elm_path, run_config.build_path, docs_path,
+            project, docs_cache.DocsCache(run_config.cache_path / 'docs'), shards=run_config.shards)
+
     if isinstance(run_config, Validate):
         # don't update the final artifact; write to build dir instead
         docs_path = run_config.build_path / project.DOCS_FILENAME
-        docs_actions.append(actions.ElmMake(run_config.elm_path, run_config.build_path, docs_path))
+        docs_actions.append(elm_make(docs_path))
         yield {
             'basename': 'validate_docs_json',
             'name': task_name,
@@ -107,7 +280,7 @@ def create_main_project_tasks(
         run_config.output_path, project_as_package)
     docs_actions.insert(0, (create_folder, (str(project_output_path),)))
     docs_path = project_output_path / project.DOCS_FILENAME
-    docs_actions.append(actions.ElmMake(run_config.elm_path, run_config.build_path, docs_path))
+    docs_actions.append(elm_make(docs_path))
 
     yield {
         'basename': 'build_docs_json',
@@ -120,7 +293,7 @@ def create_main_project_tasks(
 
     yield from package_tasks.create_package_page_tasks(
         package_tasks.Context.Project,
-        session,
+        registry,
         project_as_package,
         [module.name for module in project_modules],
         run_config)
@@ -0,0 +1,80 @@
+'''
+Server configurations for serving the docs without page files.
+
+The Elm app does its own routing, so every page is the same shell as the
+index.html at the root of the output. With spa_fallback, no other page
+files are written, and the server answers requests for paths that aren't
+files with the root page instead. These are the rewrite rules for that, for
+servers that read them from the output directory (Apache, Netlify and
+Cloudflare Pages), and a snippet to include in an nginx server block. The
+snippet is written next to the output directory rather than in it, so that
+deploying the output doesn't publish the server configuration.
+'''
+from typing import Dict, Iterator
+from pathlib import Path
+
+from doit.tools import config_changed
+
+from elm_doc.run_config import Build
+from elm_doc.utils import Namespace, write_atomically
+
+
+NGINX_TEMPLATE = '''\
+# elm-doc: include in the server block that serves the docs at {mount_point}/
+location {mount_point}/ {{
+    try_files $uri {mount_point}/index.html;
+}}
+'''
+
+HTACCESS_TEMPLATE = '''\
+# elm-doc: serve the root page for every path that isn't a file
+RewriteEngine On
+RewriteCond %{{REQUEST_FILENAME}} !-f
+RewriteRule ^ {mount_point}/index.html [L]
+'''
+
+# a rewrite, not a redirect, and files that exist are served as they are
+REDIRECTS_TEMPLATE = '''\
+{mount_point}/*    {mount_point}/index.html    200
+'''
+
+CONFIG_TEMPLATES = {
+    'nginx.conf': NGINX_TEMPLATE,
+    '.htaccess': HTACCESS_TEMPLATE,
+    '_redirects': REDIRECTS_TEMPLATE,
+}
+# configs that the server reads from the output directory
+SERVED_CONFIGS = {'.htaccess', '_redirects'}
+
+
+def render_configs(mount_point: str = '') -> Dict[str, str]:
+    '''Content of each config file by its name.'''
+    mount_point = mount_point.rstrip('/')
+    return {filename: template.format(mount_point=mount_point)
+            for filename, template in CONFIG_TEMPLATES.items()}
+
+
+class actions(Namespace):
+    def write_config(output_path: Path, content: str):
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomically(output_path, content.encode('utf8'))
+
+
+def config_path(output_path: Path, filename: str) -> Path:
+    '''Where to write the config: in the output directory if the server reads it
+    from there, else next to it, e.g. docs.nginx.conf for an output named docs.'''
+    if filename in SERVED_CONFIGS:
+        return output_path / filename
+    return output_path.parent / '{}.{}'.format(output_path.name, filename)
+
+
+def create_fallback_tasks(run_config: Build) -> Iterator[dict]:
+    for filename, content in sorted(render_configs(run_config.mount_point).items()):
+        output_path = config_path(run_config.output_path, filename)
+        yield {
+            'basename': 'server_config',
+            'name': filename,
+            'actions': [(actions.write_config, (output_path, content))],
+            'targets': [output_path],
+            'uptodate': [config_changed(content)],
+        }
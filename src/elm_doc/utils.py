@@ -1,4 +1,13 @@
 from types import FunctionType
+from pathlib import Path
+import os
+import shutil
+import tempfile
+
+
+# read once, before any threads start, since reading it means setting it
+_umask = os.umask(0)
+os.umask(_umask)
 
 
 class NamespaceMeta(type):
@@ -10,3 +19,43 @@ class NamespaceMeta(type):
 
 class Namespace:
     __metaclass__ = NamespaceMeta
+
+
+def default_cache_dir() -> Path:
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return Path(cache_home) / 'elm-doc'
+
+
+def copy_atomically(source: Path, target: Path) -> None:
+    '''Copy to a temporary file next to `target` and move it in place. This
+    replaces rather than writes through target, in case it's a link. The copy
+    gets the mode of source, as with shutil.copy.'''
+    fd, tmp_path = tempfile.mkstemp(dir=str(target.parent), prefix='.' + target.name)
+    os.close(fd)
+    try:
+        shutil.copyfile(str(source), tmp_path)
+        shutil.copymode(str(source), tmp_path)
+        os.replace(tmp_path, str(target))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def default_file_mode() -> int:
+    '''Mode of a file created with open(), which temporary files don't get.'''
+    return 0o666 & ~_umask
+
+
+def write_atomically(path: Path, content: bytes) -> None:
+    '''Write to a temporary file next to `path` and move it in place, so that
+    concurrent readers never see a partially written file. The file gets the
+    same mode as one written with open().'''
+    fd, tmp_path = tempfile.mkstemp(dir=str(path.parent), prefix='.' + path.name)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.chmod(tmp_path, default_file_mode())
+        os.replace(tmp_path, str(path))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -0,0 +1,176 @@
+'''
+Watch the sources of a project for changes.
+
+On Linux, inotify is used through ctypes; elsewhere, or if inotify is not
+available, source directories are polled. Only files that can matter for
+the generated docs are reported: Elm modules and elm.json.
+'''
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from pathlib import Path
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+from elm_doc import source_mirror
+from elm_doc.elm_project import ElmProject, module_name_re
+
+
+DEFAULT_QUIET_PERIOD = 0.1  # seconds
+DEFAULT_POLL_INTERVAL = 0.5  # seconds
+
+
+class PollingWatcher:
+    def __init__(self, project: ElmProject, interval: float = DEFAULT_POLL_INTERVAL):
+        self.project = project
+        self.interval = interval
+        self.snapshot = self._take_snapshot()
+
+    def wait(self, timeout: Optional[float] = None) -> Set[Path]:
+        '''Block until something changes or the timeout elapses, and return what changed.'''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            snapshot = self._take_snapshot()
+            changed = {path for path in set(snapshot) | set(self.snapshot)
+                       if snapshot.get(path) != self.snapshot.get(path)}
+            self.snapshot = snapshot
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            time.sleep(self.interval if deadline is None
+                       else max(0, min(self.interval, deadline - time.monotonic())))
+
+    def close(self):
+        pass
+
+    def _take_snapshot(self) -> Dict[Path, Tuple[int, int]]:
+        snapshot = {}
+        paths = [path for _, path in source_mirror.iter_elm_files(_source_dirs(self.project))]
+        paths.append(self.project.json_path)
+        for path in paths:
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+
+class InotifyWatcher:
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_ISDIR = 0x40000000
+    WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, project: ElmProject):
+        self.project = project
+        self._libc = _load_libc()
+        self.fd = self._libc.inotify_init()
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init failed')
+        self.watches = {}  # Dict[int, Path]
+        self.tree_dirs = set()  # Set[Path], watched directories inside source directories
+        for source_dir in _source_dirs(project):
+            self._add_tree(source_dir)
+        self._add_watch(project.path)
+
+    def wait(self, timeout: Optional[float] = None) -> Set[Path]:
+        '''Block until something changes or the timeout elapses, and return what changed.'''
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed = set()
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, name_length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = data[offset:offset + name_length].rstrip(b'\0').decode(sys.getfilesystemencoding())
+            offset += name_length
+            directory = self.watches.get(wd)
+            if directory is None or not name:
+                continue
+            path = directory / name
+            if mask & self.IN_ISDIR:
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO) and module_name_re.match(name) \
+                   and directory in self.tree_dirs:
+                    self._add_tree(path)
+                    changed.update(p for _, p in source_mirror.iter_elm_files([path]))
+            elif _is_relevant(path, self.project):
+                changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+    def _add_tree(self, root: Path):
+        self._add_watch(root)
+        self.tree_dirs.add(root)
+        for dirpath, dirnames, _ in os.walk(str(root)):
+            dirnames[:] = [name for name in dirnames if module_name_re.match(name)]
+            for name in dirnames:
+                self._add_watch(Path(dirpath) / name)
+                self.tree_dirs.add(Path(dirpath) / name)
+
+    def _add_watch(self, directory: Path):
+        wd = self._libc.inotify_add_watch(
+            self.fd, os.fsencode(str(directory)), self.WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOENT:
+                return
+            raise OSError(error, 'inotify_add_watch failed for {}'.format(directory))
+        self.watches[wd] = directory
+
+
+def make_watcher(project: ElmProject):
+    '''Use inotify if we can, and fall back to polling otherwise.'''
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(project)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(project)
+
+
+def iter_changes(watcher, quiet_period: float = DEFAULT_QUIET_PERIOD) -> Iterator[Set[Path]]:
+    '''Yield sets of changed paths, coalescing changes that happen in quick
+    succession, like an editor writing a backup file and then the file itself.'''
+    while True:
+        changed = watcher.wait()
+        while changed:
+            more = watcher.wait(timeout=quiet_period)
+            if not more:
+                break
+            changed |= more
+        if changed:
+            yield changed
+
+
+def _source_dirs(project: ElmProject) -> List[Path]:
+    return [project.path / source_dir for source_dir in project.source_directories]
+
+
+def _is_relevant(path: Path, project: ElmProject) -> bool:
+    if path == project.json_path:
+        return True
+    return path.suffix == '.elm' and bool(module_name_re.match(path.stem))
+
+
+def _load_libc():
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    # raises AttributeError if this libc has no inotify
+    libc.inotify_init.restype = ctypes.c_int
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_add_watch.restype = ctypes.c_int
+    return libc
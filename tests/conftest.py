@@ -8,6 +8,8 @@ import tarfile
 import pytest
 import py
 
+from elm_doc import elm_project
+
 
 def pytest_addoption(parser):
     parser.addoption("--elm-version", default='0.19.1',
@@ -80,6 +82,12 @@ def module_fixture_path(elm_version):
     return py.path.local(__file__).dirpath('fixtures', elm_version)
 
 
+@pytest.fixture(autouse=True)
+def isolated_cache_home(tmpdir_factory, monkeypatch):
+    # keep tests away from the registry cache of the user running them
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmpdir_factory.mktemp('cache-home')))
+
+
 @pytest.fixture
 def mock_popular_packages(mocker):
     mocker.patch('elm_doc.tasks.catalog.missing_popular_packages', return_value=[])
@@ -129,6 +137,70 @@ def make_elm_project(mocker, module_fixture_path):
     return for_version
 
 
+@pytest.fixture
+def write_package():
+    def write(packages_dir, name, version, exposed_modules=['Foo'], docs=False):
+        '''
+        :param packages_dir: Directory to create the package in, laid out like the packages directory in ELM_HOME
+        :param name: Name of the package, like elm/core
+        :param version: Version of the package
+        :param exposed_modules: Modules to list in the generated elm.json
+        :param docs: Whether to write an empty docs.json, as the compiler does when it builds a package
+        '''
+        package_dir = packages_dir.ensure(name, version, dir=True)
+        package_dir.join('elm.json').write(json.dumps({
+            'type': 'package',
+            'name': name,
+            'summary': 'summary',
+            'license': 'BSD-3-Clause',
+            'version': version,
+            'exposed-modules': exposed_modules,
+            'elm-version': '0.19.0 <= v < 0.20.0',
+            'dependencies': {},
+            'test-dependencies': {},
+        }))
+        if docs:
+            package_dir.join('docs.json').write('[]')
+        return package_dir
+
+    return write
+
+
+@pytest.fixture
+def make_package(write_package):
+    def make(packages_dir, name='elm/core', version='1.0.5', exposed_modules=[]):
+        '''An ElmPackage written with write_package, with its docs.json.'''
+        package_dir = write_package(packages_dir, name, version, exposed_modules, docs=True)
+        return elm_project.from_path(Path(str(package_dir)))
+
+    return make
+
+
+FAKE_ELM = '''#!/usr/bin/env python3
+import json, os, sys
+if sys.argv[1] == '--version':
+    print('0.19.1')
+    sys.exit()
+with open(os.path.join(os.path.dirname(sys.argv[0]), 'elm.log'), 'a') as f:
+    f.write('compiled\\n')
+with open('elm.json') as f:
+    exposed = json.load(f)['exposed-modules']
+with open(sys.argv[3], 'w') as f:
+    json.dump([{'name': name, 'comment': ''} for name in reversed(exposed)], f)
+'''
+
+
+@pytest.fixture
+def fake_elm(tmpdir):
+    '''An elm that writes docs.json for the exposed modules of the elm.json in the
+    working directory, in reverse order, and logs a line to elm.log next to itself
+    each time it compiles.'''
+    elm = tmpdir.join('elm')
+    elm.write(FAKE_ELM)
+    elm.chmod(0o755)
+    return Path(str(elm))
+
+
 def _extract_tarball(tarball, dest):
     with dest.as_cwd():
         with tarfile.open(str(tarball)) as tar:
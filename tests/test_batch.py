@@ -0,0 +1,45 @@
+from pathlib import Path
+
+from elm_doc import batch
+
+
+def test_discover_projects_skips_output_and_dependencies(tmpdir):
+    for path in ['apps/admin', 'apps/shop', 'apps/shop/elm-stuff/0.19.1',
+                 'node_modules/pkg', '.cache', 'docs/packages/elm/core/1.0.5']:
+        tmpdir.ensure(path, 'elm.json')
+    root = Path(str(tmpdir))
+
+    projects = batch.discover_projects(root, skip=[root / 'docs'])
+
+    assert projects == [root / 'apps' / 'admin', root / 'apps' / 'shop']
+
+
+def test_project_names_are_unique_and_valid():
+    root = Path('/repo')
+
+    assert batch.project_names([root / 'Admin_UI', root / 'shop']) == {
+        root / 'Admin_UI': 'admin-ui',
+        root / 'shop': 'shop',
+    }
+    assert batch.project_names([root / 'web' / 'app', root / 'mobile' / 'app', root / '2fa']) == {
+        root / 'web' / 'app': 'web-app',
+        root / 'mobile' / 'app': 'mobile-app',
+        root / '2fa': 'project-2fa',
+    }
+    assert batch.project_names([root / 'a' / 'x_y', root / 'a' / 'x-y']) == {
+        root / 'a' / 'x_y': 'x-y',
+        root / 'a' / 'x-y': 'x-y-2',
+    }
+
+
+def test_discover_projects_skips_tool_configurations(tmpdir):
+    tmpdir.ensure('apps', 'shop', 'elm.json')
+    tmpdir.ensure('apps', 'shop', 'review', 'elm.json')
+    tmpdir.ensure('apps', 'review', 'elm.json')
+    tmpdir.ensure('tools', 'lint', 'elm.json').write(
+        '{"type": "application", "dependencies": {"direct": {"jfmengels/elm-review": "2.13.0"}}}')
+    root = Path(str(tmpdir))
+
+    projects = batch.discover_projects(root)
+
+    assert projects == [root / 'apps' / 'review', root / 'apps' / 'shop']
@@ -49,6 +49,53 @@ def test_cli_in_empty_project(tmpdir, runner):
         assert 'does not look like an Elm project' in str(result.output)
 
 
+def test_cli_lists_subcommands_in_help(runner):
+    result = runner.invoke(cli.cli, ['--help'])
+    assert result.exit_code == 0
+    for command in ['build', 'serve', 'batch', 'elm-home']:
+        assert command in result.output
+
+
+def test_cli_runs_build_without_a_command(tmpdir, runner):
+    with tmpdir.as_cwd():
+        result = runner.invoke(cli.cli, ['--output', 'docs', '.', '--fake-license', 'BSD-3-Clause'])
+        assert result.exit_code == ERROR
+        assert 'does not look like an Elm project' in str(result.output)
+
+
+def test_cli_builds_project_named_like_a_command(tmpdir, runner):
+    tmpdir.ensure('serve', dir=True)
+    with tmpdir.as_cwd():
+        result = runner.invoke(cli.cli, ['build', '--output', 'docs', 'serve', '--fake-license', 'BSD-3-Clause'])
+        assert result.exit_code == ERROR
+        assert 'serve does not look like an Elm project' in str(result.output)
+
+
+def test_watch_reruns_project_tasks_and_survives_a_broken_elm_json(tmpdir, mocker):
+    project = mocker.Mock(json_path=Path(str(tmpdir.join('elm.json'))))
+    main = Path(str(tmpdir.join('src', 'Main.elm')))
+    from_path = mocker.patch('elm_doc.cli.elm_project.from_path',
+                             side_effect=[project, ValueError('Expecting value'), project, project])
+    loader = {'task_main_project': object(), 'task_dependencies': object(), 'task_assets': object()}
+    mocker.patch('elm_doc.cli.make_task_loader', return_value=loader)
+    mocker.patch('elm_doc.cli.watch_module.make_watcher')
+    mocker.patch('elm_doc.cli.watch_module.iter_changes',
+                 return_value=iter([{main}, {project.json_path}, {main}, {project.json_path}]))
+    run_doit = mocker.patch('elm_doc.cli._run_doit')
+    run_config = cli.Build(None, None, Path(str(tmpdir.join('docs'))), '')
+
+    cli._watch_and_rebuild(Path(str(tmpdir)), elm_project.ProjectConfig(), run_config, None)
+
+    assert from_path.call_count == 4
+    assert [sorted(call[0][0]) for call in run_doit.call_args_list] == [
+        sorted(loader),
+        ['task_main_project'],
+        # nothing is built while elm.json is broken, and everything once it's fixed
+        sorted(loader),
+        sorted(loader),
+    ]
+
+
 def test_cli_doit_only_arg_in_real_project(tmpdir, runner, elm_version, elm, make_elm_project):
     project_dir = make_elm_project(elm_version, tmpdir, copy_elm_stuff=True)
 
@@ -389,3 +436,26 @@ def test_issue_55(tmpdir, runner, elm, elm_version, fixture_path):
             '.'])
         assert not result.exception, result.output
         assert result.exit_code == SUCCESS
+
+
+def test_cli_sharded_docs_json_is_identical_to_unsharded(
+        mock_popular_packages, tmpdir, runner, elm, elm_version, make_elm_project):
+    sources = {'.': ['Main.elm', 'PortModuleA.elm', 'PortModuleB.elm']}
+    project_dir = make_elm_project(elm_version, tmpdir, sources=sources, copy_elm_stuff=False)
+    docs = []
+    with tmpdir.as_cwd():
+        for shards in ['1', '3']:
+            result = runner.invoke(cli.main, [
+                '--output', 'docs-{}'.format(shards),
+                '--build-dir', 'build-{}'.format(shards),
+                '--shards', shards,
+                project_dir.basename,
+                '--fake-license', 'CATOSL-1.1',
+                '--elm-path', elm,
+            ])
+            assert not result.exception, result.output
+            assert result.exit_code == SUCCESS
+            docs.append(tmpdir.join('docs-{}'.format(shards), 'packages', 'user', 'project', '1.0.0',
+                                    'docs.json').read_binary())
+
+    assert docs[0] == docs[1]
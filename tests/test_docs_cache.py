@@ -0,0 +1,94 @@
+from pathlib import Path
+import json
+import os
+import stat
+
+from elm_doc import docs_cache
+from elm_doc import elm_project
+from elm_doc.tasks import project as project_tasks
+
+
+def _make_build_dir(tmpdir, main_source):
+    build_dir = tmpdir.ensure('build', dir=True)
+    build_dir.join('elm.json').write(json.dumps({'exposed-modules': ['Main']}))
+    build_dir.ensure('src', dir=True).join('Main.elm').write(main_source)
+    return Path(str(build_dir))
+
+
+def test_key_changes_with_sources(tmpdir, elm_version, make_elm_project):
+    project_dir = make_elm_project(elm_version, tmpdir)
+    project = elm_project.from_path(Path(str(project_dir)))
+    build_path = _make_build_dir(tmpdir, 'module Main exposing (..)')
+    key = docs_cache.compute_key(project, build_path, '0.19.1')
+
+    assert docs_cache.compute_key(project, build_path, '0.19.1') == key
+    assert docs_cache.compute_key(project, build_path, '0.19.0') != key
+
+    (build_path / 'src' / 'Main.elm').write_text('module Main exposing (main)')
+    assert docs_cache.compute_key(project, build_path, '0.19.1') != key
+
+
+def test_restore_misses_then_hits(tmpdir):
+    cache = docs_cache.DocsCache(Path(str(tmpdir.join('cache'))))
+    docs = tmpdir.join('docs.json')
+    docs.write('[]')
+    restored = Path(str(tmpdir.join('out', 'docs.json')))
+
+    assert not cache.restore('abcdef', restored)
+    cache.store('abcdef', Path(str(docs)))
+    assert cache.restore('abcdef', restored)
+    assert restored.read_text() == '[]'
+
+
+def test_restored_docs_json_has_the_default_file_mode(tmpdir, mocker):
+    mocker.patch('elm_doc.utils._umask', 0o022)
+    cache = docs_cache.DocsCache(Path(str(tmpdir.join('cache'))))
+    docs = tmpdir.join('docs.json')
+    docs.write('[]')
+    cache.store('abcdef', Path(str(docs)))
+    os.chmod(str(cache.entry_path('abcdef')), 0o600)
+    restored = Path(str(tmpdir.join('out', 'docs.json')))
+
+    assert cache.restore('abcdef', restored)
+    assert stat.S_IMODE(os.stat(str(restored)).st_mode) == 0o644
+
+
+def test_cached_elm_make_skips_compiler_on_hit(tmpdir, elm_version, make_elm_project, fake_elm):
+    project_dir = make_elm_project(elm_version, tmpdir)
+    project = elm_project.from_path(Path(str(project_dir)))
+    build_path = _make_build_dir(tmpdir, 'module Main exposing (..)')
+    cache = docs_cache.DocsCache(Path(str(tmpdir.join('cache'))))
+
+    for output_dir in ['first', 'second']:
+        output_path = Path(str(tmpdir.join(output_dir, 'docs.json')))
+        output_path.parent.mkdir()
+        action = project_tasks.actions.CachedElmMake(fake_elm, build_path, output_path, project, cache)
+        assert action.execute() is None
+        assert json.loads(output_path.read_text()) == [{'name': 'Main', 'comment': ''}]
+
+    assert tmpdir.join('elm.log').read().splitlines() == ['compiled']
+
+
+def test_cached_elm_make_runs_compiler_without_dependencies_in_elm_home(
+        tmpdir, elm_version, make_elm_project, fake_elm):
+    project_dir = make_elm_project(elm_version, tmpdir)
+    project = elm_project.from_path(Path(str(project_dir)))
+    build_path = _make_build_dir(tmpdir, 'module Main exposing (..)')
+    (build_path / 'elm.json').write_text(json.dumps({
+        'exposed-modules': ['Main'],
+        'dependencies': {'elm/core': '1.0.5 <= v < 1.0.6'},
+    }))
+    cache = docs_cache.DocsCache(Path(str(tmpdir.join('cache'))))
+    output_path = Path(str(tmpdir.join('docs.json')))
+
+    def make():
+        action = project_tasks.actions.CachedElmMake(fake_elm, build_path, output_path, project, cache)
+        assert action.execute() is None
+        return len(tmpdir.join('elm.log').read().splitlines())
+
+    # primes the cache, and then misses it for as long as ELM_HOME is empty
+    assert make() == 1
+    assert make() == 2
+
+    tmpdir.ensure('.elm', elm_version, 'packages', 'elm', 'core', '1.0.5', 'docs.json')
+    assert make() == 2
@@ -1,3 +1,7 @@
+from pathlib import Path
+
+import pytest
+
 from elm_doc import elm_codeshift
 
 
@@ -116,3 +120,75 @@ comment -}
 cmd a0 a1 a2 a3 = Cmd.none
 '''
     assert actual == expected
+
+
+def test_codeshift_manifest_reuses_stripped_output(tmpdir, mocker):
+    manifest_path = Path(str(tmpdir.join('codeshift')))
+    source = 'port module Main exposing (..)\n\nport portA : Cmd ()\n'
+    first = tmpdir.join('first', 'Main.elm')
+    first.write(source, ensure=True)
+
+    manifest = elm_codeshift.CodeshiftManifest.load(manifest_path)
+    elm_codeshift.strip_ports_from_files([Path(str(first))], manifest=manifest)
+    manifest.save()
+    assert first.read() == 'module Main exposing (..)\n\nportA : Cmd ()\nportA = Cmd.none\n'
+
+    strip = mocker.spy(elm_codeshift, 'strip_ports_from_string')
+    is_port_module = mocker.spy(elm_codeshift.elm_parser, 'is_port_module_source')
+    second = tmpdir.join('second', 'Main.elm')
+    second.write(source, ensure=True)
+    manifest = elm_codeshift.CodeshiftManifest.load(manifest_path)
+    elm_codeshift.strip_ports_from_files([Path(str(second)), Path(str(first))], manifest=manifest)
+    assert second.read() == first.read()
+    assert strip.call_count == 0
+    assert is_port_module.call_count == 0
+
+
+def test_codeshift_manifest_remembers_non_port_modules(tmpdir, mocker):
+    manifest_path = Path(str(tmpdir.join('codeshift')))
+    main = tmpdir.join('Main.elm')
+    main.write('module Main exposing (..)\n')
+    manifest = elm_codeshift.CodeshiftManifest.load(manifest_path)
+    elm_codeshift.strip_ports_from_files([Path(str(main))], manifest=manifest)
+    manifest.save()
+
+    is_port_module = mocker.spy(elm_codeshift.elm_parser, 'is_port_module_source')
+    elm_codeshift.strip_ports_from_files(
+        [Path(str(main))], manifest=elm_codeshift.CodeshiftManifest.load(manifest_path))
+    assert is_port_module.call_count == 0
+    assert main.read() == 'module Main exposing (..)\n'
+
+
+def test_strip_ports_from_files_in_process_pool(tmpdir):
+    elm_files = []
+    for i in range(10):
+        elm_file = tmpdir.join('Port{}.elm'.format(i))
+        elm_file.write('port module Port{} exposing (..)\n\nport send : String -> Cmd msg\n'.format(i))
+        elm_files.append(Path(str(elm_file)))
+    plain = tmpdir.join('Plain.elm')
+    plain.write('module Plain exposing (..)\n')
+    elm_files.append(Path(str(plain)))
+
+    elm_codeshift.strip_ports_from_files(elm_files, jobs=2, batch_size=3)
+
+    assert tmpdir.join('Port7.elm').read() == \
+        'module Port7 exposing (..)\n\nsend : String -> Cmd msg\nsend a0 = Cmd.none\n'
+    assert plain.read() == 'module Plain exposing (..)\n'
+
+
+def test_strip_ports_from_files_reports_all_failures_sorted_by_file(tmpdir, caplog):
+    elm_files = []
+    for name in ['B', 'A', 'C']:
+        elm_file = tmpdir.join('{}.elm'.format(name))
+        port = 'port broken' if name != 'C' else 'port ok : Cmd msg'
+        elm_file.write('port module {} exposing (..)\n\n{}\n'.format(name, port))
+        elm_files.append(Path(str(elm_file)))
+
+    with pytest.raises(elm_codeshift.CodeshiftError) as exc_info:
+        elm_codeshift.strip_ports_from_files(elm_files, jobs=2, batch_size=1)
+
+    assert [path.name for path, _ in exc_info.value.failures] == ['A.elm', 'B.elm']
+    assert exc_info.value.failures[0][1].startswith('{}:3: failed to parse'.format(tmpdir.join('A.elm')))
+    assert [record.getMessage().split(':')[0] for record in caplog.records] == \
+        [str(tmpdir.join('A.elm')), str(tmpdir.join('B.elm'))]
+    assert tmpdir.join('C.elm').read().startswith('module C')
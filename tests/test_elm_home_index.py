@@ -0,0 +1,47 @@
+from pathlib import Path
+
+from elm_doc import elm_home_index
+
+
+def _index(tmpdir):
+    return elm_home_index.ElmHomeIndex(
+        Path(str(tmpdir.join('packages'))), Path(str(tmpdir.join('index.json'))))
+
+
+def test_lookups_are_kept_across_runs(tmpdir, write_package):
+    packages_dir = tmpdir.ensure('packages', dir=True)
+    package_dir = write_package(packages_dir, 'elm/core', '1.0.5')
+    write_package(packages_dir, 'elm/core', '1.0.10')
+    packages_dir.ensure('elm', 'core', 'not-a-version', dir=True)
+
+    index = _index(tmpdir)
+    assert index.package('elm/core', '1.0.5').exposed_modules == ['Foo']
+    assert index.versions('elm/core') == ['1.0.5', '1.0.10']
+    assert index.docs_path('elm/core', '1.0.5') is None
+    assert index.package('elm/html', '1.0.0') is None
+    index.save()
+
+    # rewriting a file in place leaves the directory alone, so the index isn't checked against it
+    package_dir.join('elm.json').write('not json')
+    index = _index(tmpdir)
+    assert index.package('elm/core', '1.0.5').version == '1.0.5'
+
+    # the compiler generating docs.json is noticed
+    package_dir.join('docs.json').write('[]')
+    index = _index(tmpdir)
+    assert index.docs_path('elm/core', '1.0.5') == Path(str(package_dir.join('docs.json')))
+    assert index.package('elm/core', '1.0.5') is None
+    assert index.versions('elm/core') == ['1.0.10']
+
+
+def test_index_is_kept_in_the_cache_dir(tmpdir, write_package):
+    packages_dir = tmpdir.ensure('packages', dir=True)
+    write_package(packages_dir, 'elm/core', '1.0.5')
+    cache_path = Path(str(tmpdir.join('cache')))
+
+    index = elm_home_index.open_index(Path(str(packages_dir)), cache_path)
+    assert index.versions('elm/core') == ['1.0.5']
+    index.save()
+
+    assert [path.parent for path in cache_path.glob('**/*.json')] == [cache_path / elm_home_index.INDEX_DIRNAME]
+    assert elm_home_index.open_index(Path(str(packages_dir))) is not index
@@ -87,3 +87,17 @@ def test_parse_port_declaration():
         assert info.name == name
         assert info.port_type == port_type
         assert info.args == args
+
+
+def test_iter_imports():
+    source = '''module Main exposing (main)
+
+{-| docs
+-}
+
+import Html exposing (Html, text)
+import Html.Attributes as Attr
+import   Page.Home
+importNotAnImport = 1
+'''
+    assert list(elm_parser.iter_imports(source)) == ['Html', 'Html.Attributes', 'Page.Home']
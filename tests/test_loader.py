@@ -1,9 +1,11 @@
+import json
 from pathlib import Path
 
 from elm_doc import loader
 from elm_doc import elm_project
 from elm_doc.elm_project import ProjectConfig
 from elm_doc.run_config import Build, Validate
+from elm_doc.tasks import catalog as catalog_tasks
 
 
 def test_dependencies_task_loader_creates_matches_actual_basenames(
@@ -104,6 +106,31 @@ def test_create_tasks_project_modules_and_dependencies(
         assert _basenames_in_first_seen_order(result) == expected_task_names
 
 
+def test_create_tasks_batched_page_tasks(
+        mock_popular_packages, tmpdir, elm_version, make_elm_project):
+    sources = {'.': ['Main.elm']}
+    project_dir = make_elm_project(elm_version, tmpdir, sources=sources, copy_elm_stuff=True)
+    output_dir = tmpdir.join('docs')
+    with project_dir.as_cwd():
+        result = _create_tasks(elm_project.from_path(Path('.')), ProjectConfig(),
+                               Build(None, None, Path(str(output_dir)), '', batch_page_tasks=True))
+
+        expected_task_names = {
+            'task_main_project': [
+                'build_docs_json',
+                'project_package',
+                ],
+            'task_dependencies': [
+                'dep_package',
+                'index',
+                'search_json',
+                'help',
+                ],
+            'task_assets': ['assets'],
+        }
+        assert _basenames_in_first_seen_order(result) == expected_task_names
+
+
 def test_create_tasks_for_validation(tmpdir, elm_version, make_elm_project):
     project_dir = make_elm_project(elm_version, tmpdir)
     with project_dir.as_cwd():
@@ -134,3 +161,79 @@ def _basenames_in_first_seen_order(create_tasks_result):
                 seen.add(basename)
                 rv[creator_name].append(basename)
     return rv
+
+
+def test_batch_shares_dependency_tasks(mocker, tmpdir, write_package):
+    elm_home = tmpdir.join('.elm')
+    mocker.patch('elm_doc.elm_platform.ELM_HOME', Path(str(elm_home)))
+    fetch_releases = mocker.patch(
+        'elm_doc.registry_backends.HttpBackend.fetch', return_value={'1.0.4': 10, '1.0.5': 20})
+    for name, version in [('elm/core', '1.0.4'), ('elm/core', '1.0.5'), ('elm/html', '1.0.0')]:
+        write_package(elm_home.join('0.19.1', 'packages'), name, version, exposed_modules=[])
+    output_path = Path(str(tmpdir.join('docs')))
+
+    projects = []
+    for name, core_version in [('a', '1.0.5'), ('b', '1.0.5'), ('c', '1.0.4')]:
+        project_dir = tmpdir.ensure(name, dir=True)
+        project_dir.join('elm.json').write(json.dumps({
+            'type': 'application',
+            'source-directories': ['.'],
+            'elm-version': '0.19.1',
+            'dependencies': {
+                'direct': {'elm/core': core_version, 'elm/html': '1.0.0'},
+                'indirect': {},
+            },
+            'test-dependencies': {'direct': {}, 'indirect': {}},
+        }))
+        projects.append((
+            elm_project.from_path(Path(str(project_dir))),
+            ProjectConfig(fake_project=name),
+            Build(None, None, output_path, ''),
+        ))
+
+    result = {name: list(creator()) for name, creator in loader.make_batch_task_loader(projects).items()}
+
+    def names(basename):
+        return [task['name'] for task in result['task_dependencies'] if task['basename'] == basename]
+
+    assert [task['name'] for task in result['task_main_project'] if task['basename'] == 'build_docs_json'] \
+        == ['user/a', 'user/b', 'user/c']
+    assert names('dep_copy_docs_json') == ['elm/core/1.0.4', 'elm/core/1.0.5', 'elm/html/1.0.0']
+    assert names('dep_releases') == ['elm/core/1.0.5', 'elm/html/1.0.0']
+    # releases are only looked up when they're written
+    assert not fetch_releases.called
+    releases_task = next(task for task in result['task_dependencies'] if task['basename'] == 'dep_releases')
+    assert releases_task['uptodate'][0].config == {'versions': ['1.0.4', '1.0.5']}
+    action, args = releases_task['actions'][0]
+    (output_path / 'packages/elm/core').mkdir(parents=True)
+    action(*args)
+    assert json.loads(Path(str(output_path / 'packages/elm/core/releases.json')).read_text()) \
+        == {'1.0.4': 10, '1.0.5': 20}
+
+
+def test_only_imported_dependencies_ignores_popular_packages_of_earlier_builds(mocker, tmpdir, write_package):
+    elm_home = tmpdir.join('.elm')
+    mocker.patch('elm_doc.elm_platform.ELM_HOME', Path(str(elm_home)))
+    for name in ['elm/core', 'elm/html']:
+        module = name.split('/')[1].title()
+        write_package(elm_home.join('0.19.1', 'packages'), name, '1.0.0', exposed_modules=[module])
+    project_dir = tmpdir.ensure('app', dir=True)
+    project_dir.join('elm.json').write(json.dumps({
+        'type': 'application',
+        'source-directories': ['src'],
+        'elm-version': '0.19.1',
+        'dependencies': {'direct': {'elm/core': '1.0.0'}, 'indirect': {}},
+        'test-dependencies': {'direct': {}, 'indirect': {}},
+    }))
+    project_dir.ensure('src', dir=True).join('Main.elm').write(
+        'module Main exposing (..)\n\nimport Core\nimport Html\n')
+    build_path = Path(str(project_dir.ensure('.elm-doc', dir=True)))
+    # left by an earlier build that documented popular packages too
+    (build_path / catalog_tasks.POPULAR_PACKAGES_FILENAME).write_text(json.dumps([['elm/html', '1.0.0']]))
+    run_config = Build(None, build_path, Path(str(tmpdir.join('docs'))), '', only_imported_dependencies=True)
+    project = elm_project.from_path(Path(str(project_dir)))
+
+    tasks = list(loader._create_dependency_and_catalog_tasks(
+        mocker.Mock(), [(project, ProjectConfig(), run_config)], run_config))
+
+    assert [task['name'] for task in tasks if task['basename'] == 'dep_copy_docs_json'] == ['elm/core/1.0.0']
@@ -0,0 +1,61 @@
+from pathlib import Path
+import struct
+
+from elm_doc import local_registry
+
+
+def _encode_version(version):
+    major, minor, patch = map(int, version.split('.'))
+    if major < 255 and minor < 256 and patch < 256:
+        return struct.pack('>BBB', major, minor, patch)
+    return struct.pack('>BHHH', 255, major, minor, patch)
+
+
+def _encode_registry(packages):
+    '''The inverse of parse_registry, written after Binary instances in the compiler.'''
+    data = struct.pack('>q', sum(len(versions) for versions in packages.values()))
+    data += struct.pack('>q', len(packages))
+    for name in sorted(packages):
+        versions = packages[name]
+        for part in name.split('/'):
+            data += struct.pack('>B', len(part)) + part.encode('utf8')
+        data += _encode_version(versions[-1])
+        data += struct.pack('>q', len(versions) - 1)
+        for version in reversed(versions[:-1]):
+            data += _encode_version(version)
+    return data
+
+
+def test_parse_registry():
+    packages = {'elm/core': ['1.0.0', '1.0.5'], 'elm/html': ['1.0.0'], 'a/big': ['300.0.1']}
+
+    assert local_registry.parse_registry(_encode_registry(packages)) == packages
+
+
+def test_latest_version_is_newest_installed_known_version(tmpdir, mocker, write_package):
+    mocker.patch('elm_doc.elm_platform.ELM_HOME', Path(str(tmpdir)))
+    packages_dir = tmpdir.ensure('0.19.1', 'packages', dir=True)
+    packages_dir.join('registry.dat').write_binary(_encode_registry({'elm/core': ['1.0.2', '1.0.5']}))
+    for version in ['1.0.2', '1.0.5', '1.0.10']:
+        write_package(packages_dir, 'elm/core', version, exposed_modules=[])
+    packages_dir.ensure('elm', 'core', '1.0.6', dir=True)  # partially downloaded
+
+    registry = local_registry.LocalRegistry.for_elm_version('0.19.1')
+
+    assert registry.installed_versions('elm/core') == ['1.0.2', '1.0.5', '1.0.10']
+    assert registry.latest_version('elm/core') == '1.0.5'
+    assert registry.latest_version('elm/html') is None
+
+
+def test_falls_back_to_package_directories(tmpdir, mocker, write_package):
+    mocker.patch('elm_doc.elm_platform.ELM_HOME', Path(str(tmpdir)))
+    packages_dir = tmpdir.ensure('0.19.1', 'packages', dir=True)
+    packages_dir.join('registry.dat').write_binary(b'\x00\x00garbage')
+    for version in ['1.0.2', '1.0.10']:
+        write_package(packages_dir, 'elm/core', version, exposed_modules=[])
+
+    # a version range, as packages have, picks the newest compiler's directory
+    registry = local_registry.LocalRegistry.for_elm_version('0.19.0 <= v < 0.20.0')
+
+    assert registry.known_versions() == {}
+    assert registry.latest_version('elm/core') == '1.0.10'
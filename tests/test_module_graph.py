@@ -0,0 +1,133 @@
+from pathlib import Path
+
+from elm_doc import module_graph
+from elm_doc.elm_project import ElmPackage
+
+
+def _write_modules(tmpdir, modules):
+    src_dir = tmpdir.ensure('src', dir=True)
+    for name, imports in modules.items():
+        source = 'module {} exposing (..)\n\n'.format(name)
+        source += ''.join('import {}\n'.format(imported) for imported in imports)
+        src_dir.join(*name.split('.')).new(ext='elm').write(source, ensure=True)
+    return Path(str(src_dir))
+
+
+def test_import_closure_ignores_dependency_modules(tmpdir):
+    src_dir = _write_modules(tmpdir, {
+        'Main': ['Html', 'Page.Home'],
+        'Page.Home': ['Page.Shared'],
+        'Page.Shared': ['Json.Decode'],
+        'Unused': [],
+    })
+    graph = module_graph.ModuleGraph.from_source_dir(src_dir)
+    assert graph.import_closure(['Main']) == {'Main', 'Page.Home', 'Page.Shared'}
+
+
+def _package(name, exposed_modules):
+    user, project = name.split('/')
+    return ElmPackage(
+        path=None, user=user, project=project, version='1.0.0', summary='', license='',
+        elm_version='0.19.0 <= v < 0.20.0', exposed_modules=exposed_modules,
+        dependencies={}, test_dependencies={})
+
+
+def test_imported_packages(tmpdir):
+    src_dir = _write_modules(tmpdir, {
+        'Main': ['Html', 'Page'],
+        'Page': ['Json.Decode'],
+    })
+    graph = module_graph.ModuleGraph.from_source_dir(src_dir)
+    packages = [
+        _package('elm/html', ['Html', 'Html.Attributes']),
+        _package('elm/json', {'Decoding': ['Json.Decode'], 'Encoding': ['Json.Encode']}),
+        _package('elm/url', ['Url']),
+    ]
+    assert [package.name for package in module_graph.imported_packages(graph, packages)] \
+        == ['elm/html', 'elm/json']
+
+
+def test_partition_into_shards_balances_independent_modules(tmpdir):
+    src_dir = _write_modules(tmpdir, {'A': [], 'B': [], 'C': [], 'D': []})
+    graph = module_graph.ModuleGraph.from_source_dir(src_dir)
+    shards = module_graph.partition_into_shards(graph, ['A', 'B', 'C', 'D'], 2)
+    assert [shard.exposed_modules for shard in shards] == [['A', 'C'], ['B', 'D']]
+
+
+def test_partition_into_shards_stages_import_closure(tmpdir):
+    src_dir = _write_modules(tmpdir, {
+        'Main': ['Shared'],
+        'Other': ['Shared'],
+        'Shared': [],
+        'Standalone': [],
+    })
+    graph = module_graph.ModuleGraph.from_source_dir(src_dir)
+    shards = module_graph.partition_into_shards(graph, ['Main', 'Other', 'Shared', 'Standalone'], 3)
+    for shard in shards:
+        assert graph.import_closure(shard.exposed_modules) <= shard.staged_modules
+    exposed = sorted(name for shard in shards for name in shard.exposed_modules)
+    assert exposed == ['Main', 'Other', 'Shared', 'Standalone']
+
+
+def test_partition_into_shards_stages_exactly_the_import_closure():
+    # a chain with branches, like layers of a large app
+    names = ['M{:03d}'.format(i) for i in range(200)]
+    graph = module_graph.ModuleGraph(
+        paths={name: Path(name) for name in names},
+        imports={name: [names[j] for j in range(i) if i % (j + 2) == 0] for i, name in enumerate(names)})
+    shards = module_graph.partition_into_shards(graph, names, 8)
+    assert len(shards) == 8
+    for shard in shards:
+        assert shard.staged_modules == graph.import_closure(shard.exposed_modules)
+    assert sorted(name for shard in shards for name in shard.exposed_modules) == names
+
+
+def test_partition_into_shards_never_creates_empty_shards(tmpdir):
+    src_dir = _write_modules(tmpdir, {'Main': []})
+    graph = module_graph.ModuleGraph.from_source_dir(src_dir)
+    shards = module_graph.partition_into_shards(graph, ['Main'], 4)
+    assert len(shards) == 1
+
+
+def test_module_index_only_rescans_changed_files(tmpdir, mocker):
+    src_dir = _write_modules(tmpdir, {'Main': ['Page'], 'Page': []})
+    index_path = Path(str(tmpdir.join('build', module_graph.INDEX_FILENAME)))
+
+    iter_imports = mocker.spy(module_graph.elm_parser, 'iter_imports')
+    graph = module_graph.ModuleIndex.load(index_path).scan([src_dir])
+    assert graph.import_closure(['Main']) == {'Main', 'Page'}
+    assert iter_imports.call_count == 2
+    assert index_path.is_file()
+
+    iter_imports.reset_mock()
+    graph = module_graph.ModuleIndex.load(index_path).scan([src_dir])
+    assert graph.imports == {'Main': ['Page'], 'Page': []}
+    assert iter_imports.call_count == 0
+
+    (src_dir / 'Page.elm').write_text('module Page exposing (..)\n\nimport Util\n')
+    graph = module_graph.ModuleIndex.load(index_path).scan([src_dir])
+    assert graph.imports['Page'] == ['Util']
+    assert iter_imports.call_count == 1
+
+
+def test_module_index_forgets_deleted_files(tmpdir):
+    src_dir = _write_modules(tmpdir, {'Main': [], 'Page': []})
+    index_path = Path(str(tmpdir.join(module_graph.INDEX_FILENAME)))
+    module_graph.ModuleIndex.load(index_path).scan([src_dir])
+
+    (src_dir / 'Page.elm').unlink()
+    module_graph.ModuleIndex.load(index_path).scan([src_dir])
+    assert list(module_graph.ModuleIndex.load(index_path).files) == [str(src_dir / 'Main.elm')]
+
+
+def test_module_index_skips_non_module_directories_and_bad_encoding(tmpdir):
+    src_dir = _write_modules(tmpdir, {'Main': ['Page'], 'Page': []})
+    (src_dir / 'Page.elm').write_bytes(b'module Page exposing (..)\n\n-- caf\xe9\nimport Util\n')
+    for directory in ['node_modules/pkg', 'elm-stuff/0.19.1', '.elm-doc/src']:
+        nested = tmpdir.ensure('src', *directory.split('/'), dir=True)
+        nested.join('Stray.elm').write('module Stray exposing (..)\n')
+
+    graph = module_graph.ModuleIndex(None).scan([src_dir])
+
+    assert sorted(graph.paths) == ['Main', 'Page']
+    assert graph.imports['Page'] == ['Util']
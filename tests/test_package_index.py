@@ -0,0 +1,36 @@
+import pytest
+
+from elm_doc import package_index
+from elm_doc.registry_backends import RegistryError
+
+
+class FakeBackend:
+    def __init__(self, responses):
+        self.responses = responses
+        self.paths = []
+
+    def fetch(self, path):
+        self.paths.append(path)
+        return self.responses[path]
+
+
+def test_sync_fetches_everything_once_and_then_only_what_is_new():
+    backend = FakeBackend({
+        'all-packages': {'elm/core': ['1.0.10', '1.0.2'], 'elm/html': ['1.0.0']},
+        'all-packages/since/3': ['elm/json@1.0.0', 'elm/core@1.0.11'],
+    })
+
+    index = package_index.sync(backend, None)
+    assert index.latest_version('elm/core') == '1.0.10'
+    assert index.count() == 3
+
+    index = package_index.sync(backend, index)
+    assert index.versions('elm/core') == ['1.0.2', '1.0.10', '1.0.11']
+    assert index.latest_version('elm/json') == '1.0.0'
+    assert index.latest_version('elm/nothing') is None
+    assert backend.paths == ['all-packages', 'all-packages/since/3']
+
+
+def test_sync_rejects_unexpected_responses():
+    with pytest.raises(RegistryError):
+        package_index.sync(FakeBackend({'all-packages': ['elm/core']}), None)
@@ -0,0 +1,78 @@
+from pathlib import Path
+import os
+import stat
+
+from elm_doc import package_store
+from elm_doc.tasks import package as package_tasks
+
+
+def test_materialize_links_outputs_to_one_stored_copy(tmpdir, make_package):
+    package = make_package(tmpdir.join('elm-home'))
+    store = package_store.PackageStore(Path(str(tmpdir.join('store'))))
+    source = package.path / 'docs.json'
+    first = Path(str(tmpdir.join('first', 'docs.json')))
+    second = Path(str(tmpdir.join('second', 'docs.json')))
+
+    store.materialize(package, source, first)
+    store.materialize(package, source, second)
+
+    entries = list((store.path / 'elm' / 'core' / '1.0.5').glob('*-docs.json'))
+    assert len(entries) == 1
+    assert first.read_text() == second.read_text() == '[]'
+    assert os.path.samefile(str(first), str(entries[0]))
+    assert os.path.samefile(str(second), str(entries[0]))
+
+
+def test_materialize_replaces_instead_of_writing_through(tmpdir, make_package):
+    package = make_package(tmpdir.join('elm-home'))
+    store = package_store.PackageStore(Path(str(tmpdir.join('store'))))
+    target = Path(str(tmpdir.join('out', 'docs.json')))
+    store.materialize(package, package.path / 'docs.json', target)
+
+    (package.path / 'docs.json').write_text('[{"name":"Basics"}]')
+    store.materialize(package, package.path / 'docs.json', target)
+
+    assert target.read_text() == '[{"name":"Basics"}]'
+    entries = sorted(path.read_text() for path in (store.path / 'elm' / 'core' / '1.0.5').glob('*-docs.json'))
+    assert entries == ['[]', '[{"name":"Basics"}]']
+
+
+def test_ingest_skips_hashing_unchanged_files(tmpdir, mocker, make_package):
+    package = make_package(tmpdir.join('elm-home'))
+    store = package_store.PackageStore(Path(str(tmpdir.join('store'))))
+    entry = store.ingest(package, package.path / 'docs.json')
+
+    sha256 = mocker.patch('hashlib.sha256')
+    assert store.ingest(package, package.path / 'docs.json') == entry
+    assert not sha256.called
+
+
+def test_copy_without_store_replaces_link_to_store(tmpdir, make_package):
+    package = make_package(tmpdir.join('elm-home'))
+    store = package_store.PackageStore(Path(str(tmpdir.join('store'))))
+    target = Path(str(tmpdir.join('out', 'docs.json')))
+    package_tasks.actions.copy_package_docs_json(package, target, store)
+    entry = store.ingest(package, package.path / 'docs.json')
+
+    (package.path / 'docs.json').write_text('[{"name":"Basics"}]')
+    package_tasks.actions.copy_package_docs_json(package, target)
+
+    assert target.read_text() == '[{"name":"Basics"}]'
+    assert entry.read_text() == '[]'
+    assert os.stat(str(entry)).st_mode & stat.S_IWUSR
+
+
+def test_copies_and_stored_files_keep_the_mode_of_the_source(tmpdir, make_package):
+    package = make_package(tmpdir.join('elm-home'))
+    source = package.path / 'docs.json'
+    os.chmod(str(source), 0o644)
+    store = package_store.PackageStore(Path(str(tmpdir.join('store'))))
+    linked = Path(str(tmpdir.join('linked', 'docs.json')))
+    copied = Path(str(tmpdir.join('copied', 'docs.json')))
+    copied.parent.mkdir()
+
+    package_tasks.actions.copy_package_docs_json(package, linked, store)
+    package_tasks.actions.copy_package_docs_json(package, copied)
+
+    for path in [store.ingest(package, source), linked, copied]:
+        assert stat.S_IMODE(os.stat(str(path)).st_mode) == 0o644
@@ -0,0 +1,168 @@
+from pathlib import Path
+import threading
+
+from elm_doc import registry
+from elm_doc.package_index import PackageIndex
+from elm_doc.registry_backends import HttpBackend
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+class FakeSession:
+    def __init__(self, barrier=None, new_versions=()):
+        self.barrier = barrier
+        self.new_versions = list(new_versions)
+        self.urls = []
+        self.bulk_urls = []
+        self.lock = threading.Lock()
+
+    def get(self, url, timeout=None):
+        with self.lock:
+            self.urls.append(url)
+        if self.barrier is not None:
+            # only passes if all the requests are in flight at the same time
+            self.barrier.wait(timeout=5)
+        return FakeResponse({'1.0.0': len(url)})
+
+    def post(self, url, timeout=None):
+        with self.lock:
+            self.bulk_urls.append(url)
+        if url.endswith('/all-packages'):
+            return FakeResponse({'elm/core': ['1.0.0']})
+        return FakeResponse(self.new_versions)
+
+
+def test_prefetch_fetches_concurrently():
+    names = ['elm/core', 'elm/html', 'elm/json', 'elm/url']
+    session = FakeSession(barrier=threading.Barrier(len(names)))
+    packages = registry.Registry(HttpBackend(session), concurrency=len(names))
+
+    packages.prefetch(names)
+    releases = {name: packages.releases(name) for name in names}
+    packages.close()
+
+    assert sorted(session.urls) == [
+        'https://package.elm-lang.org/packages/{}/releases.json'.format(name) for name in names]
+    assert all(list(versions) == ['1.0.0'] for versions in releases.values())
+
+
+def test_releases_are_fetched_once():
+    session = FakeSession()
+    packages = registry.Registry(HttpBackend(session), concurrency=2)
+
+    packages.prefetch(['elm/core', 'elm/core'])
+    assert packages.releases('elm/core') == packages.releases('elm/core')
+    packages.close()
+
+    assert len(session.urls) == 1
+
+
+def test_session_pool_fits_concurrency():
+    session = registry.make_session(concurrency=16)
+    assert session.get_adapter('https://package.elm-lang.org')._pool_maxsize == 16
+
+
+def _cache(tmpdir, **kwargs):
+    return registry.ReleasesCache(Path(str(tmpdir.join('registry.sqlite3'))), **kwargs)
+
+
+def test_cache_is_shared_across_registries(tmpdir):
+    first = FakeSession()
+    registry.Registry(HttpBackend(first), cache=_cache(tmpdir)).releases('elm/core')
+
+    second = FakeSession()
+    releases = registry.Registry(HttpBackend(second), cache=_cache(tmpdir)).releases('elm/core')
+
+    assert len(first.urls) == 1
+    assert second.urls == []
+    assert list(releases) == ['1.0.0']
+
+
+def test_cache_is_kept_per_registry(tmpdir):
+    official = _cache(tmpdir)
+    mirror = _cache(tmpdir, registry_url='https://mirror.example.com')
+    official.put('elm/core', {'1.0.0': 1})
+    official.put_index(PackageIndex({'elm/core': ['1.0.0']}, 100))
+    mirror.put('elm/core', {'1.0.0': 1, '1.0.1': 2})
+
+    assert official.get('elm/core').releases == {'1.0.0': 1}
+    assert mirror.get('elm/core').releases == {'1.0.0': 1, '1.0.1': 2}
+    assert mirror.get_index() is None
+    assert official.get_index().packages == {'elm/core': ['1.0.0']}
+
+
+def test_known_versions_are_never_revalidated(tmpdir):
+    registry.Registry(HttpBackend(FakeSession()), cache=_cache(tmpdir)).releases('elm/core')
+
+    session = FakeSession(new_versions=['elm/core@2.0.0'])
+    packages = registry.Registry(HttpBackend(session), cache=_cache(tmpdir, ttl=0))
+    packages.prefetch(['elm/core'], {'elm/core': ['1.0.0']})
+    assert list(packages.releases('elm/core', versions=['1.0.0'])) == ['1.0.0']
+    assert session.urls == []
+
+    # the latest release may have changed, though
+    packages.releases('elm/core', versions=['2.0.0'])
+    assert len(session.urls) == 1
+
+
+def test_complete_releases_outlive_their_ttl(tmpdir):
+    registry.Registry(HttpBackend(FakeSession()), cache=_cache(tmpdir)).releases('elm/core')
+
+    session = FakeSession()
+    packages = registry.Registry(HttpBackend(session), cache=_cache(tmpdir, ttl=0))
+
+    assert list(packages.releases('elm/core')) == ['1.0.0']
+    assert packages.latest_version('elm/core') == '1.0.0'
+    # one request to see that nothing was published since
+    assert session.urls == []
+    assert session.bulk_urls == ['https://package.elm-lang.org/all-packages/since/1']
+
+
+def test_cache_evicts_least_recently_used(tmpdir, mocker):
+    cache = _cache(tmpdir, max_entries=2)
+    clock = mocker.patch('time.time')
+    for now, name in enumerate(['elm/core', 'elm/html', 'elm/json']):
+        clock.return_value = now * 1000
+        cache.put(name, {})
+        if name == 'elm/html':
+            clock.return_value += 500
+            assert cache.get('elm/core') is not None
+
+    assert cache.get('elm/core') is not None
+    assert cache.get('elm/html') is None
+    assert cache.get('elm/json') is not None
+
+
+def test_offline_registry_makes_no_requests(tmpdir, mocker):
+    registry.Registry(HttpBackend(FakeSession()), cache=_cache(tmpdir)).releases('elm/core')
+    local = mocker.Mock(**{'latest_version.return_value': '1.0.5'})
+
+    session = FakeSession()
+    packages = registry.Registry(HttpBackend(session), cache=_cache(tmpdir, ttl=0), local=local, offline=True)
+
+    assert list(packages.releases('elm/core')) == ['1.0.0']
+    assert packages.releases('elm/html') == {}
+    assert packages.latest_version('elm/html') == '1.0.5'
+    assert session.urls == []
+
+
+def test_cache_is_read_once_per_run(tmpdir, mocker):
+    registry.Registry(HttpBackend(FakeSession()), cache=_cache(tmpdir)).releases('elm/core')
+    cache = _cache(tmpdir)
+    get = mocker.spy(cache, 'get')
+
+    packages = registry.Registry(HttpBackend(FakeSession()), cache=cache)
+    for _ in range(3):
+        packages.prefetch(['elm/core'], {'elm/core': ['1.0.0']})
+        packages.releases('elm/core', versions=['1.0.0'])
+
+    assert get.call_count == 1
@@ -0,0 +1,169 @@
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+from elm_doc import registry_backends
+from elm_doc.registry import Registry
+from elm_doc.registry_backends import (
+    CassetteBackend, CircuitBreaker, HttpBackend, MirrorBackend, RegistryError, RetryBudget)
+
+
+class FakeResponse:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self.data = data
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(response=self)
+
+    def json(self):
+        return self.data
+
+
+class FakeSession:
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.urls = []
+
+    def get(self, url, timeout=None):
+        self.urls.append(url)
+        return FakeResponse(self.status_code, {'1.0.0': 1})
+
+
+def _mirror(tmpdir):
+    releases = tmpdir.join('mirror', 'packages', 'elm', 'core', 'releases.json')
+    releases.ensure()
+    releases.write(json.dumps({'1.0.0': 1, '1.0.5': 2}))
+    return Path(str(tmpdir.join('mirror')))
+
+
+def test_http_backend_uses_the_given_url():
+    session = FakeSession()
+    backend = HttpBackend(session, 'http://localhost:8000/')
+    assert backend.fetch(registry_backends.releases_path('elm/core')) == {'1.0.0': 1}
+    assert session.urls == ['http://localhost:8000/packages/elm/core/releases.json']
+
+
+def test_http_backend_does_not_retry_missing_packages():
+    session = FakeSession(status_code=404)
+    with pytest.raises(RegistryError):
+        HttpBackend(session).fetch(registry_backends.releases_path('elm/nothing'))
+    assert len(session.urls) == 1
+
+
+@pytest.mark.parametrize('as_url', [True, False])
+def test_mirror_backend(tmpdir, as_url):
+    mirror_path = _mirror(tmpdir)
+    backend = registry_backends.make_backend(
+        FakeSession(), mirror_path.as_uri() if as_url else str(mirror_path))
+
+    assert isinstance(backend, MirrorBackend)
+    assert Registry(backend).releases('elm/core') == {'1.0.0': 1, '1.0.5': 2}
+    with pytest.raises(RegistryError):
+        backend.fetch(registry_backends.releases_path('elm/html'))
+
+
+def test_cassette_replays_what_was_recorded(tmpdir):
+    cassette_path = Path(str(tmpdir.join('cassette.json')))
+    session = FakeSession()
+    recorder = registry_backends.make_backend(session, cassette_path=cassette_path, cassette_mode='record')
+    assert Registry(recorder).releases('elm/core') == {'1.0.0': 1}
+    assert len(session.urls) == 1
+
+    session = FakeSession()
+    player = registry_backends.make_backend(session, cassette_path=cassette_path, cassette_mode='replay')
+    assert isinstance(player, CassetteBackend)
+    assert Registry(player).releases('elm/core') == {'1.0.0': 1}
+    assert session.urls == []
+    with pytest.raises(RegistryError):
+        player.fetch(registry_backends.releases_path('elm/html'))
+
+
+class FakeRegistryHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+        time.sleep(server.delay)
+        body = json.dumps({'1.0.0': 1}).encode('utf8')
+        self.send_response(server.status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeRegistry(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeRegistryHandler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.status = 200
+        self.delay = 0
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_port)
+
+
+@pytest.fixture
+def fake_registry():
+    server = FakeRegistry()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _backend(fake_registry, timeout=5, retries=0, failure_threshold=100):
+    return HttpBackend(requests.Session(), fake_registry.url, timeout=timeout, retry_budget=RetryBudget(retries),
+                       breaker=CircuitBreaker(failure_threshold), retry_wait=0)
+
+
+def test_slow_responses_time_out(fake_registry):
+    fake_registry.delay = 2
+    backend = _backend(fake_registry, timeout=0.2)
+
+    started = time.monotonic()
+    with pytest.raises(RegistryError):
+        backend.fetch(registry_backends.releases_path('elm/core'))
+    assert time.monotonic() - started < 1
+
+
+def test_retries_are_shared_by_all_requests(fake_registry):
+    fake_registry.status = 500
+    backend = _backend(fake_registry, retries=3)
+
+    for name in ['elm/core', 'elm/html', 'elm/json']:
+        with pytest.raises(RegistryError):
+            backend.fetch(registry_backends.releases_path(name))
+
+    # one attempt each, and the three retries
+    assert len(fake_registry.requests) == 6
+
+
+def test_open_circuit_falls_back_without_asking(fake_registry):
+    fake_registry.status = 503
+    packages = Registry(_backend(fake_registry, retries=10, failure_threshold=2), concurrency=1)
+
+    assert [packages.releases(name) for name in ['elm/core', 'elm/html', 'elm/json']] == [{}, {}, {}]
+    assert len(fake_registry.requests) == 2
+
+    # and closes again once the registry is back
+    fake_registry.status = 200
+    packages.backend.breaker.cooldown = 0
+    assert packages.backend.fetch(registry_backends.releases_path('elm/url')) == {'1.0.0': 1}
+    assert not packages.backend.breaker.is_open
@@ -0,0 +1,105 @@
+from pathlib import Path
+import gzip
+import http.client
+import threading
+
+import pytest
+
+from elm_doc import serve
+
+
+@pytest.fixture
+def server(tmpdir):
+    output = tmpdir.ensure('out', dir=True)
+    output.ensure('assets', dir=True).join('style.css').write('body { color: black; }\n' * 100)
+    output.ensure('packages', 'u', 'p', '1.0.0', dir=True).join('docs.json').write('[]')
+    server = serve.make_server(Path(str(output)), mount_point='/docs', port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _connect(server):
+    return http.client.HTTPConnection('127.0.0.1', server.server_port, timeout=5)
+
+
+def test_serves_shell_for_module_pages(server):
+    conn = _connect(server)
+    for path in ['/docs/', '/docs/packages/u/p/1.0.0/', '/docs/packages/u/p/1.0.0/Foo-Bar']:
+        conn.request('GET', path)
+        response = conn.getresponse()
+        assert response.status == 200
+        assert response.getheader('Content-Type') == 'text/html; charset=utf-8'
+        assert b'/docs/assets/' in response.read()
+    conn.close()
+
+
+def test_serves_files_under_mount_point_only(server):
+    conn = _connect(server)
+    conn.request('GET', '/docs/packages/u/p/1.0.0/docs.json')
+    response = conn.getresponse()
+    assert response.status == 200
+    assert response.read() == b'[]'
+
+    conn.request('GET', '/packages/u/p/1.0.0/docs.json')
+    response = conn.getresponse()
+    assert response.status == 404
+    response.read()
+    conn.close()
+
+
+def test_head_of_missing_file_has_no_body(server):
+    conn = _connect(server)
+    conn.request('HEAD', '/docs/missing.json')
+    response = conn.getresponse()
+    assert response.status == 404
+    response.read()
+
+    # a body sent with the 404 would be read as the start of this response
+    conn.request('GET', '/docs/packages/u/p/1.0.0/docs.json')
+    response = conn.getresponse()
+    assert response.status == 200
+    assert response.read() == b'[]'
+    conn.close()
+
+
+def test_compresses_assets_with_long_lived_caching(server):
+    conn = _connect(server)
+    conn.request('GET', '/docs/assets/style.css', headers={'Accept-Encoding': 'gzip, deflate'})
+    response = conn.getresponse()
+    assert response.status == 200
+    assert response.getheader('Content-Encoding') == 'gzip'
+    assert response.getheader('Cache-Control') == serve.LONG_LIVED_CACHE_CONTROL
+    assert gzip.decompress(response.read()) == b'body { color: black; }\n' * 100
+    conn.close()
+
+
+def test_not_modified_when_etag_matches(server):
+    conn = _connect(server)
+    conn.request('GET', '/docs/packages/u/p/1.0.0/docs.json')
+    response = conn.getresponse()
+    response.read()
+    etag = response.getheader('ETag')
+
+    conn.request('GET', '/docs/packages/u/p/1.0.0/docs.json', headers={'If-None-Match': etag})
+    response = conn.getresponse()
+    assert response.status == 304
+    assert response.read() == b''
+    conn.close()
+
+
+def test_lru_cache_is_bounded_by_size():
+    cache = serve.LruCache(max_bytes=100)
+    cache.put('a', b'a' * 20, 20)
+    cache.put('b', b'b' * 20, 20)
+    cache.put('huge', b'h' * 30, 30)
+    assert cache.get('a') is not None
+    for key in 'cdefg':
+        cache.put(key, key * 20, 20)
+
+    assert cache.size <= 100
+    assert cache.get('huge') is None
+    assert cache.get('b') is None
+    assert cache.get('g') == 'g' * 20
@@ -0,0 +1,116 @@
+from pathlib import Path
+import os
+
+import pytest
+
+from elm_doc import elm_codeshift
+from elm_doc import source_mirror
+
+
+def _paths(tmpdir):
+    source_dir = Path(str(tmpdir.ensure('src', dir=True)))
+    target_dir = Path(str(tmpdir.ensure('target', dir=True)))
+    return source_dir, target_dir
+
+
+def test_sync_copies_only_changed_files(tmpdir):
+    source_dir, target_dir = _paths(tmpdir)
+    (source_dir / 'Main.elm').write_text('module Main exposing (..)')
+    (source_dir / 'Page').mkdir()
+    (source_dir / 'Page' / 'Home.elm').write_text('module Page.Home exposing (..)')
+
+    result = source_mirror.sync([source_dir], target_dir)
+    assert result.changed == {target_dir / 'Main.elm', target_dir / 'Page' / 'Home.elm'}
+
+    result = source_mirror.sync([source_dir], target_dir)
+    assert result.changed == set()
+
+    (source_dir / 'Main.elm').write_text('module Main exposing (main)')
+    result = source_mirror.sync([source_dir], target_dir)
+    assert result.changed == {target_dir / 'Main.elm'}
+    assert (target_dir / 'Main.elm').read_text() == 'module Main exposing (main)'
+
+
+def test_sync_keeps_rewritten_targets_of_unchanged_sources(tmpdir):
+    source_dir, target_dir = _paths(tmpdir)
+    (source_dir / 'Main.elm').write_text('port module Main exposing (..)')
+    source_mirror.sync([source_dir], target_dir)
+
+    (target_dir / 'Main.elm').write_text('module Main exposing (..)')
+    source_mirror.sync([source_dir], target_dir)
+    assert (target_dir / 'Main.elm').read_text() == 'module Main exposing (..)'
+
+
+def test_sync_removes_stale_files_and_empty_dirs(tmpdir):
+    source_dir, target_dir = _paths(tmpdir)
+    (source_dir / 'Page').mkdir()
+    (source_dir / 'Page' / 'Home.elm').write_text('module Page.Home exposing (..)')
+    source_mirror.sync([source_dir], target_dir)
+
+    (source_dir / 'Page' / 'Home.elm').unlink()
+    result = source_mirror.sync([source_dir], target_dir)
+    assert result.removed == {target_dir / 'Page' / 'Home.elm'}
+    assert not (target_dir / 'Page').exists()
+
+
+def test_sync_skips_files_that_cannot_be_modules(tmpdir):
+    source_dir, target_dir = _paths(tmpdir)
+    (source_dir / 'elm-stuff').mkdir()
+    (source_dir / 'elm-stuff' / 'Cached.elm').write_text('')
+    (source_dir / 'README.md').write_text('')
+    (source_dir / 'lowercase.elm').write_text('')
+    (source_dir / 'Main.elm').write_text('')
+
+    source_mirror.sync([source_dir], target_dir)
+    assert [path.name for path in target_dir.glob('**/*') if path.is_file()
+            if path.name != source_mirror.MANIFEST_FILENAME] == ['Main.elm']
+
+
+def test_sync_prefers_first_source_directory(tmpdir):
+    source_dir, target_dir = _paths(tmpdir)
+    other_dir = Path(str(tmpdir.ensure('other', dir=True)))
+    (source_dir / 'Main.elm').write_text('first')
+    (other_dir / 'Main.elm').write_text('second')
+
+    source_mirror.sync([source_dir, other_dir], target_dir)
+    assert (target_dir / 'Main.elm').read_text() == 'first'
+
+
+@pytest.mark.parametrize('mode', [source_mirror.SYMLINK, source_mirror.HARDLINK])
+def test_sync_links_modules_and_copies_port_modules(tmpdir, mode):
+    source_dir, target_dir = _paths(tmpdir)
+    (source_dir / 'Main.elm').write_text('module Main exposing (..)')
+    (source_dir / 'Ports.elm').write_text('port module Ports exposing (..)')
+
+    source_mirror.sync([source_dir], target_dir, mode=mode)
+    assert _is_linked(source_dir / 'Main.elm', target_dir / 'Main.elm')
+    assert not _is_linked(source_dir / 'Ports.elm', target_dir / 'Ports.elm')
+
+
+def test_sync_never_writes_through_links(tmpdir):
+    source_dir, target_dir = _paths(tmpdir)
+    (source_dir / 'Main.elm').write_text('module Main exposing (..)')
+    source_mirror.sync([source_dir], target_dir, mode=source_mirror.HARDLINK)
+
+    # the module becomes a port module: it needs to be staged as a real file
+    (source_dir / 'Main.elm').unlink()
+    (source_dir / 'Main.elm').write_text('port module Main exposing (..)')
+    source_mirror.sync([source_dir], target_dir, mode=source_mirror.HARDLINK)
+    assert not _is_linked(source_dir / 'Main.elm', target_dir / 'Main.elm')
+
+    elm_codeshift.strip_ports_from_file(target_dir / 'Main.elm')
+    assert (source_dir / 'Main.elm').read_text() == 'port module Main exposing (..)'
+
+
+def test_sync_restages_when_mode_changes(tmpdir):
+    source_dir, target_dir = _paths(tmpdir)
+    (source_dir / 'Main.elm').write_text('module Main exposing (..)')
+    source_mirror.sync([source_dir], target_dir)
+
+    result = source_mirror.sync([source_dir], target_dir, mode=source_mirror.SYMLINK)
+    assert result.changed == {target_dir / 'Main.elm'}
+    assert (target_dir / 'Main.elm').is_symlink()
+
+
+def _is_linked(source: Path, target: Path) -> bool:
+    return target.is_symlink() or os.path.samefile(str(source), str(target))
@@ -0,0 +1,37 @@
+from pathlib import Path
+
+from elm_doc.elm_project import ElmApplication
+from elm_doc.tasks import catalog
+
+
+def _project():
+    return ElmApplication(
+        path=Path('.'),
+        source_directories=['src'],
+        elm_version='0.19.1',
+        direct_dependencies={'elm/core': '1.0.5'},
+        indirect_dependencies={},
+        direct_test_dependencies={},
+        indirect_test_dependencies={},
+    )
+
+
+def test_popular_packages_are_resolved_by_the_build(tmpdir, mocker):
+    build_path = Path(str(tmpdir))
+    registry = mocker.Mock(**{'latest_version.return_value': '1.0.0'})
+    project = _project()
+
+    assert catalog.with_popular_packages(project, build_path).direct_dependencies == {'elm/core': '1.0.5'}
+
+    catalog.actions.resolve_popular_packages(registry, project, build_path)
+    with_popular = catalog.with_popular_packages(project, build_path)
+    assert with_popular.direct_dependencies['elm/html'] == '1.0.0'
+    assert 'elm/core' not in [call[0][0] for call in registry.latest_version.call_args_list]
+    # the project itself is left as is
+    assert project.direct_dependencies == {'elm/core': '1.0.5'}
+
+    # an unchanged result isn't written again
+    popular_path = build_path / catalog.POPULAR_PACKAGES_FILENAME
+    mtime = popular_path.stat().st_mtime_ns
+    catalog.actions.resolve_popular_packages(registry, project, build_path)
+    assert popular_path.stat().st_mtime_ns == mtime
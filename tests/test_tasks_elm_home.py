@@ -0,0 +1,33 @@
+from pathlib import Path
+
+from elm_doc.elm_home_index import ElmHomeIndex
+from elm_doc.run_config import Build
+from elm_doc.tasks import elm_home
+
+
+def test_one_task_per_version_and_per_package(tmpdir, mocker, write_package):
+    packages_dir = tmpdir.ensure('packages', dir=True)
+    write_package(packages_dir, 'elm/core', '1.0.4', ['Foo.Bar'], docs=True)
+    write_package(packages_dir, 'elm/core', '1.0.10', ['Foo.Bar'], docs=True)
+    write_package(packages_dir, 'elm/html', '1.0.0', ['Foo.Bar'], docs=True)
+    write_package(packages_dir, 'elm/json', '1.1.3', ['Foo.Bar'], docs=False)
+    index = ElmHomeIndex(Path(str(packages_dir)))
+    output_path = Path(str(tmpdir.join('docs')))
+    run_config = Build(None, None, output_path, '')
+
+    tasks = list(elm_home.create_elm_home_tasks(mocker.Mock(), index, run_config))
+
+    def names(basename):
+        return [task['name'] for task in tasks if task['basename'] == basename]
+
+    assert names('package_version') == ['elm/core/1.0.4', 'elm/core/1.0.10', 'elm/html/1.0.0']
+    assert names('package') == ['elm/core', 'elm/html']
+    search_task = next(task for task in tasks if task['basename'] == 'search_json')
+    assert [entry.version for entry in search_task['actions'][0][1][0]] == ['1.0.10', '1.0.0']
+
+    version_task = next(task for task in tasks if task['basename'] == 'package_version')
+    action, args = version_task['actions'][0]
+    action(*args)
+    version_output = output_path / 'packages/elm/core/1.0.4'
+    assert sorted(path.name for path in version_output.iterdir()) \
+        == ['Foo-Bar', 'about', 'docs.json', 'elm.json', 'index.html']
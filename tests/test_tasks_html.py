@@ -0,0 +1,77 @@
+from pathlib import Path
+import os
+import stat
+
+from elm_doc.tasks import html
+
+
+def test_pages_are_written_on_their_own_without_cache_dir(tmpdir):
+    output_path = Path(str(tmpdir.join('docs')))
+    pages = [output_path / 'index.html', output_path / 'elm/core/1.0.0/Basics']
+
+    html.actions.write_pages(pages, mount_point='/docs')
+
+    assert len({os.stat(str(page)).st_ino for page in pages}) == 2
+    assert all(os.stat(str(page)).st_mode & stat.S_IWUSR for page in pages)
+    assert '"mountedAt": "/docs"' in pages[0].read_text()
+    assert not any(Path(str(tmpdir)).glob('**/{}/*.html'.format(html.SHELLS_DIRNAME)))
+
+
+def test_pages_are_links_to_one_shell_in_cache_dir(tmpdir):
+    output_path = Path(str(tmpdir.join('docs')))
+    cache_path = Path(str(tmpdir.join('cache')))
+    pages = [output_path / 'index.html', output_path / 'elm/core/1.0.0/Basics']
+
+    html.actions.write_pages(pages, mount_point='/docs', cache_path=cache_path)
+    html.actions.write(output_path / 'help/documentation-format', mount_point='/docs', cache_path=cache_path)
+
+    shell = html._shell(cache_path, '/docs')
+    assert shell.parent == cache_path / html.SHELLS_DIRNAME
+    inodes = {os.stat(str(page)).st_ino for page in pages + [output_path / 'help/documentation-format', shell]}
+    assert len(inodes) == 1
+    assert os.stat(str(shell)).st_mode & stat.S_IWUSR
+    assert '"mountedAt": "/docs"' in pages[0].read_text()
+
+
+def test_mount_point_change_replaces_pages(tmpdir):
+    cache_path = Path(str(tmpdir.join('cache')))
+    page = Path(str(tmpdir)) / 'index.html'
+    html.actions.write(page, mount_point='/docs', cache_path=cache_path)
+    old_shell = html._shell(cache_path, '/docs')
+
+    html.actions.write(page, mount_point='/other', cache_path=cache_path)
+
+    assert '"mountedAt": "/other"' in page.read_text()
+    assert '"mountedAt": "/docs"' in old_shell.read_text()
+
+
+def test_read_only_shell_is_replaced(tmpdir):
+    cache_path = Path(str(tmpdir.join('cache')))
+    shell = html._shell(cache_path, '/docs')
+    os.chmod(str(shell), stat.S_IRUSR)
+    html._shells.clear()
+    page = Path(str(tmpdir)) / 'index.html'
+
+    html.actions.write(page, mount_point='/docs', cache_path=cache_path)
+
+    assert os.stat(str(page)).st_mode & stat.S_IWUSR
+
+
+def test_pages_are_copies_if_links_fail(tmpdir, mocker):
+    mocker.patch('os.link', side_effect=OSError('cross-device link'))
+    mocker.patch('elm_doc.package_store._reflink', return_value=False)
+    cache_path = Path(str(tmpdir.join('cache')))
+    page = Path(str(tmpdir)) / 'index.html'
+
+    html.actions.write(page, mount_point='/docs', cache_path=cache_path)
+
+    assert page.read_text() == html._render('/docs')
+    assert os.stat(str(page)).st_ino != os.stat(str(html._shell(cache_path, '/docs'))).st_ino
+
+
+def test_pages_have_the_default_file_mode(tmpdir, mocker):
+    mocker.patch('elm_doc.utils._umask', 0o027)
+    for cache_path in [None, Path(str(tmpdir.join('cache')))]:
+        page = Path(str(tmpdir.join(str(cache_path is None), 'index.html')))
+        html.actions.write(page, mount_point='/docs', cache_path=cache_path)
+        assert stat.S_IMODE(os.stat(str(page)).st_mode) == 0o640
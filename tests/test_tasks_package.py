@@ -0,0 +1,86 @@
+from pathlib import Path
+import json
+
+from elm_doc.run_config import Build
+from elm_doc.tasks import package as package_tasks
+
+
+def _run(task):
+    for action in task['actions']:
+        function, args = action[:2]
+        kwargs = action[2] if len(action) > 2 else {}
+        function(*args, **kwargs)
+
+
+def test_batched_dependency_is_one_task_per_version(tmpdir, mocker, make_package):
+    old = make_package(tmpdir.join('packages'), 'elm/parser', '1.0.0', ['Parser', 'Parser.Advanced'])
+    latest = make_package(tmpdir.join('packages'), 'elm/parser', '1.1.0', ['Parser', 'Parser.Advanced'])
+    output_path = Path(str(tmpdir.join('docs')))
+    run_config = Build(None, None, output_path, '/docs', batch_page_tasks=True)
+    registry = mocker.Mock()
+    registry.releases.return_value = {'1.0.0': 100}
+    versions = ['1.0.0', '1.1.0']
+
+    tasks = [task
+             for package in [old, latest]
+             for task in package_tasks.create_dependency_tasks(registry, package, run_config, versions=versions)]
+
+    assert [(task['basename'], task['name']) for task in tasks] \
+        == [('dep_package', 'elm/parser/1.0.0'), ('dep_package', 'elm/parser/1.1.0')]
+    for task in tasks:
+        _run(task)
+    package_output = output_path / 'packages/elm/parser'
+    assert sorted(path.name for path in (package_output / '1.0.0').iterdir()) \
+        == ['Parser', 'Parser-Advanced', 'about', 'docs.json', 'elm.json', 'index.html']
+    assert sorted(path.name for path in package_output.iterdir()) \
+        == ['1.0.0', '1.1.0', 'index.html', 'latest', 'releases.json']
+    assert json.loads((package_output / 'releases.json').read_text()) == {'1.0.0': 100, '1.1.0': 1}
+    assert (package_output / 'latest').resolve() == (package_output / '1.1.0').resolve()
+
+
+def test_batched_task_is_outdated_when_modules_change(tmpdir, mocker, make_package):
+    package = make_package(tmpdir.join('packages'), 'elm/parser', '1.0.0', ['Parser', 'Parser.Advanced'])
+    run_config = Build(None, None, Path(str(tmpdir.join('docs'))), '', batch_page_tasks=True)
+
+    def uptodate_config(modules):
+        task = next(package_tasks.create_package_page_tasks(
+            package_tasks.Context.Project, mocker.Mock(), package, modules, run_config))
+        return task['uptodate'][0].config
+
+    assert uptodate_config(['Parser']) != uptodate_config(['Parser', 'Parser.Advanced'])
+
+
+def test_spa_fallback_writes_no_pages(tmpdir, mocker, make_package):
+    package = make_package(tmpdir.join('packages'), 'elm/parser', '1.0.0', ['Parser', 'Parser.Advanced'])
+    output_path = Path(str(tmpdir.join('docs')))
+    registry = mocker.Mock()
+    registry.releases.return_value = {}
+
+    for batch_page_tasks in [False, True]:
+        run_config = Build(None, None, output_path, '', batch_page_tasks=batch_page_tasks, spa_fallback=True)
+        tasks = list(package_tasks.create_dependency_tasks(registry, package, run_config))
+        for task in tasks:
+            _run(task)
+
+        package_output = output_path / 'packages/elm/parser'
+        assert sorted(path.name for path in package_output.iterdir()) == ['1.0.0', 'latest', 'releases.json']
+        assert sorted(path.name for path in (package_output / '1.0.0').iterdir()) == ['docs.json', 'elm.json']
+
+
+def test_releases_task_is_outdated_until_the_registry_knows_every_version(tmpdir, mocker, make_package):
+    package = make_package(tmpdir.join('packages'), 'elm/parser', '1.0.0', ['Parser', 'Parser.Advanced'])
+    run_config = Build(None, None, Path(str(tmpdir.join('docs'))), '')
+    registry = mocker.Mock()
+    registry.releases.return_value = {}
+    task = next(task for task in package_tasks.create_dependency_tasks(registry, package, run_config)
+                if task['basename'] == 'dep_releases')
+    releases_complete, (releases_path,) = task['uptodate'][1]
+    releases_path.parent.mkdir(parents=True)
+
+    _run(task)
+    assert json.loads(releases_path.read_text()) == {'1.0.0': package_tasks.UNKNOWN_RELEASE_TIME}
+    assert not releases_complete(releases_path)
+
+    registry.releases.return_value = {'1.0.0': 100}
+    _run(task)
+    assert releases_complete(releases_path)
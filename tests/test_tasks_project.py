@@ -1,6 +1,10 @@
+import json
 from pathlib import Path
 
+import pytest
+
 from elm_doc import elm_project
+from elm_doc.run_config import Validate
 from elm_doc.tasks import project as project_tasks
 
 
@@ -69,3 +73,61 @@ def test_sync_source_files_delete_file(
 
     project_tasks.actions.SyncSources(project, target_dir).execute()
     assert not (target_dir / 'Main.elm').exists()
+
+
+def test_elm_make_in_shards_merges_docs_json(tmpdir, fake_elm):
+    build_dir = tmpdir.ensure('build', dir=True)
+    modules = ['Main', 'Page.About', 'Page.Home', 'Zebra']
+    build_dir.join('elm.json').write(json.dumps({'exposed-modules': modules}))
+    for module in modules:
+        build_dir.join('src', *module.split('.')).new(ext='elm').write(
+            'module {} exposing (..)\n'.format(module), ensure=True)
+    output_path = Path(str(tmpdir.join('docs.json')))
+
+    action = project_tasks.actions.ElmMake(fake_elm, Path(str(build_dir)), output_path, shards=3)
+    assert action.execute() is None
+
+    assert [module['name'] for module in json.loads(output_path.read_text())] == modules
+    assert len(build_dir.join('shards').listdir(lambda path: path.check(dir=True))) == 3
+
+
+def test_sync_sources_stages_only_import_closure_of_included_modules(
+        tmpdir, elm_version, make_elm_project):
+    project_dir = make_elm_project(elm_version, tmpdir, sources={'src': []})
+    src_dir = project_dir.join('src')
+    src_dir.join('Main.elm').write('module Main exposing (..)\n\nimport Page.Home\n')
+    src_dir.join('Page', 'Home.elm').write('module Page.Home exposing (..)\n', ensure=True)
+    src_dir.join('Unrelated.elm').write('module Unrelated exposing (..)\n')
+    project = elm_project.from_path(Path(str(project_dir)))
+    config = elm_project.ProjectConfig(include_paths=[Path(str(src_dir.join('Main.elm')))])
+    run_config = Validate(None, Path(str(tmpdir.join('build'))))
+
+    task = next(project_tasks.create_main_project_tasks(None, project, config, run_config))
+    sync_sources = next(action for action in task['actions']
+                        if isinstance(action, project_tasks.actions.SyncSources))
+    sync_sources.execute()
+
+    build_src_dir = tmpdir.join('build', 'src')
+    assert build_src_dir.join('Main.elm').check()
+    assert build_src_dir.join('Page', 'Home.elm').check()
+    assert not build_src_dir.join('Unrelated.elm').check()
+    assert Path(str(src_dir.join('Page', 'Home.elm'))) in task['file_dep']
+
+
+def test_codeshift_strips_files_left_unstripped_by_an_interrupted_run(
+        tmpdir, elm_version, make_elm_project, mocker):
+    project_dir = make_elm_project(elm_version, tmpdir, sources={'src': ['PortModuleA.elm']})
+    project = elm_project.from_path(Path(str(project_dir)))
+    build_src_dir = Path(str(tmpdir.join('build', 'src')))
+    manifest_path = Path(str(tmpdir.join('build', 'codeshift')))
+
+    project_tasks.actions.SyncSources(project, build_src_dir).execute()
+    mocker.patch('elm_doc.elm_codeshift.strip_ports_from_files', side_effect=OSError('interrupted'))
+    with pytest.raises(OSError):
+        project_tasks.actions.run_elm_codeshift(build_src_dir, manifest_path)
+    mocker.stopall()
+
+    # nothing is copied again, so only codeshift can strip the ports now
+    project_tasks.actions.SyncSources(project, build_src_dir).execute()
+    project_tasks.actions.run_elm_codeshift(build_src_dir, manifest_path)
+    assert not (build_src_dir / 'PortModuleA.elm').read_text().startswith('port module')
@@ -0,0 +1,42 @@
+from pathlib import Path
+import os
+import stat
+
+from elm_doc.run_config import Build
+from elm_doc.tasks import catalog
+from elm_doc.tasks import spa_fallback
+
+
+def test_configs_are_scoped_to_mount_point():
+    configs = spa_fallback.render_configs('/docs/')
+
+    assert 'location /docs/ {' in configs['nginx.conf']
+    assert 'try_files $uri /docs/index.html;' in configs['nginx.conf']
+    assert 'RewriteRule ^ /docs/index.html [L]' in configs['.htaccess']
+    assert configs['_redirects'].split() == ['/docs/*', '/docs/index.html', '200']
+
+
+def test_configs_at_root():
+    configs = spa_fallback.render_configs('')
+
+    assert 'location / {' in configs['nginx.conf']
+    assert configs['_redirects'].split() == ['/*', '/index.html', '200']
+
+
+def test_catalog_writes_configs_instead_of_help_pages(tmpdir, mocker):
+    mocker.patch('elm_doc.utils._umask', 0o022)
+    output_path = Path(str(tmpdir.join('docs')))
+    run_config = Build(None, None, output_path, '/docs', spa_fallback=True)
+
+    tasks = list(catalog.create_catalog_tasks([], run_config))
+
+    assert [task['basename'] for task in tasks] \
+        == ['index', 'search_json', 'server_config', 'server_config', 'server_config']
+    for task in tasks:
+        if task['basename'] == 'server_config':
+            action, args = task['actions'][0]
+            action(*args)
+    assert sorted(path.name for path in output_path.iterdir()) == ['.htaccess', '_redirects']
+    assert sorted(path.name for path in output_path.parent.iterdir()) == ['docs', 'docs.nginx.conf']
+    for path in [output_path / '.htaccess', output_path / '_redirects', output_path.parent / 'docs.nginx.conf']:
+        assert stat.S_IMODE(os.stat(str(path)).st_mode) == 0o644
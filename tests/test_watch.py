@@ -0,0 +1,69 @@
+from pathlib import Path
+import sys
+import time
+
+import pytest
+
+from elm_doc import elm_project
+from elm_doc import watch
+
+
+def _make_project(tmpdir, elm_version, make_elm_project):
+    project_dir = make_elm_project(elm_version, tmpdir, sources={'src': ['Main.elm']})
+    return elm_project.from_path(Path(str(project_dir)))
+
+
+def _wait(watcher, until_seen: Path):
+    changed = set()
+    deadline = time.monotonic() + 5
+    while until_seen not in changed and time.monotonic() < deadline:
+        changed |= watcher.wait(timeout=0.2)
+    return changed
+
+
+def test_polling_watcher_reports_modified_and_created_modules(tmpdir, elm_version, make_elm_project):
+    project = _make_project(tmpdir, elm_version, make_elm_project)
+    watcher = watch.PollingWatcher(project, interval=0.01)
+    assert watcher.wait(timeout=0) == set()
+
+    main = project.path / 'src' / 'Main.elm'
+    main.write_text(main.read_text() + '\n-- edited, and now longer\n')
+    page = project.path / 'src' / 'Page.elm'
+    page.write_text('module Page exposing (..)')
+    (project.path / 'src' / 'notes.txt').write_text('ignored')
+    assert watcher.wait(timeout=1) == {main, page}
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='inotify is Linux only')
+def test_inotify_watcher_picks_up_new_directories(tmpdir, elm_version, make_elm_project):
+    project = _make_project(tmpdir, elm_version, make_elm_project)
+    watcher = watch.InotifyWatcher(project)
+    try:
+        page_dir = project.path / 'src' / 'Page'
+        page_dir.mkdir()
+        home = page_dir / 'Home.elm'
+        home.write_text('module Page.Home exposing (..)')
+        assert home in _wait(watcher, home)
+
+        home.write_text('module Page.Home exposing (view)')
+        assert home in _wait(watcher, home)
+
+        project.json_path.write_text(project.json_path.read_text())
+        assert project.json_path in _wait(watcher, project.json_path)
+    finally:
+        watcher.close()
+
+
+class FakeWatcher:
+    def __init__(self, batches):
+        self.batches = list(batches)
+
+    def wait(self, timeout=None):
+        return self.batches.pop(0) if self.batches else set()
+
+
+def test_iter_changes_coalesces_bursts():
+    watcher = FakeWatcher([{Path('A.elm')}, {Path('B.elm')}, set(), {Path('C.elm')}, set()])
+    changes = watch.iter_changes(watcher, quiet_period=0)
+    assert next(changes) == {Path('A.elm'), Path('B.elm')}
+    assert next(changes) == {Path('C.elm')}